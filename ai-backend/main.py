@@ -5,70 +5,135 @@ Complete free AI services implementation
 """
 
 import os
+import json
 import asyncio
 import logging
 from datetime import datetime
-from typing import Dict, Any, Optional
+from typing import Dict, Any, AsyncIterator, Callable, List, Optional
 from contextlib import asynccontextmanager
 
-from fastapi import FastAPI, HTTPException, Depends, BackgroundTasks
+from fastapi import FastAPI, HTTPException, Depends
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, Response, StreamingResponse
 from pydantic import BaseModel, Field
 import uvicorn
 
 # AI Service Imports
 from services.ai_researchers import AIResearcherService
 from services.ai_planners import AIPlannerService
+from services.ai_models import AIModelManager
 from services.workflow_engine import WorkflowEngine
 from services.model_router import ModelRouter
+from services.data_sources import DataSourceManager
+from services.dispatcher import RequestDispatcher
 from utils.auth import verify_token
-from utils.rate_limiter import RateLimiter
-from utils.cache import ResponseCache
+from utils.rate_limiter import create_rate_limiter, RateLimitExceeded
+from utils.cache import create_response_cache
 from utils.monitoring import ServiceMonitor
 
+try:
+    from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
+except ImportError:
+    generate_latest = None
+from utils.http_client import HTTPClientPool
+from utils.singleflight import SingleFlight
+from utils.task_queue import BackgroundTaskQueue
+from utils.job_queue import JobQueue, JobQueueFull, create_job_store
+from utils.admission import ProviderOverloaded
+
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 # Global services
+http_client = None
+data_sources = None
+ai_models = None
 ai_researcher = None
 ai_planner = None
 workflow_engine = None
 model_router = None
 rate_limiter = None
 response_cache = None
+request_coalescer = None
 monitor = None
+metrics_registry = None
+background_queue = None
+job_queue = None
+dispatcher = None
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """Initialize services on startup"""
-    global ai_researcher, ai_planner, workflow_engine, model_router, rate_limiter, response_cache, monitor
+    global http_client, data_sources, ai_models, ai_researcher, ai_planner, workflow_engine, model_router, rate_limiter, response_cache, request_coalescer, monitor, metrics_registry, background_queue, dispatcher, job_queue
     
     logger.info("🚀 Starting Automaatte AI Services...")
     
     try:
+        # Shared outbound HTTP connection pool
+        http_client = HTTPClientPool()
+        await http_client.start()
+        
         # Initialize core services
-        model_router = ModelRouter()
+        model_router = ModelRouter(http_client)
         await model_router.initialize()
+        # Load pinned Ollama models without holding up startup
+        model_router.start_warmup()
         
-        ai_researcher = AIResearcherService(model_router)
-        ai_planner = AIPlannerService(model_router)
-        workflow_engine = WorkflowEngine()
+        data_sources = DataSourceManager(http_client)
+        # One parse layer so research and planning on the same text parse it once
+        ai_models = AIModelManager(model_router)
+        ai_researcher = AIResearcherService(model_router, data_sources, ai_models)
+        ai_planner = AIPlannerService(model_router, data_sources, ai_models)
+        workflow_engine = WorkflowEngine(ai_researcher, ai_planner, model_router)
         
         # Initialize utilities
-        rate_limiter = RateLimiter()
-        response_cache = ResponseCache()
+        rate_limiter = create_rate_limiter()
+        response_cache = create_response_cache()
+        request_coalescer = SingleFlight()
         monitor = ServiceMonitor()
+        metrics_registry = monitor.create_registry()
+        
+        # Post-response cache and metrics writes
+        background_queue = BackgroundTaskQueue()
+        await background_queue.start()
+        
+        dispatcher = RequestDispatcher(
+            select_service,
+            rate_limiter,
+            response_cache,
+            request_coalescer,
+            monitor,
+            background_queue
+        )
+        
+        # Async jobs for requests too slow to hold a connection open
+        job_queue = JobQueue(create_job_store(), run_job)
+        await job_queue.start()
+        if metrics_registry is not None:
+            metrics_registry.register(job_queue)
         
         logger.info("✅ All services initialized successfully")
         yield
-        
+    
     except Exception as e:
         logger.error(f"❌ Failed to initialize services: {e}")
         raise
     finally:
         logger.info("🛑 Shutting down services...")
+        if job_queue:
+            await job_queue.close()
+        if background_queue:
+            await background_queue.close()
+        if model_router:
+            await model_router.close()
+        if response_cache:
+            await response_cache.close()
+        if rate_limiter:
+            await rate_limiter.close()
+        if http_client:
+            await http_client.close()
 
 # Create FastAPI app
 app = FastAPI(
@@ -103,11 +168,19 @@ class ServiceResponse(BaseModel):
     service_type: str
     timestamp: str
     cached: bool = False
+    metadata: Optional[Dict[str, Any]] = None
+
+class BatchRequest(BaseModel):
+    requests: List[ServiceRequest] = Field(..., min_length=1, description="Requests to process")
+    concurrency: Optional[int] = Field(None, ge=1, description="Maximum items processed at once")
+
+class FalseHitReport(BaseModel):
+    feedback_token: str = Field(..., description="metadata.semantic_cache[].feedback_token of the response that was served the entry")
 
-# Health check endpoint
+# Health check endpoints
 @app.get("/health")
 async def health_check():
-    """Health check endpoint"""
+    """Health check endpoint, served from cached provider state"""
     try:
         # Check all services
         services_status = {
@@ -118,100 +191,175 @@ async def health_check():
         }
         
         all_healthy = all(services_status.values())
+        snapshot = model_router.get_health_snapshot() if model_router else {}
         
         return {
             "status": "healthy" if all_healthy else "degraded",
             "services": services_status,
+            "providers": snapshot.get("providers", {}),
+            "supplementary_providers": snapshot.get("supplementary_providers", {}),
             "timestamp": datetime.now().isoformat()
         }
     except Exception as e:
         logger.error(f"Health check failed: {e}")
         raise HTTPException(status_code=503, detail="Service unavailable")
 
+@app.get("/health/live")
+async def liveness_check():
+    """Liveness probe: the process is up and serving requests"""
+    return {"status": "alive", "timestamp": datetime.now().isoformat()}
+
+@app.get("/health/ready")
+async def readiness_check():
+    """Readiness probe: services are initialized and a model provider is reachable"""
+    initialized = all(
+        service is not None
+        for service in (ai_researcher, ai_planner, workflow_engine, model_router)
+    )
+    snapshot = model_router.get_health_snapshot() if model_router else {"available": False, "providers": {}}
+    ready = initialized and snapshot["available"]
+    
+    return JSONResponse(
+        status_code=200 if ready else 503,
+        content={
+            "status": "ready" if ready else "not_ready",
+            "initialized": initialized,
+            "providers": snapshot["providers"],
+            "supplementary_providers": snapshot.get("supplementary_providers", {}),
+            "timestamp": datetime.now().isoformat()
+        }
+    )
+
+def select_service(service_type: str):
+    """Pick the researcher, planner or workflow service for a service type"""
+    if service_type.endswith("-research") or service_type.endswith("-researching"):
+        return ai_researcher
+    elif service_type.endswith("-planning") or service_type.endswith("-plan"):
+        return ai_planner
+    else:
+        # Use workflow engine for complex requests
+        return workflow_engine
+
+def format_sse(event: str, data: Any) -> str:
+    """Format a Server-Sent Events message"""
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+def build_service_response(request: ServiceRequest, result: Dict[str, Any]) -> Dict[str, Any]:
+    """Shape and encode a dispatcher result as an API response body"""
+    response = ServiceResponse(
+        success=result.get("success", False),
+        data=result.get("data"),
+        error=result.get("error"),
+        processing_time=result["processing_time"],
+        service_type=request.service_type,
+        timestamp=datetime.now().isoformat(),
+        cached=result.get("cached", False),
+        metadata=result.get("metadata")
+    )
+    return jsonable_encoder(response)
+
+def service_response_renderer(request: ServiceRequest) -> Callable[[Dict[str, Any]], JSONResponse]:
+    """Build a renderer that shapes and encodes a dispatcher result as an API response"""
+    def render(result: Dict[str, Any]) -> JSONResponse:
+        return JSONResponse(content=build_service_response(request, result))
+    return render
+
+async def format_ndjson(records: AsyncIterator[Dict[str, Any]]) -> AsyncIterator[str]:
+    """Encode records as newline-delimited JSON"""
+    async for record in records:
+        yield json.dumps(record, default=str) + "\n"
+
 # Main AI processing endpoint
 @app.post("/api/ai/process", response_model=ServiceResponse)
 async def process_ai_request(
     request: ServiceRequest,
-    background_tasks: BackgroundTasks,
     user_token: str = Depends(verify_token)
 ):
     """Main AI processing endpoint"""
-    start_time = datetime.now()
+    return await dispatcher.dispatch(request, service_response_renderer(request))
+
+# Streaming AI processing endpoint
+@app.post("/api/ai/stream")
+async def stream_ai_request(
+    request: ServiceRequest,
+    user_token: str = Depends(verify_token)
+):
+    """Stream sections and generated tokens as Server-Sent Events"""
+    events = await dispatcher.dispatch_stream(request, format_sse)
     
-    try:
-        # Rate limiting
-        if not await rate_limiter.check_rate_limit(request.user_id or "anonymous"):
-            raise HTTPException(status_code=429, detail="Rate limit exceeded")
-        
-        # Check cache first
-        cache_key = f"{request.service_type}:{hash(request.input_data)}"
-        cached_response = await response_cache.get(cache_key)
-        
-        if cached_response:
-            logger.info(f"Cache hit for {request.service_type}")
-            return ServiceResponse(
-                success=True,
-                data=cached_response,
-                processing_time=0.1,
-                service_type=request.service_type,
-                timestamp=datetime.now().isoformat(),
-                cached=True
-            )
-        
-        # Route to appropriate service
-        if request.service_type.endswith("-research") or request.service_type.endswith("-researching"):
-            result = await ai_researcher.process_request(request)
-        elif request.service_type.endswith("-planning") or request.service_type.endswith("-plan"):
-            result = await ai_planner.process_request(request)
-        else:
-            # Use workflow engine for complex requests
-            result = await workflow_engine.process_request(request)
-        
-        processing_time = (datetime.now() - start_time).total_seconds()
-        
-        # Cache successful responses
-        if result.get("success"):
-            background_tasks.add_task(
-                response_cache.set,
-                cache_key,
-                result,
-                ttl=3600  # 1 hour cache
-            )
-        
-        # Log usage
-        background_tasks.add_task(
-            monitor.log_usage,
-            request.user_id,
-            request.service_type,
-            processing_time,
-            result.get("success", False)
-        )
-        
-        return ServiceResponse(
-            success=result.get("success", False),
-            data=result.get("data"),
-            error=result.get("error"),
-            processing_time=processing_time,
-            service_type=request.service_type,
-            timestamp=datetime.now().isoformat()
-        )
-        
-    except HTTPException:
-        raise
-    except Exception as e:
-        logger.error(f"Error processing request: {e}")
-        processing_time = (datetime.now() - start_time).total_seconds()
-        
-        return ServiceResponse(
-            success=False,
-            error=str(e),
-            processing_time=processing_time,
-            service_type=request.service_type,
-            timestamp=datetime.now().isoformat()
+    return StreamingResponse(
+        events,
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+# Batch AI processing endpoint
+@app.post("/api/ai/batch")
+async def batch_ai_request(
+    batch: BatchRequest,
+    user_token: str = Depends(verify_token)
+):
+    """Process many requests, streaming each result as an NDJSON line (with its index) as it finishes"""
+    if len(batch.requests) > dispatcher.batch_max_items:
+        raise HTTPException(
+            status_code=413,
+            detail=f"Batch exceeds {dispatcher.batch_max_items} requests"
         )
+    
+    records = dispatcher.dispatch_batch(batch.requests, build_service_response, batch.concurrency)
+    
+    return StreamingResponse(
+        format_ndjson(records),
+        media_type="application/x-ndjson",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+# Async job endpoints
+async def run_job(payload: Dict[str, Any]) -> Dict[str, Any]:
+    """Job handler: dispatch a queued request (already rate limited at submission)"""
+    request = ServiceRequest(**payload)
+    return await dispatcher.dispatch(
+        request,
+        lambda result: build_service_response(request, result),
+        check_limits=False
+    )
+
+def job_response(job: Dict[str, Any]) -> Dict[str, Any]:
+    """Public view of a job record"""
+    return {
+        key: job.get(key)
+        for key in ("job_id", "status", "created_at", "started_at", "finished_at", "attempts", "result", "error")
+    }
+
+@app.post("/api/jobs", status_code=202)
+async def submit_job(
+    request: ServiceRequest,
+    user_token: str = Depends(verify_token)
+):
+    """Queue a request and return its job id immediately"""
+    await dispatcher.check_rate_limit(request)
+    job = await job_queue.submit(request.model_dump())
+    
+    return JSONResponse(
+        status_code=202,
+        content=job_response(job),
+        headers={"Location": f"/api/jobs/{job['job_id']}"}
+    )
+
+@app.get("/api/jobs/{job_id}")
+async def get_job(
+    job_id: str,
+    wait: float = 0,
+    user_token: str = Depends(verify_token)
+):
+    """Get a job; with wait > 0, long-poll up to that many seconds for it to finish"""
+    job = await job_queue.wait(job_id, wait) if wait > 0 else await job_queue.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Unknown or expired job")
+    return job_response(job)
 
 # AI Researchers endpoints
-@app.post("/api/researchers/{service_type}")
+@app.post("/api/researchers/{service_type}", response_model=ServiceResponse)
 async def research_service(
     service_type: str,
     request: ServiceRequest,
@@ -219,10 +367,10 @@ async def research_service(
 ):
     """Dedicated AI researchers endpoint"""
     request.service_type = f"{service_type}-research"
-    return await process_ai_request(request, BackgroundTasks(), user_token)
+    return await dispatcher.dispatch(request, service_response_renderer(request))
 
 # AI Planners endpoints  
-@app.post("/api/planners/{service_type}")
+@app.post("/api/planners/{service_type}", response_model=ServiceResponse)
 async def planning_service(
     service_type: str,
     request: ServiceRequest,
@@ -230,7 +378,29 @@ async def planning_service(
 ):
     """Dedicated AI planners endpoint"""
     request.service_type = f"{service_type}-planning"
-    return await process_ai_request(request, BackgroundTasks(), user_token)
+    return await dispatcher.dispatch(request, service_response_renderer(request))
+
+# Semantic cache feedback endpoint
+@app.post("/api/cache/semantic/{entry_id}/false-hit")
+async def report_semantic_false_hit(
+    entry_id: int,
+    report: FalseHitReport,
+    user_token: str = Depends(verify_token)
+):
+    """Report that a semantic cache hit (metadata.semantic_cache[].entry_id) did not fit the request"""
+    # Only the caller who was served the entry holds its feedback token
+    removed = model_router.semantic_cache.report_false_hit(entry_id, report.feedback_token)
+    if not removed:
+        raise HTTPException(status_code=404, detail="Unknown or expired semantic cache entry or feedback token")
+    return {"removed": True, "entry_id": entry_id}
+
+# Prometheus metrics endpoint
+@app.get("/metrics")
+async def metrics():
+    """Export request counters and latency histograms in Prometheus text format"""
+    if metrics_registry is None or generate_latest is None:
+        raise HTTPException(status_code=503, detail="Metrics unavailable: prometheus_client not installed")
+    return Response(content=generate_latest(metrics_registry), media_type=CONTENT_TYPE_LATEST)
 
 # Service status endpoint
 @app.get("/api/status")
@@ -245,14 +415,50 @@ async def service_status():
                 "model_router": await model_router.get_status() if model_router else "offline",
             },
             "models": await model_router.get_available_models() if model_router else [],
+            "http_pool": http_client.get_stats() if http_client else {},
+            "cache": response_cache.get_stats() if response_cache else {},
+            "parsing": ai_models.get_parse_stats() if ai_models else {},
+            "coalescing": request_coalescer.get_stats() if request_coalescer else {},
+            "background_queue": background_queue.get_stats() if background_queue else {},
+            "jobs": job_queue.get_stats() if job_queue else {},
+            "rate_limiter": rate_limiter.get_stats() if rate_limiter else {},
             "uptime": monitor.get_uptime() if monitor else 0,
-            "total_requests": monitor.get_total_requests() if monitor else 0
+            "total_requests": monitor.get_total_requests() if monitor else 0,
+            "latency": monitor.get_latency_stats() if monitor else {}
         }
     except Exception as e:
         logger.error(f"Status check failed: {e}")
         raise HTTPException(status_code=500, detail="Failed to get status")
 
 # Error handlers
+def retry_after_headers(retry_after: Optional[float]) -> Optional[Dict[str, str]]:
+    """Retry-After header for a shed or rate-limited request"""
+    return {"Retry-After": str(max(1, round(retry_after)))} if retry_after else None
+
+@app.exception_handler(RateLimitExceeded)
+async def rate_limit_exception_handler(request, exc: RateLimitExceeded):
+    return JSONResponse(
+        status_code=429,
+        content={"detail": "Rate limit exceeded"},
+        headers=retry_after_headers(exc.retry_after)
+    )
+
+@app.exception_handler(ProviderOverloaded)
+async def provider_overloaded_exception_handler(request, exc: ProviderOverloaded):
+    return JSONResponse(
+        status_code=503,
+        content={"detail": str(exc)},
+        headers=retry_after_headers(exc.retry_after)
+    )
+
+@app.exception_handler(JobQueueFull)
+async def job_queue_full_exception_handler(request, exc: JobQueueFull):
+    return JSONResponse(
+        status_code=503,
+        content={"detail": str(exc)},
+        headers=retry_after_headers(exc.retry_after)
+    )
+
 @app.exception_handler(Exception)
 async def global_exception_handler(request, exc):
     logger.error(f"Global exception: {exc}")
@@ -3,16 +3,21 @@ AI Planners Service
 Implements all 6 planning services using free AI models
 """
 
+import os
 import asyncio
 import logging
-from typing import Dict, Any, List
+from typing import Dict, Any, List, Optional
 from datetime import datetime, timedelta
-import json
 
 try:
     from .base_service import BaseAIService
     from .data_sources import DataSourceManager
     from .ai_models import AIModelManager
+    from .streaming import emit_section
+    from .prompt_builder import PromptBuilder
+    from utils.admission import ProviderOverloaded
+    from utils.monitoring import annotate
+    from .step_graph import Step, StepGraph, StepGraphResult
 except ImportError:
     # Fallback imports for development
     import sys
@@ -21,16 +26,29 @@ except ImportError:
     from base_service import BaseAIService
     from data_sources import DataSourceManager
     from ai_models import AIModelManager
+    from streaming import emit_section
+    from prompt_builder import PromptBuilder
+    sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+    from utils.admission import ProviderOverloaded
+    from utils.monitoring import annotate
+    from step_graph import Step, StepGraph, StepGraphResult
 
 logger = logging.getLogger(__name__)
 
 class AIPlannerService(BaseAIService):
     """AI Planners service implementation"""
     
-    def __init__(self, model_router):
+    def __init__(
+        self,
+        model_router,
+        data_sources: Optional[DataSourceManager] = None,
+        ai_models: Optional[AIModelManager] = None
+    ):
         super().__init__(model_router)
-        self.data_sources = DataSourceManager()
-        self.ai_models = AIModelManager(model_router)
+        self.data_sources = data_sources or DataSourceManager(getattr(model_router, "http_client", None))
+        self.ai_models = ai_models or AIModelManager(model_router)
+        self.prompts = PromptBuilder()
+        self.step_timeout = float(os.getenv("PLANNER_STEP_TIMEOUT", 10))
         
         # Planning service mapping
         self.planning_services = {
@@ -73,7 +91,9 @@ class AIPlannerService(BaseAIService):
                 "data": result,
                 "service_type": service_type
             }
-            
+        
+        except ProviderOverloaded:
+            raise
         except Exception as e:
             logger.error(f"Planning request failed: {e}")
             return {
@@ -81,6 +101,19 @@ class AIPlannerService(BaseAIService):
                 "error": str(e)
             }
     
+    async def run_plan_steps(self, steps: List[Step]) -> StepGraphResult:
+        """Run planning steps concurrently, streaming each finished section"""
+        graph = StepGraph(steps, default_timeout=self.step_timeout)
+        
+        def stream_section(step: Step, value: Any) -> None:
+            if step.emit:
+                emit_section(step.name, value)
+        
+        outcome = await graph.run(on_step_complete=stream_section)
+        # Timings and step errors belong to this request's trace, not the cached plan payload
+        annotate("steps", outcome.get_report())
+        return outcome
+    
     async def vacation_planning(self, input_data: str, user_tier: str, options: Dict) -> Dict[str, Any]:
         """Create detailed vacation plans and itineraries"""
         try:
@@ -95,60 +128,71 @@ class AIPlannerService(BaseAIService):
             # Get research data if available
             research_data = options.get("research_data", {})
             
-            # Create detailed itinerary
-            itinerary = await self.create_vacation_itinerary(
-                destination, duration, interests, budget, travelers
-            )
-            
-            # Generate budget plan
-            budget_plan = await self.create_budget_plan(budget, duration, travelers, destination)
-            
-            # Create booking timeline
-            booking_timeline = await self.create_booking_timeline(destination, duration)
-            
-            # Generate packing list
-            packing_list = await self.create_packing_list(destination, duration, interests)
-            
-            # Create emergency plan
-            emergency_plan = await self.create_emergency_plan(destination)
-            
-            planning_prompt = f"""
-            Create a comprehensive vacation plan for:
-            
-            Destination: {destination}
-            Duration: {duration}
-            Budget: {budget}
-            Travelers: {travelers}
-            Interests: {interests}
-            
-            Itinerary: {json.dumps(itinerary, indent=2)}
-            Budget Plan: {json.dumps(budget_plan, indent=2)}
-            Booking Timeline: {json.dumps(booking_timeline, indent=2)}
-            
-            Provide a detailed vacation plan including:
-            1. Day-by-day itinerary with activities and timing
-            2. Complete budget breakdown with cost estimates
-            3. Booking timeline and reservation strategy
-            4. Transportation and accommodation plans
-            5. Emergency contacts and backup plans
-            
-            Format as a comprehensive vacation plan.
-            """
-            
-            plan_analysis = await self.ai_models.generate_plan(planning_prompt, user_tier)
+            async def write_plan(results: Dict[str, Any]) -> str:
+                planning_prompt = self.prompts.build(
+                    "vacation-planning",
+                    """
+                    Create a comprehensive vacation plan for the request below.
+                    Provide a detailed vacation plan including:
+                    1. Day-by-day itinerary with activities and timing
+                    2. Complete budget breakdown with cost estimates
+                    3. Booking timeline and reservation strategy
+                    4. Transportation and accommodation plans
+                    5. Emergency contacts and backup plans
+                    Format as a comprehensive vacation plan.
+                    """,
+                    fields={
+                        "Destination": destination,
+                        "Duration": duration,
+                        "Budget": budget,
+                        "Travelers": travelers,
+                        "Interests": interests
+                    },
+                    sections={
+                        "Itinerary": results['detailed_itinerary'],
+                        "Budget Plan": results['budget_breakdown'],
+                        "Booking Timeline": results['booking_timeline'],
+                        "Research Weather": research_data.get('weather'),
+                        "Research Costs": research_data.get('costs'),
+                        "Research Attractions": research_data.get('attractions')
+                    }
+                )
+                return await self.ai_models.generate_plan(planning_prompt, user_tier)
+            
+            # Independent steps run concurrently; the plan waits only on what its prompt uses
+            outcome = await self.run_plan_steps([
+                Step("detailed_itinerary", lambda r: self.create_vacation_itinerary(
+                    destination, duration, interests, budget, travelers
+                )),
+                Step("budget_breakdown", lambda r: self.create_budget_plan(budget, duration, travelers, destination)),
+                Step("booking_timeline", lambda r: self.create_booking_timeline(destination, duration)),
+                Step("packing_list", lambda r: self.create_packing_list(destination, duration, interests)),
+                Step("emergency_plan", lambda r: self.create_emergency_plan(destination)),
+                Step("travel_documents", lambda r: self.create_travel_documents_checklist(destination)),
+                Step("local_contacts", lambda r: self.get_local_emergency_contacts(destination)),
+                Step(
+                    "vacation_plan",
+                    write_plan,
+                    deps=("detailed_itinerary", "budget_breakdown", "booking_timeline"),
+                    timeout=0,
+                    required=True,
+                    emit=False
+                ),
+            ])
+            results = outcome.results
             
             return {
-                "vacation_plan": plan_analysis,
-                "detailed_itinerary": itinerary,
-                "budget_breakdown": budget_plan,
-                "booking_timeline": booking_timeline,
-                "packing_list": packing_list,
-                "emergency_plan": emergency_plan,
-                "travel_documents": await self.create_travel_documents_checklist(destination),
-                "local_contacts": await self.get_local_emergency_contacts(destination),
+                "vacation_plan": results["vacation_plan"],
+                "detailed_itinerary": results["detailed_itinerary"],
+                "budget_breakdown": results["budget_breakdown"],
+                "booking_timeline": results["booking_timeline"],
+                "packing_list": results["packing_list"],
+                "emergency_plan": results["emergency_plan"],
+                "travel_documents": results["travel_documents"],
+                "local_contacts": results["local_contacts"],
                 "plan_timestamp": datetime.now().isoformat()
             }
-            
+        
         except Exception as e:
             logger.error(f"Vacation planning failed: {e}")
             raise
@@ -163,61 +207,72 @@ class AIPlannerService(BaseAIService):
             timeline = parsed_input.get("timeline", "")
             budget = parsed_input.get("budget", "")
             
-            # Create education pathway
-            education_pathway = await self.create_education_pathway(
-                field, current_level, target_level, timeline
-            )
-            
-            # Generate application timeline
-            application_timeline = await self.create_application_timeline(target_level, timeline)
-            
-            # Create skill development plan
-            skill_plan = await self.create_skill_development_plan(field, current_level, target_level)
-            
-            # Generate financial plan
-            financial_plan = await self.create_education_financial_plan(budget, timeline, target_level)
-            
-            # Create career preparation plan
-            career_prep = await self.create_career_preparation_plan(field, target_level)
-            
-            planning_prompt = f"""
-            Create a comprehensive education plan for:
-            
-            Field: {field}
-            Current Level: {current_level}
-            Target Level: {target_level}
-            Timeline: {timeline}
-            Budget: {budget}
-            
-            Education Pathway: {json.dumps(education_pathway, indent=2)}
-            Application Timeline: {json.dumps(application_timeline, indent=2)}
-            Skill Development: {json.dumps(skill_plan, indent=2)}
-            Financial Plan: {json.dumps(financial_plan, indent=2)}
-            
-            Provide a detailed education plan including:
-            1. Step-by-step education pathway with milestones
-            2. Application strategy and timeline
-            3. Skill development and learning plan
-            4. Financial planning and funding options
-            5. Career preparation and networking strategy
-            
-            Format as a comprehensive education plan.
-            """
-            
-            plan_analysis = await self.ai_models.generate_plan(planning_prompt, user_tier)
+            async def write_plan(results: Dict[str, Any]) -> str:
+                planning_prompt = self.prompts.build(
+                    "education-planning",
+                    """
+                    Create a comprehensive education plan for the request below.
+                    Provide a detailed education plan including:
+                    1. Step-by-step education pathway with milestones
+                    2. Application strategy and timeline
+                    3. Skill development and learning plan
+                    4. Financial planning and funding options
+                    5. Career preparation and networking strategy
+                    Format as a comprehensive education plan.
+                    """,
+                    fields={
+                        "Field": field,
+                        "Current Level": current_level,
+                        "Target Level": target_level,
+                        "Timeline": timeline,
+                        "Budget": budget
+                    },
+                    sections={
+                        "Education Pathway": results['pathway_details'],
+                        "Application Timeline": results['application_timeline'],
+                        "Skill Development": results['skill_development'],
+                        "Financial Plan": results['financial_plan']
+                    }
+                )
+                return await self.ai_models.generate_plan(planning_prompt, user_tier)
+            
+            outcome = await self.run_plan_steps([
+                Step("pathway_details", lambda r: self.create_education_pathway(
+                    field, current_level, target_level, timeline
+                )),
+                Step("application_timeline", lambda r: self.create_application_timeline(target_level, timeline)),
+                Step("skill_development", lambda r: self.create_skill_development_plan(field, current_level, target_level)),
+                Step("financial_plan", lambda r: self.create_education_financial_plan(budget, timeline, target_level)),
+                Step("career_preparation", lambda r: self.create_career_preparation_plan(field, target_level)),
+                Step(
+                    "milestone_tracking",
+                    lambda r: self.create_milestone_tracking(r["pathway_details"]),
+                    deps=("pathway_details",)
+                ),
+                Step("resource_list", lambda r: self.create_education_resources(field, target_level)),
+                Step(
+                    "education_plan",
+                    write_plan,
+                    deps=("pathway_details", "application_timeline", "skill_development", "financial_plan"),
+                    timeout=0,
+                    required=True,
+                    emit=False
+                ),
+            ])
+            results = outcome.results
             
             return {
-                "education_plan": plan_analysis,
-                "pathway_details": education_pathway,
-                "application_timeline": application_timeline,
-                "skill_development": skill_plan,
-                "financial_plan": financial_plan,
-                "career_preparation": career_prep,
-                "milestone_tracking": await self.create_milestone_tracking(education_pathway),
-                "resource_list": await self.create_education_resources(field, target_level),
+                "education_plan": results["education_plan"],
+                "pathway_details": results["pathway_details"],
+                "application_timeline": results["application_timeline"],
+                "skill_development": results["skill_development"],
+                "financial_plan": results["financial_plan"],
+                "career_preparation": results["career_preparation"],
+                "milestone_tracking": results["milestone_tracking"],
+                "resource_list": results["resource_list"],
                 "plan_timestamp": datetime.now().isoformat()
             }
-            
+        
         except Exception as e:
             logger.error(f"Education planning failed: {e}")
             raise
@@ -231,55 +286,64 @@ class AIPlannerService(BaseAIService):
             family_size = parsed_input.get("family_size", 1)
             risk_factors = parsed_input.get("risk_factors", [])
             
-            # Create coverage strategy
-            coverage_strategy = await self.create_coverage_strategy(
-                coverage_needs, family_size, risk_factors, budget
-            )
-            
-            # Generate premium optimization plan
-            premium_plan = await self.create_premium_optimization_plan(coverage_needs, budget)
-            
-            # Create claim strategy
-            claim_strategy = await self.create_claim_strategy(coverage_needs)
-            
-            # Generate review schedule
-            review_schedule = await self.create_insurance_review_schedule()
-            
-            planning_prompt = f"""
-            Create a comprehensive insurance plan for:
-            
-            Coverage Needs: {coverage_needs}
-            Budget: {budget}
-            Family Size: {family_size}
-            Risk Factors: {risk_factors}
-            
-            Coverage Strategy: {json.dumps(coverage_strategy, indent=2)}
-            Premium Plan: {json.dumps(premium_plan, indent=2)}
-            Claim Strategy: {json.dumps(claim_strategy, indent=2)}
-            
-            Provide a detailed insurance plan including:
-            1. Comprehensive coverage strategy and policy selection
-            2. Premium optimization and cost management
-            3. Claim procedures and documentation requirements
-            4. Risk management and prevention strategies
-            5. Regular review and adjustment schedule
-            
-            Format as a comprehensive insurance plan.
-            """
-            
-            plan_analysis = await self.ai_models.generate_plan(planning_prompt, user_tier)
+            async def write_plan(results: Dict[str, Any]) -> str:
+                planning_prompt = self.prompts.build(
+                    "insurance-planning",
+                    """
+                    Create a comprehensive insurance plan for the request below.
+                    Provide a detailed insurance plan including:
+                    1. Comprehensive coverage strategy and policy selection
+                    2. Premium optimization and cost management
+                    3. Claim procedures and documentation requirements
+                    4. Risk management and prevention strategies
+                    5. Regular review and adjustment schedule
+                    Format as a comprehensive insurance plan.
+                    """,
+                    fields={
+                        "Coverage Needs": coverage_needs,
+                        "Budget": budget,
+                        "Family Size": family_size,
+                        "Risk Factors": risk_factors
+                    },
+                    sections={
+                        "Coverage Strategy": results['coverage_strategy'],
+                        "Premium Plan": results['premium_optimization'],
+                        "Claim Strategy": results['claim_procedures']
+                    }
+                )
+                return await self.ai_models.generate_plan(planning_prompt, user_tier)
+            
+            outcome = await self.run_plan_steps([
+                Step("coverage_strategy", lambda r: self.create_coverage_strategy(
+                    coverage_needs, family_size, risk_factors, budget
+                )),
+                Step("premium_optimization", lambda r: self.create_premium_optimization_plan(coverage_needs, budget)),
+                Step("claim_procedures", lambda r: self.create_claim_strategy(coverage_needs)),
+                Step("review_schedule", lambda r: self.create_insurance_review_schedule()),
+                Step("risk_management", lambda r: self.create_risk_management_plan(risk_factors)),
+                Step("emergency_procedures", lambda r: self.create_insurance_emergency_procedures()),
+                Step(
+                    "insurance_plan",
+                    write_plan,
+                    deps=("coverage_strategy", "premium_optimization", "claim_procedures"),
+                    timeout=0,
+                    required=True,
+                    emit=False
+                ),
+            ])
+            results = outcome.results
             
             return {
-                "insurance_plan": plan_analysis,
-                "coverage_strategy": coverage_strategy,
-                "premium_optimization": premium_plan,
-                "claim_procedures": claim_strategy,
-                "review_schedule": review_schedule,
-                "risk_management": await self.create_risk_management_plan(risk_factors),
-                "emergency_procedures": await self.create_insurance_emergency_procedures(),
+                "insurance_plan": results["insurance_plan"],
+                "coverage_strategy": results["coverage_strategy"],
+                "premium_optimization": results["premium_optimization"],
+                "claim_procedures": results["claim_procedures"],
+                "review_schedule": results["review_schedule"],
+                "risk_management": results["risk_management"],
+                "emergency_procedures": results["emergency_procedures"],
                 "plan_timestamp": datetime.now().isoformat()
             }
-            
+        
         except Exception as e:
             logger.error(f"Insurance planning failed: {e}")
             raise
@@ -294,58 +358,71 @@ class AIPlannerService(BaseAIService):
             amount = parsed_input.get("amount", "")
             current_portfolio = parsed_input.get("current_portfolio", {})
             
-            # Create investment strategy
-            investment_strategy = await self.create_investment_strategy(
-                investment_goals, risk_tolerance, timeline, amount
-            )
-            
-            # Generate portfolio allocation
-            portfolio_allocation = await self.create_portfolio_allocation(
-                amount, risk_tolerance, timeline, current_portfolio
-            )
-            
-            # Create rebalancing schedule
-            rebalancing_schedule = await self.create_rebalancing_schedule(portfolio_allocation)
-            
-            # Generate monitoring plan
-            monitoring_plan = await self.create_investment_monitoring_plan(investment_goals)
-            
-            planning_prompt = f"""
-            Create a comprehensive investment plan for:
-            
-            Investment Goals: {investment_goals}
-            Risk Tolerance: {risk_tolerance}
-            Timeline: {timeline}
-            Investment Amount: {amount}
-            Current Portfolio: {current_portfolio}
-            
-            Investment Strategy: {json.dumps(investment_strategy, indent=2)}
-            Portfolio Allocation: {json.dumps(portfolio_allocation, indent=2)}
-            Rebalancing Schedule: {json.dumps(rebalancing_schedule, indent=2)}
-            
-            Provide a detailed investment plan including:
-            1. Strategic asset allocation and diversification
-            2. Investment timeline and milestone targets
-            3. Risk management and rebalancing strategy
-            4. Performance monitoring and review process
-            5. Tax optimization and withdrawal planning
-            
-            Format as a comprehensive investment plan.
-            """
-            
-            plan_analysis = await self.ai_models.generate_plan(planning_prompt, user_tier)
+            async def write_plan(results: Dict[str, Any]) -> str:
+                planning_prompt = self.prompts.build(
+                    "investment-planning",
+                    """
+                    Create a comprehensive investment plan for the request below.
+                    Provide a detailed investment plan including:
+                    1. Strategic asset allocation and diversification
+                    2. Investment timeline and milestone targets
+                    3. Risk management and rebalancing strategy
+                    4. Performance monitoring and review process
+                    5. Tax optimization and withdrawal planning
+                    Format as a comprehensive investment plan.
+                    """,
+                    fields={
+                        "Investment Goals": investment_goals,
+                        "Risk Tolerance": risk_tolerance,
+                        "Timeline": timeline,
+                        "Investment Amount": amount,
+                        "Current Portfolio": current_portfolio
+                    },
+                    sections={
+                        "Investment Strategy": results['strategy_details'],
+                        "Portfolio Allocation": results['portfolio_allocation'],
+                        "Rebalancing Schedule": results['rebalancing_schedule']
+                    }
+                )
+                return await self.ai_models.generate_plan(planning_prompt, user_tier)
+            
+            outcome = await self.run_plan_steps([
+                Step("strategy_details", lambda r: self.create_investment_strategy(
+                    investment_goals, risk_tolerance, timeline, amount
+                )),
+                Step("portfolio_allocation", lambda r: self.create_portfolio_allocation(
+                    amount, risk_tolerance, timeline, current_portfolio
+                )),
+                Step(
+                    "rebalancing_schedule",
+                    lambda r: self.create_rebalancing_schedule(r["portfolio_allocation"]),
+                    deps=("portfolio_allocation",)
+                ),
+                Step("monitoring_plan", lambda r: self.create_investment_monitoring_plan(investment_goals)),
+                Step("risk_management", lambda r: self.create_investment_risk_management(risk_tolerance)),
+                Step("tax_strategy", lambda r: self.create_tax_optimization_strategy(investment_goals)),
+                Step(
+                    "investment_plan",
+                    write_plan,
+                    deps=("strategy_details", "portfolio_allocation", "rebalancing_schedule"),
+                    timeout=0,
+                    required=True,
+                    emit=False
+                ),
+            ])
+            results = outcome.results
             
             return {
-                "investment_plan": plan_analysis,
-                "strategy_details": investment_strategy,
-                "portfolio_allocation": portfolio_allocation,
-                "rebalancing_schedule": rebalancing_schedule,
-                "monitoring_plan": monitoring_plan,
-                "risk_management": await self.create_investment_risk_management(risk_tolerance),
-                "tax_strategy": await self.create_tax_optimization_strategy(investment_goals),
+                "investment_plan": results["investment_plan"],
+                "strategy_details": results["strategy_details"],
+                "portfolio_allocation": results["portfolio_allocation"],
+                "rebalancing_schedule": results["rebalancing_schedule"],
+                "monitoring_plan": results["monitoring_plan"],
+                "risk_management": results["risk_management"],
+                "tax_strategy": results["tax_strategy"],
                 "plan_timestamp": datetime.now().isoformat()
             }
-            
+        
         except Exception as e:
             logger.error(f"Investment planning failed: {e}")
             raise
@@ -360,59 +437,68 @@ class AIPlannerService(BaseAIService):
             timeline = parsed_input.get("timeline", "")
             team_size = parsed_input.get("team_size", 1)
             
-            # Create production schedule
-            production_schedule = await self.create_production_schedule(
-                video_type, timeline, team_size
-            )
-            
-            # Generate resource allocation
-            resource_allocation = await self.create_resource_allocation(
-                budget, video_type, team_size
-            )
-            
-            # Create shot list and storyboard plan
-            shot_plan = await self.create_shot_plan(video_type, platform)
-            
-            # Generate post-production plan
-            post_production_plan = await self.create_post_production_plan(video_type, timeline)
-            
-            planning_prompt = f"""
-            Create a comprehensive video production plan for:
-            
-            Video Type: {video_type}
-            Platform: {platform}
-            Budget: {budget}
-            Timeline: {timeline}
-            Team Size: {team_size}
-            
-            Production Schedule: {json.dumps(production_schedule, indent=2)}
-            Resource Allocation: {json.dumps(resource_allocation, indent=2)}
-            Shot Plan: {json.dumps(shot_plan, indent=2)}
-            Post-Production: {json.dumps(post_production_plan, indent=2)}
-            
-            Provide a detailed video production plan including:
-            1. Complete production timeline and milestones
-            2. Resource allocation and budget breakdown
-            3. Shot list and storyboard planning
-            4. Post-production workflow and delivery
-            5. Quality control and review process
-            
-            Format as a comprehensive video production plan.
-            """
-            
-            plan_analysis = await self.ai_models.generate_plan(planning_prompt, user_tier)
+            async def write_plan(results: Dict[str, Any]) -> str:
+                planning_prompt = self.prompts.build(
+                    "video-shoot-planning",
+                    """
+                    Create a comprehensive video production plan for the request below.
+                    Provide a detailed video production plan including:
+                    1. Complete production timeline and milestones
+                    2. Resource allocation and budget breakdown
+                    3. Shot list and storyboard planning
+                    4. Post-production workflow and delivery
+                    5. Quality control and review process
+                    Format as a comprehensive video production plan.
+                    """,
+                    fields={
+                        "Video Type": video_type,
+                        "Platform": platform,
+                        "Budget": budget,
+                        "Timeline": timeline,
+                        "Team Size": team_size
+                    },
+                    sections={
+                        "Production Schedule": results['schedule_details'],
+                        "Resource Allocation": results['resource_allocation'],
+                        "Shot Plan": results['shot_planning'],
+                        "Post-Production": results['post_production']
+                    }
+                )
+                return await self.ai_models.generate_plan(planning_prompt, user_tier)
+            
+            outcome = await self.run_plan_steps([
+                Step("schedule_details", lambda r: self.create_production_schedule(
+                    video_type, timeline, team_size
+                )),
+                Step("resource_allocation", lambda r: self.create_resource_allocation(
+                    budget, video_type, team_size
+                )),
+                Step("shot_planning", lambda r: self.create_shot_plan(video_type, platform)),
+                Step("post_production", lambda r: self.create_post_production_plan(video_type, timeline)),
+                Step("equipment_list", lambda r: self.create_equipment_list(video_type, budget)),
+                Step("crew_assignments", lambda r: self.create_crew_assignments(team_size, video_type)),
+                Step(
+                    "production_plan",
+                    write_plan,
+                    deps=("schedule_details", "resource_allocation", "shot_planning", "post_production"),
+                    timeout=0,
+                    required=True,
+                    emit=False
+                ),
+            ])
+            results = outcome.results
             
             return {
-                "production_plan": plan_analysis,
-                "schedule_details": production_schedule,
-                "resource_allocation": resource_allocation,
-                "shot_planning": shot_plan,
-                "post_production": post_production_plan,
-                "equipment_list": await self.create_equipment_list(video_type, budget),
-                "crew_assignments": await self.create_crew_assignments(team_size, video_type),
+                "production_plan": results["production_plan"],
+                "schedule_details": results["schedule_details"],
+                "resource_allocation": results["resource_allocation"],
+                "shot_planning": results["shot_planning"],
+                "post_production": results["post_production"],
+                "equipment_list": results["equipment_list"],
+                "crew_assignments": results["crew_assignments"],
                 "plan_timestamp": datetime.now().isoformat()
             }
-            
+        
         except Exception as e:
             logger.error(f"Video shoot planning failed: {e}")
             raise
@@ -423,49 +509,64 @@ class AIPlannerService(BaseAIService):
             # Analyze planning requirements
             planning_analysis = await self.ai_models.analyze_planning_requirements(input_data)
             
-            # Create strategic framework
-            strategic_framework = await self.create_strategic_framework(planning_analysis)
-            
-            # Generate implementation timeline
-            implementation_timeline = await self.create_implementation_timeline(planning_analysis)
-            
-            # Create resource requirements
-            resource_requirements = await self.create_resource_requirements(planning_analysis)
-            
-            # Generate success metrics
-            success_metrics = await self.create_success_metrics(planning_analysis)
-            
-            planning_prompt = f"""
-            Create a comprehensive plan for: {input_data}
-            
-            Planning Analysis: {json.dumps(planning_analysis, indent=2)}
-            Strategic Framework: {json.dumps(strategic_framework, indent=2)}
-            Implementation Timeline: {json.dumps(implementation_timeline, indent=2)}
-            Resource Requirements: {json.dumps(resource_requirements, indent=2)}
-            
-            Provide a detailed plan including:
-            1. Strategic framework and goal definition
-            2. Implementation timeline with milestones
-            3. Resource allocation and requirements
-            4. Risk assessment and mitigation strategies
-            5. Success metrics and monitoring plan
-            
-            Format as a comprehensive strategic plan.
-            """
-            
-            plan_analysis = await self.ai_models.generate_plan(planning_prompt, user_tier)
+            async def write_plan(results: Dict[str, Any]) -> str:
+                planning_prompt = self.prompts.build(
+                    "general-planning",
+                    """
+                    Create a comprehensive plan for the goal below.
+                    Provide a detailed plan including:
+                    1. Strategic framework and goal definition
+                    2. Implementation timeline with milestones
+                    3. Resource allocation and requirements
+                    4. Risk assessment and mitigation strategies
+                    5. Success metrics and monitoring plan
+                    Format as a comprehensive strategic plan.
+                    """,
+                    fields={
+                        "Goal": input_data
+                    },
+                    sections={
+                        "Planning Analysis": planning_analysis,
+                        "Strategic Framework": results['framework_details'],
+                        "Implementation Timeline": results['implementation_timeline'],
+                        "Resource Requirements": results['resource_requirements']
+                    }
+                )
+                return await self.ai_models.generate_plan(planning_prompt, user_tier)
+            
+            outcome = await self.run_plan_steps([
+                Step("framework_details", lambda r: self.create_strategic_framework(planning_analysis)),
+                Step("implementation_timeline", lambda r: self.create_implementation_timeline(planning_analysis)),
+                Step("resource_requirements", lambda r: self.create_resource_requirements(planning_analysis)),
+                Step("success_metrics", lambda r: self.create_success_metrics(planning_analysis)),
+                Step("risk_assessment", lambda r: self.create_risk_assessment(planning_analysis)),
+                Step(
+                    "monitoring_plan",
+                    lambda r: self.create_monitoring_plan(r["success_metrics"]),
+                    deps=("success_metrics",)
+                ),
+                Step(
+                    "strategic_plan",
+                    write_plan,
+                    deps=("framework_details", "implementation_timeline", "resource_requirements"),
+                    timeout=0,
+                    required=True,
+                    emit=False
+                ),
+            ])
+            results = outcome.results
             
             return {
-                "strategic_plan": plan_analysis,
-                "framework_details": strategic_framework,
-                "implementation_timeline": implementation_timeline,
-                "resource_requirements": resource_requirements,
-                "success_metrics": success_metrics,
-                "risk_assessment": await self.create_risk_assessment(planning_analysis),
-                "monitoring_plan": await self.create_monitoring_plan(success_metrics),
+                "strategic_plan": results["strategic_plan"],
+                "framework_details": results["framework_details"],
+                "implementation_timeline": results["implementation_timeline"],
+                "resource_requirements": results["resource_requirements"],
+                "success_metrics": results["success_metrics"],
+                "risk_assessment": results["risk_assessment"],
+                "monitoring_plan": results["monitoring_plan"],
                 "plan_timestamp": datetime.now().isoformat()
             }
-            
+        
         except Exception as e:
             logger.error(f"General planning failed: {e}")
             raise
@@ -524,5 +625,6 @@ class AIPlannerService(BaseAIService):
             "status": "online",
             "services_available": len(self.planning_services),
             "models_loaded": await self.ai_models.get_loaded_models(),
-            "data_sources": await self.data_sources.get_status()
+            "data_sources": await self.data_sources.get_status(),
+            "prompts": self.prompts.get_stats()
         }
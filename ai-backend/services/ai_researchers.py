@@ -5,14 +5,17 @@ Implements all 6 research services using free AI models
 
 import asyncio
 import logging
-from typing import Dict, Any, List
+from typing import Dict, Any, List, Optional
 from datetime import datetime
-import json
 
 try:
     from .base_service import BaseAIService
     from .data_sources import DataSourceManager
     from .ai_models import AIModelManager
+    from .streaming import emit_section
+    from .prompt_builder import PromptBuilder
+    from utils.monitoring import stage_timer
+    from utils.admission import ProviderOverloaded
 except ImportError:
     # Fallback imports for development
     import sys
@@ -21,16 +24,27 @@ except ImportError:
     from base_service import BaseAIService
     from data_sources import DataSourceManager
     from ai_models import AIModelManager
+    from streaming import emit_section
+    from prompt_builder import PromptBuilder
+    sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+    from utils.monitoring import stage_timer
+    from utils.admission import ProviderOverloaded
 
 logger = logging.getLogger(__name__)
 
 class AIResearcherService(BaseAIService):
     """AI Researchers service implementation"""
     
-    def __init__(self, model_router):
+    def __init__(
+        self,
+        model_router,
+        data_sources: Optional[DataSourceManager] = None,
+        ai_models: Optional[AIModelManager] = None
+    ):
         super().__init__(model_router)
-        self.data_sources = DataSourceManager()
-        self.ai_models = AIModelManager(model_router)
+        self.data_sources = data_sources or DataSourceManager(getattr(model_router, "http_client", None))
+        self.ai_models = ai_models or AIModelManager(model_router)
+        self.prompts = PromptBuilder()
         
         # Research service mapping
         self.research_services = {
@@ -72,7 +86,9 @@ class AIResearcherService(BaseAIService):
                 "data": result,
                 "service_type": service_type
             }
-            
+        
+        except ProviderOverloaded:
+            raise
         except Exception as e:
             logger.error(f"Research request failed: {e}")
             return {
@@ -97,7 +113,8 @@ class AIResearcherService(BaseAIService):
                 self.data_sources.get_local_info(destination),
             ]
             
-            weather_data, cost_data, attractions, local_info = await asyncio.gather(*tasks, return_exceptions=True)
+            with stage_timer("data_fetch"):
+                weather_data, cost_data, attractions, local_info = await asyncio.gather(*tasks, return_exceptions=True)
             
             # Compile research data
             research_data = {
@@ -109,41 +126,51 @@ class AIResearcherService(BaseAIService):
                 "attractions": attractions if not isinstance(attractions, Exception) else None,
                 "local_info": local_info if not isinstance(local_info, Exception) else None,
             }
+            emit_section("raw_data", research_data)
             
             # Generate AI analysis
-            analysis_prompt = f"""
-            Analyze this vacation destination research:
-            
-            Destination: {destination}
-            Budget: {budget}
-            Duration: {duration}
-            
-            Weather Data: {json.dumps(research_data['weather'], indent=2)}
-            Cost Information: {json.dumps(research_data['costs'], indent=2)}
-            Attractions: {json.dumps(research_data['attractions'], indent=2)}
-            Local Information: {json.dumps(research_data['local_info'], indent=2)}
-            
-            Provide a comprehensive vacation research report including:
-            1. Best time to visit based on weather
-            2. Budget breakdown and cost analysis
-            3. Top recommended attractions and activities
-            4. Local tips and cultural insights
-            5. Travel recommendations and warnings
-            
-            Format as a detailed research report.
-            """
+            analysis_prompt = self.prompts.build(
+                "vacation-research",
+                """
+                Analyze the vacation destination research below.
+                Provide a comprehensive vacation research report including:
+                1. Best time to visit based on weather
+                2. Budget breakdown and cost analysis
+                3. Top recommended attractions and activities
+                4. Local tips and cultural insights
+                5. Travel recommendations and warnings
+                Format as a detailed research report.
+                """,
+                fields={
+                    "Destination": destination,
+                    "Budget": budget,
+                    "Duration": duration
+                },
+                sections={
+                    "Weather Data": research_data['weather'],
+                    "Cost Information": research_data['costs'],
+                    "Attractions": research_data['attractions'],
+                    "Local Information": research_data['local_info']
+                }
+            )
             
-            analysis = await self.ai_models.generate_analysis(analysis_prompt, user_tier)
+            # Enrichment does not depend on the analysis, so run it alongside the model call
+            analysis, recommendations, budget_breakdown, best_time = await asyncio.gather(
+                self.ai_models.generate_analysis(analysis_prompt, user_tier),
+                self.emit_when_ready("recommendations", self.ai_models.generate_recommendations(research_data, "vacation")),
+                self.emit_when_ready("budget_breakdown", self.generate_budget_breakdown(cost_data, budget)),
+                self.emit_when_ready("best_time_to_visit", self.analyze_best_time(weather_data)),
+            )
             
             return {
                 "destination_analysis": analysis,
                 "raw_data": research_data,
-                "recommendations": await self.ai_models.generate_recommendations(research_data, "vacation"),
-                "budget_breakdown": await self.generate_budget_breakdown(cost_data, budget),
-                "best_time_to_visit": await self.analyze_best_time(weather_data),
+                "recommendations": recommendations,
+                "budget_breakdown": budget_breakdown,
+                "best_time_to_visit": best_time,
                 "research_timestamp": datetime.now().isoformat()
             }
-            
+        
         except Exception as e:
             logger.error(f"Vacation research failed: {e}")
             raise
@@ -165,7 +192,8 @@ class AIResearcherService(BaseAIService):
                 self.data_sources.get_admission_requirements(field, level),
             ]
             
-            programs, career_data, costs, requirements = await asyncio.gather(*tasks, return_exceptions=True)
+            with stage_timer("data_fetch"):
+                programs, career_data, costs, requirements = await asyncio.gather(*tasks, return_exceptions=True)
             
             research_data = {
                 "field": field,
@@ -176,41 +204,50 @@ class AIResearcherService(BaseAIService):
                 "costs": costs if not isinstance(costs, Exception) else {},
                 "requirements": requirements if not isinstance(requirements, Exception) else {},
             }
+            emit_section("raw_data", research_data)
             
             # Generate analysis
-            analysis_prompt = f"""
-            Analyze this education research data:
-            
-            Field of Study: {field}
-            Education Level: {level}
-            Location: {location}
-            
-            Available Programs: {json.dumps(research_data['programs'], indent=2)}
-            Career Prospects: {json.dumps(research_data['career_prospects'], indent=2)}
-            Cost Information: {json.dumps(research_data['costs'], indent=2)}
-            Requirements: {json.dumps(research_data['requirements'], indent=2)}
-            
-            Provide a comprehensive education research report including:
-            1. Top recommended programs and institutions
-            2. Career prospects and salary expectations
-            3. Cost analysis and financial planning
-            4. Admission requirements and application process
-            5. Skills development and learning path
-            
-            Format as a detailed research report.
-            """
+            analysis_prompt = self.prompts.build(
+                "education-research",
+                """
+                Analyze the education research data below.
+                Provide a comprehensive education research report including:
+                1. Top recommended programs and institutions
+                2. Career prospects and salary expectations
+                3. Cost analysis and financial planning
+                4. Admission requirements and application process
+                5. Skills development and learning path
+                Format as a detailed research report.
+                """,
+                fields={
+                    "Field of Study": field,
+                    "Education Level": level,
+                    "Location": location
+                },
+                sections={
+                    "Available Programs": research_data['programs'],
+                    "Career Prospects": research_data['career_prospects'],
+                    "Cost Information": research_data['costs'],
+                    "Requirements": research_data['requirements']
+                }
+            )
             
-            analysis = await self.ai_models.generate_analysis(analysis_prompt, user_tier)
+            analysis, top_programs, career_outlook, cost_breakdown = await asyncio.gather(
+                self.ai_models.generate_analysis(analysis_prompt, user_tier),
+                self.emit_when_ready("top_programs", self.rank_programs(research_data["programs"])),
+                self.emit_when_ready("career_outlook", self.analyze_career_outlook(career_data)),
+                self.emit_when_ready("cost_breakdown", self.generate_education_cost_breakdown(costs)),
+            )
             
             return {
                 "education_analysis": analysis,
                 "raw_data": research_data,
-                "top_programs": await self.rank_programs(programs),
-                "career_outlook": await self.analyze_career_outlook(career_data),
-                "cost_breakdown": await self.generate_education_cost_breakdown(costs),
+                "top_programs": top_programs,
+                "career_outlook": career_outlook,
+                "cost_breakdown": cost_breakdown,
                 "research_timestamp": datetime.now().isoformat()
             }
-            
+        
         except Exception as e:
             logger.error(f"Education research failed: {e}")
             raise
@@ -231,7 +268,8 @@ class AIResearcherService(BaseAIService):
                 self.data_sources.get_insurance_reviews(insurance_type),
             ]
             
-            providers, coverage, costs, reviews = await asyncio.gather(*tasks, return_exceptions=True)
+            with stage_timer("data_fetch"):
+                providers, coverage, costs, reviews = await asyncio.gather(*tasks, return_exceptions=True)
             
             research_data = {
                 "insurance_type": insurance_type,
@@ -242,40 +280,49 @@ class AIResearcherService(BaseAIService):
                 "costs": costs if not isinstance(costs, Exception) else {},
                 "reviews": reviews if not isinstance(reviews, Exception) else [],
             }
+            emit_section("raw_data", research_data)
+            
+            analysis_prompt = self.prompts.build(
+                "insurance-research",
+                """
+                Analyze the insurance research data below.
+                Provide a comprehensive insurance research report including:
+                1. Top recommended insurance providers
+                2. Coverage comparison and analysis
+                3. Cost breakdown and premium estimates
+                4. Provider ratings and customer reviews
+                5. Coverage recommendations based on needs
+                Format as a detailed research report.
+                """,
+                fields={
+                    "Insurance Type": insurance_type,
+                    "Coverage Needs": coverage_needs,
+                    "Location": location
+                },
+                sections={
+                    "Providers": research_data['providers'],
+                    "Coverage Options": research_data['coverage_options'],
+                    "Cost Information": research_data['costs'],
+                    "Reviews": research_data['reviews']
+                }
+            )
             
-            analysis_prompt = f"""
-            Analyze this insurance research data:
-            
-            Insurance Type: {insurance_type}
-            Coverage Needs: {coverage_needs}
-            Location: {location}
-            
-            Providers: {json.dumps(research_data['providers'], indent=2)}
-            Coverage Options: {json.dumps(research_data['coverage_options'], indent=2)}
-            Cost Information: {json.dumps(research_data['costs'], indent=2)}
-            Reviews: {json.dumps(research_data['reviews'], indent=2)}
-            
-            Provide a comprehensive insurance research report including:
-            1. Top recommended insurance providers
-            2. Coverage comparison and analysis
-            3. Cost breakdown and premium estimates
-            4. Provider ratings and customer reviews
-            5. Coverage recommendations based on needs
-            
-            Format as a detailed research report.
-            """
-            
-            analysis = await self.ai_models.generate_analysis(analysis_prompt, user_tier)
+            analysis, top_providers, coverage_comparison, cost_estimates = await asyncio.gather(
+                self.ai_models.generate_analysis(analysis_prompt, user_tier),
+                self.emit_when_ready("top_providers", self.rank_insurance_providers(research_data["providers"], reviews)),
+                self.emit_when_ready("coverage_comparison", self.compare_coverage_options(coverage)),
+                self.emit_when_ready("cost_estimates", self.generate_insurance_cost_estimates(costs)),
+            )
             
             return {
                 "insurance_analysis": analysis,
                 "raw_data": research_data,
-                "top_providers": await self.rank_insurance_providers(providers, reviews),
-                "coverage_comparison": await self.compare_coverage_options(coverage),
-                "cost_estimates": await self.generate_insurance_cost_estimates(costs),
+                "top_providers": top_providers,
+                "coverage_comparison": coverage_comparison,
+                "cost_estimates": cost_estimates,
                 "research_timestamp": datetime.now().isoformat()
             }
-            
+        
         except Exception as e:
             logger.error(f"Insurance research failed: {e}")
             raise
@@ -296,7 +343,8 @@ class AIResearcherService(BaseAIService):
                 self.data_sources.get_risk_analysis(investment_type),
             ]
             
-            market_data, options, news, risk_data = await asyncio.gather(*tasks, return_exceptions=True)
+            with stage_timer("data_fetch"):
+                market_data, options, news, risk_data = await asyncio.gather(*tasks, return_exceptions=True)
             
             research_data = {
                 "investment_type": investment_type,
@@ -307,40 +355,49 @@ class AIResearcherService(BaseAIService):
                 "news": news if not isinstance(news, Exception) else [],
                 "risk_analysis": risk_data if not isinstance(risk_data, Exception) else {},
             }
+            emit_section("raw_data", research_data)
+            
+            analysis_prompt = self.prompts.build(
+                "investment-research",
+                """
+                Analyze the investment research data below.
+                Provide a comprehensive investment research report including:
+                1. Market analysis and trends
+                2. Investment recommendations based on risk tolerance
+                3. Risk assessment and mitigation strategies
+                4. Performance projections and scenarios
+                5. Diversification recommendations
+                Format as a detailed research report.
+                """,
+                fields={
+                    "Investment Type": investment_type,
+                    "Risk Tolerance": risk_tolerance,
+                    "Investment Amount": amount
+                },
+                sections={
+                    "Market Data": research_data['market_data'],
+                    "Investment Options": research_data['investment_options'],
+                    "Recent News": research_data['news'],
+                    "Risk Analysis": research_data['risk_analysis']
+                }
+            )
             
-            analysis_prompt = f"""
-            Analyze this investment research data:
-            
-            Investment Type: {investment_type}
-            Risk Tolerance: {risk_tolerance}
-            Investment Amount: {amount}
-            
-            Market Data: {json.dumps(research_data['market_data'], indent=2)}
-            Investment Options: {json.dumps(research_data['investment_options'], indent=2)}
-            Recent News: {json.dumps(research_data['news'], indent=2)}
-            Risk Analysis: {json.dumps(research_data['risk_analysis'], indent=2)}
-            
-            Provide a comprehensive investment research report including:
-            1. Market analysis and trends
-            2. Investment recommendations based on risk tolerance
-            3. Risk assessment and mitigation strategies
-            4. Performance projections and scenarios
-            5. Diversification recommendations
-            
-            Format as a detailed research report.
-            """
-            
-            analysis = await self.ai_models.generate_analysis(analysis_prompt, user_tier)
+            analysis, market_trends, risk_assessment, recommendations = await asyncio.gather(
+                self.ai_models.generate_analysis(analysis_prompt, user_tier),
+                self.emit_when_ready("market_trends", self.analyze_market_trends(market_data)),
+                self.emit_when_ready("risk_assessment", self.assess_investment_risk(risk_data, risk_tolerance)),
+                self.emit_when_ready("recommendations", self.generate_investment_recommendations(research_data)),
+            )
             
             return {
                 "investment_analysis": analysis,
                 "raw_data": research_data,
-                "market_trends": await self.analyze_market_trends(market_data),
-                "risk_assessment": await self.assess_investment_risk(risk_data, risk_tolerance),
-                "recommendations": await self.generate_investment_recommendations(research_data),
+                "market_trends": market_trends,
+                "risk_assessment": risk_assessment,
+                "recommendations": recommendations,
                 "research_timestamp": datetime.now().isoformat()
             }
-            
+        
         except Exception as e:
             logger.error(f"Investment research failed: {e}")
             raise
@@ -361,7 +418,8 @@ class AIResearcherService(BaseAIService):
                 self.data_sources.get_content_strategies(video_type, platform),
             ]
             
-            trends, equipment, costs, strategies = await asyncio.gather(*tasks, return_exceptions=True)
+            with stage_timer("data_fetch"):
+                trends, equipment, costs, strategies = await asyncio.gather(*tasks, return_exceptions=True)
             
             research_data = {
                 "video_type": video_type,
@@ -372,40 +430,49 @@ class AIResearcherService(BaseAIService):
                 "costs": costs if not isinstance(costs, Exception) else {},
                 "strategies": strategies if not isinstance(strategies, Exception) else {},
             }
+            emit_section("raw_data", research_data)
+            
+            analysis_prompt = self.prompts.build(
+                "video-shoot-research",
+                """
+                Analyze the video production research data below.
+                Provide a comprehensive video production research report including:
+                1. Current trends and viral content analysis
+                2. Equipment recommendations and budget breakdown
+                3. Production timeline and cost estimates
+                4. Content strategy and optimization tips
+                5. Platform-specific recommendations
+                Format as a detailed research report.
+                """,
+                fields={
+                    "Video Type": video_type,
+                    "Platform": platform,
+                    "Budget": budget
+                },
+                sections={
+                    "Current Trends": research_data['trends'],
+                    "Equipment Requirements": research_data['equipment'],
+                    "Production Costs": research_data['costs'],
+                    "Content Strategies": research_data['strategies']
+                }
+            )
             
-            analysis_prompt = f"""
-            Analyze this video production research data:
-            
-            Video Type: {video_type}
-            Platform: {platform}
-            Budget: {budget}
-            
-            Current Trends: {json.dumps(research_data['trends'], indent=2)}
-            Equipment Requirements: {json.dumps(research_data['equipment'], indent=2)}
-            Production Costs: {json.dumps(research_data['costs'], indent=2)}
-            Content Strategies: {json.dumps(research_data['strategies'], indent=2)}
-            
-            Provide a comprehensive video production research report including:
-            1. Current trends and viral content analysis
-            2. Equipment recommendations and budget breakdown
-            3. Production timeline and cost estimates
-            4. Content strategy and optimization tips
-            5. Platform-specific recommendations
-            
-            Format as a detailed research report.
-            """
-            
-            analysis = await self.ai_models.generate_analysis(analysis_prompt, user_tier)
+            analysis, trend_analysis, equipment_recommendations, content_strategy = await asyncio.gather(
+                self.ai_models.generate_analysis(analysis_prompt, user_tier),
+                self.emit_when_ready("trend_analysis", self.analyze_video_trends(trends)),
+                self.emit_when_ready("equipment_recommendations", self.recommend_equipment(equipment, budget)),
+                self.emit_when_ready("content_strategy", self.develop_content_strategy(strategies, platform)),
+            )
             
             return {
                 "video_analysis": analysis,
                 "raw_data": research_data,
-                "trend_analysis": await self.analyze_video_trends(trends),
-                "equipment_recommendations": await self.recommend_equipment(equipment, budget),
-                "content_strategy": await self.develop_content_strategy(strategies, platform),
+                "trend_analysis": trend_analysis,
+                "equipment_recommendations": equipment_recommendations,
+                "content_strategy": content_strategy,
                 "research_timestamp": datetime.now().isoformat()
             }
-            
+        
         except Exception as e:
             logger.error(f"Video shoot research failed: {e}")
             raise
@@ -417,44 +484,62 @@ class AIResearcherService(BaseAIService):
             topic_analysis = await self.ai_models.analyze_research_topic(input_data)
             
             # Gather relevant data based on topic
-            research_data = await self.data_sources.general_research(
-                topic_analysis.get("topic", ""),
-                topic_analysis.get("keywords", []),
-                topic_analysis.get("research_type", "general")
+            with stage_timer("data_fetch"):
+                research_data = await self.data_sources.general_research(
+                    topic_analysis.get("topic", ""),
+                    topic_analysis.get("keywords", []),
+                    topic_analysis.get("research_type", "general")
+                )
+            emit_section("topic_analysis", topic_analysis)
+            emit_section("raw_data", research_data)
+            
+            analysis_prompt = self.prompts.build(
+                "general-research",
+                """
+                Conduct comprehensive research on the topic below.
+                Provide a detailed research report including:
+                1. Topic overview and key findings
+                2. Data analysis and insights
+                3. Trends and patterns
+                4. Recommendations and conclusions
+                5. Additional resources and references
+                Format as a comprehensive research report.
+                """,
+                fields={
+                    "Topic": input_data
+                },
+                sections={
+                    "Topic Analysis": topic_analysis,
+                    "Research Data": research_data
+                }
             )
             
-            analysis_prompt = f"""
-            Conduct comprehensive research on: {input_data}
-            
-            Topic Analysis: {json.dumps(topic_analysis, indent=2)}
-            Research Data: {json.dumps(research_data, indent=2)}
-            
-            Provide a detailed research report including:
-            1. Topic overview and key findings
-            2. Data analysis and insights
-            3. Trends and patterns
-            4. Recommendations and conclusions
-            5. Additional resources and references
-            
-            Format as a comprehensive research report.
-            """
-            
-            analysis = await self.ai_models.generate_analysis(analysis_prompt, user_tier)
+            analysis, key_insights, recommendations = await asyncio.gather(
+                self.ai_models.generate_analysis(analysis_prompt, user_tier),
+                self.emit_when_ready("key_insights", self.extract_key_insights(research_data)),
+                self.emit_when_ready("recommendations", self.generate_general_recommendations(research_data)),
+            )
             
             return {
                 "research_analysis": analysis,
                 "topic_analysis": topic_analysis,
                 "raw_data": research_data,
-                "key_insights": await self.extract_key_insights(research_data),
-                "recommendations": await self.generate_general_recommendations(research_data),
+                "key_insights": key_insights,
+                "recommendations": recommendations,
                 "research_timestamp": datetime.now().isoformat()
             }
-            
+        
         except Exception as e:
             logger.error(f"General research failed: {e}")
             raise
     
     # Helper methods
+    async def emit_when_ready(self, name: str, coro) -> Any:
+        """Await an enrichment step and stream it as a section as soon as it finishes"""
+        value = await coro
+        emit_section(name, value)
+        return value
+    
     async def generate_budget_breakdown(self, cost_data, budget):
         """Generate budget breakdown for vacation"""
         # Implementation for budget analysis
@@ -541,5 +626,6 @@ class AIResearcherService(BaseAIService):
             "status": "online",
             "services_available": len(self.research_services),
             "models_loaded": await self.ai_models.get_loaded_models(),
-            "data_sources": await self.data_sources.get_status()
+            "data_sources": await self.data_sources.get_status(),
+            "prompts": self.prompts.get_stats()
         }
@@ -3,11 +3,17 @@ Base AI Service Class
 Common functionality for all AI services
 """
 
+import asyncio
 import logging
 from abc import ABC, abstractmethod
-from typing import Dict, Any, Optional
+from typing import Dict, Any, AsyncIterator, Optional
 from datetime import datetime
 
+try:
+    from .streaming import StreamSink, current_stream
+except ImportError:
+    from streaming import StreamSink, current_stream
+
 logger = logging.getLogger(__name__)
 
 class BaseAIService(ABC):
@@ -24,6 +30,19 @@ class BaseAIService(ABC):
         """Process a service request"""
         pass
     
+    async def process_request_stream(self, request) -> AsyncIterator[Dict[str, Any]]:
+        """Process a request, yielding sections and tokens as they are produced"""
+        sink = StreamSink()
+        token = current_stream.set(sink)
+        try:
+            # The task copies the current context, so the sink follows the request
+            task = asyncio.ensure_future(self.process_request(request))
+        finally:
+            current_stream.reset(token)
+        
+        async for event in sink.drain(task):
+            yield event
+    
     @abstractmethod
     async def get_status(self) -> Dict[str, Any]:
         """Get service status"""
@@ -4,48 +4,195 @@ Handles external data collection from various APIs
 """
 
 import os
+import time
 import logging
 import aiohttp
 import asyncio
-from typing import Dict, Any, List, Optional
+from collections import OrderedDict
+from typing import Dict, Any, Awaitable, Callable, List, Optional, Tuple
+
+try:
+    from utils.http_client import HTTPClientPool
+except ImportError:
+    # Fallback imports for development
+    import sys
+    sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+    from utils.http_client import HTTPClientPool
 
 logger = logging.getLogger(__name__)
 
+class SourceCache:
+    """TTL cache for one upstream source with stale-while-revalidate and negative caching"""
+    
+    def __init__(self, name: str, ttl: float, stale_ttl: float, negative_ttl: float, max_entries: int = 1024):
+        self.name = name
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl  # extra window in which stale values are served while refreshing
+        self.negative_ttl = negative_ttl
+        self.max_entries = max_entries
+        # key -> (value, stored_at, failed)
+        self.entries: "OrderedDict[str, Tuple[Any, float, bool]]" = OrderedDict()
+        self.inflight: Dict[str, asyncio.Future] = {}
+        # key -> when its last background refresh failed; no new refresh starts for negative_ttl after that
+        self.refresh_failed_at: Dict[str, float] = {}
+        
+        self.hits = 0
+        self.stale_hits = 0
+        self.negative_hits = 0
+        self.misses = 0
+        self.refreshes = 0
+        self.failed_refreshes = 0
+    
+    async def get_or_fetch(
+        self,
+        key: str,
+        fetch: Callable[[], Awaitable[Tuple[Any, bool]]]
+    ) -> Any:
+        """Return a cached value, refreshing it in the background once stale; fetch returns (value, ok)"""
+        entry = self.entries.get(key)
+        if entry is not None:
+            value, stored_at, failed = entry
+            age = time.monotonic() - stored_at
+            
+            if failed:
+                if age < self.negative_ttl:
+                    self.negative_hits += 1
+                    return value
+            elif age < self.ttl:
+                self.hits += 1
+                self.entries.move_to_end(key)
+                return value
+            elif age < self.ttl + self.stale_ttl:
+                self.stale_hits += 1
+                self.entries.move_to_end(key)
+                failed_at = self.refresh_failed_at.get(key)
+                backing_off = failed_at is not None and time.monotonic() - failed_at < self.negative_ttl
+                if key not in self.inflight and not backing_off:
+                    self.refreshes += 1
+                    self._start_fetch(key, fetch)
+                return value
+        
+        self.misses += 1
+        # Concurrent misses for the same key share one upstream call
+        task = self.inflight.get(key) or self._start_fetch(key, fetch)
+        return await asyncio.shield(task)
+    
+    def _start_fetch(self, key: str, fetch: Callable[[], Awaitable[Tuple[Any, bool]]]) -> asyncio.Future:
+        task = asyncio.ensure_future(self._fetch_and_store(key, fetch))
+        self.inflight[key] = task
+        task.add_done_callback(lambda done: self.inflight.pop(key, None))
+        return task
+    
+    async def _fetch_and_store(self, key: str, fetch: Callable[[], Awaitable[Tuple[Any, bool]]]) -> Any:
+        value, ok = await fetch()
+        
+        previous = self.entries.get(key)
+        if not ok and previous is not None and not previous[2]:
+            # Keep serving the last good value rather than replacing it with an error
+            previous_value, stored_at, _ = previous
+            if time.monotonic() - stored_at < self.ttl + self.stale_ttl:
+                # Remember the failure so the stale value is served without hitting the upstream again
+                self.refresh_failed_at[key] = time.monotonic()
+                self.failed_refreshes += 1
+                return previous_value
+        
+        self.refresh_failed_at.pop(key, None)
+        self.entries[key] = (value, time.monotonic(), not ok)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            evicted, _ = self.entries.popitem(last=False)
+            self.refresh_failed_at.pop(evicted, None)
+        
+        if not ok:
+            logger.debug(f"Negative-cached {self.name} lookup for {key} ({self.negative_ttl}s)")
+        return value
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """Get cache statistics for this source"""
+        return {
+            "entries": len(self.entries),
+            "ttl": self.ttl,
+            "hits": self.hits,
+            "stale_hits": self.stale_hits,
+            "negative_hits": self.negative_hits,
+            "misses": self.misses,
+            "background_refreshes": self.refreshes,
+            "failed_refreshes": self.failed_refreshes
+        }
+
 class DataSourceManager:
     """Manages external data sources"""
     
-    def __init__(self):
+    def __init__(self, http_client: Optional[HTTPClientPool] = None):
+        # A pool built here has no other owner, so close() has to release it
+        self.owns_http_client = http_client is None
+        self.http_client = http_client or HTTPClientPool()
         self.weather_api_key = os.getenv("WEATHER_API_KEY")
         self.news_api_key = os.getenv("NEWS_API_KEY")
         self.alpha_vantage_key = os.getenv("ALPHA_VANTAGE_KEY")
         self.serp_api_key = os.getenv("SERP_API_KEY")
+        
+        # Per-source caches; TTLs follow how quickly each upstream's data changes
+        self.source_caches = {
+            "weather": SourceCache(
+                "weather",
+                ttl=float(os.getenv("WEATHER_CACHE_TTL", 600)),
+                stale_ttl=float(os.getenv("WEATHER_CACHE_STALE_TTL", 1800)),
+                negative_ttl=float(os.getenv("WEATHER_CACHE_NEGATIVE_TTL", 60))
+            ),
+            "market": SourceCache(
+                "market",
+                ttl=float(os.getenv("MARKET_CACHE_TTL", 300)),
+                stale_ttl=float(os.getenv("MARKET_CACHE_STALE_TTL", 900)),
+                negative_ttl=float(os.getenv("MARKET_CACHE_NEGATIVE_TTL", 60))
+            ),
+            "news": SourceCache(
+                "news",
+                ttl=float(os.getenv("NEWS_CACHE_TTL", 1800)),
+                stale_ttl=float(os.getenv("NEWS_CACHE_STALE_TTL", 3600)),
+                negative_ttl=float(os.getenv("NEWS_CACHE_NEGATIVE_TTL", 300))
+            )
+        }
+    
+    @staticmethod
+    def _cache_key(value: str) -> str:
+        """Normalize a lookup parameter so equivalent queries share a cache entry"""
+        return " ".join((value or "").split()).lower()
     
     async def get_weather_data(self, location: str) -> Dict[str, Any]:
         """Get weather data for location"""
         if not self.weather_api_key:
             return {"error": "Weather API key not configured"}
         
+        async def fetch() -> Tuple[Dict[str, Any], bool]:
+            data = await self._fetch_weather_data(location)
+            return data, "error" not in data
+        
+        return await self.source_caches["weather"].get_or_fetch(self._cache_key(location), fetch)
+    
+    async def _fetch_weather_data(self, location: str) -> Dict[str, Any]:
+        """Fetch current weather from OpenWeatherMap"""
         try:
-            async with aiohttp.ClientSession() as session:
-                url = f"http://api.openweathermap.org/data/2.5/weather"
-                params = {
-                    "q": location,
-                    "appid": self.weather_api_key,
-                    "units": "metric"
-                }
-                
-                async with session.get(url, params=params) as response:
-                    if response.status == 200:
-                        data = await response.json()
-                        return {
-                            "temperature": data["main"]["temp"],
-                            "description": data["weather"][0]["description"],
-                            "humidity": data["main"]["humidity"],
-                            "location": location
-                        }
-                    else:
-                        return {"error": f"Weather API error: {response.status}"}
-                        
+            session = self.http_client.session
+            url = f"http://api.openweathermap.org/data/2.5/weather"
+            params = {
+                "q": location,
+                "appid": self.weather_api_key,
+                "units": "metric"
+            }
+            
+            async with session.get(url, params=params) as response:
+                if response.status == 200:
+                    data = await response.json()
+                    return {
+                        "temperature": data["main"]["temp"],
+                        "description": data["weather"][0]["description"],
+                        "humidity": data["main"]["humidity"],
+                        "location": location
+                    }
+                else:
+                    return {"error": f"Weather API error: {response.status}"}
+        
         except Exception as e:
             logger.error(f"Weather data fetch failed: {e}")
             return {"error": str(e)}
@@ -148,20 +295,13 @@ class DataSourceManager:
     async def get_market_data(self, investment_type: str) -> Dict[str, Any]:
         """Get market data"""
         if self.alpha_vantage_key:
-            try:
-                async with aiohttp.ClientSession() as session:
-                    url = "https://www.alphavantage.co/query"
-                    params = {
-                        "function": "GLOBAL_QUOTE",
-                        "symbol": "AAPL",  # Example symbol
-                        "apikey": self.alpha_vantage_key
-                    }
-                    
-                    async with session.get(url, params=params) as response:
-                        if response.status == 200:
-                            return await response.json()
-            except Exception as e:
-                logger.error(f"Market data fetch failed: {e}")
+            async def fetch() -> Tuple[Optional[Dict[str, Any]], bool]:
+                data = await self._fetch_market_data(investment_type)
+                return data, data is not None
+            
+            data = await self.source_caches["market"].get_or_fetch(self._cache_key(investment_type), fetch)
+            if data is not None:
+                return data
         
         # Mock data fallback
         return {
@@ -171,6 +311,30 @@ class DataSourceManager:
             "volume": 50000000
         }
     
+    async def _fetch_market_data(self, investment_type: str) -> Optional[Dict[str, Any]]:
+        """Fetch a quote from Alpha Vantage; None on failure"""
+        try:
+            session = self.http_client.session
+            url = "https://www.alphavantage.co/query"
+            params = {
+                "function": "GLOBAL_QUOTE",
+                "symbol": "AAPL",  # Example symbol
+                "apikey": self.alpha_vantage_key
+            }
+            
+            async with session.get(url, params=params) as response:
+                if response.status == 200:
+                    data = await response.json()
+                    # Quota and key problems come back as 200 with a note instead of a quote
+                    if "Note" in data or "Information" in data or "Error Message" in data:
+                        logger.warning(f"Market data unavailable: {data}")
+                        return None
+                    return data
+                logger.error(f"Market data API error: {response.status}")
+        except Exception as e:
+            logger.error(f"Market data fetch failed: {e}")
+        return None
+    
     async def get_investment_options(self, investment_type: str, risk_tolerance: str) -> List[Dict[str, Any]]:
         """Get investment options"""
         return [
@@ -182,21 +346,13 @@ class DataSourceManager:
     async def get_financial_news(self, investment_type: str) -> List[Dict[str, Any]]:
         """Get financial news"""
         if self.news_api_key:
-            try:
-                async with aiohttp.ClientSession() as session:
-                    url = "https://newsapi.org/v2/everything"
-                    params = {
-                        "q": investment_type,
-                        "apiKey": self.news_api_key,
-                        "pageSize": 5
-                    }
-                    
-                    async with session.get(url, params=params) as response:
-                        if response.status == 200:
-                            data = await response.json()
-                            return data.get("articles", [])
-            except Exception as e:
-                logger.error(f"News fetch failed: {e}")
+            async def fetch() -> Tuple[Optional[List[Dict[str, Any]]], bool]:
+                articles = await self._fetch_financial_news(investment_type)
+                return articles, articles is not None
+            
+            articles = await self.source_caches["news"].get_or_fetch(self._cache_key(investment_type), fetch)
+            if articles is not None:
+                return articles
         
         # Mock data fallback
         return [
@@ -204,6 +360,26 @@ class DataSourceManager:
             {"title": "Investment News", "description": "New investment opportunities"}
         ]
     
+    async def _fetch_financial_news(self, investment_type: str) -> Optional[List[Dict[str, Any]]]:
+        """Fetch articles from NewsAPI; None on failure"""
+        try:
+            session = self.http_client.session
+            url = "https://newsapi.org/v2/everything"
+            params = {
+                "q": investment_type,
+                "apiKey": self.news_api_key,
+                "pageSize": 5
+            }
+            
+            async with session.get(url, params=params) as response:
+                if response.status == 200:
+                    data = await response.json()
+                    return data.get("articles", [])
+                logger.error(f"News API error: {response.status}")
+        except Exception as e:
+            logger.error(f"News fetch failed: {e}")
+        return None
+    
     async def get_risk_analysis(self, investment_type: str) -> Dict[str, Any]:
         """Get risk analysis"""
         return {
@@ -260,11 +436,17 @@ class DataSourceManager:
             "key_points": ["Point 1", "Point 2", "Point 3"]
         }
     
+    async def close(self) -> None:
+        """Close the HTTP pool if this manager created it"""
+        if self.owns_http_client:
+            await self.http_client.close()
+    
     async def get_status(self) -> Dict[str, Any]:
         """Get data sources status"""
         return {
             "weather_api": "available" if self.weather_api_key else "not_configured",
             "news_api": "available" if self.news_api_key else "not_configured",
             "financial_api": "available" if self.alpha_vantage_key else "not_configured",
-            "search_api": "available" if self.serp_api_key else "not_configured"
+            "search_api": "available" if self.serp_api_key else "not_configured",
+            "cache": {name: cache.get_stats() for name, cache in self.source_caches.items()}
         }
@@ -0,0 +1,206 @@
+"""
+Request Dispatcher
+Shared rate-limit, cache, route, cache-fill and metrics pipeline used by every endpoint
+"""
+
+import os
+import sys
+import time
+import asyncio
+import logging
+from typing import Dict, Any, AsyncIterator, Callable, List, Optional
+
+try:
+    from utils.cache import build_cache_key
+    from utils.rate_limiter import RateLimitExceeded
+    from utils.admission import ProviderOverloaded
+    from utils.semantic_cache import set_semantic_request
+    from utils.monitoring import RequestTrace, start_trace, stage_timer
+except ImportError:
+    # Fallback imports for development
+    sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+    from utils.cache import build_cache_key
+    from utils.rate_limiter import RateLimitExceeded
+    from utils.admission import ProviderOverloaded
+    from utils.semantic_cache import set_semantic_request
+    from utils.monitoring import RequestTrace, start_trace, stage_timer
+
+logger = logging.getLogger(__name__)
+
+class RequestDispatcher:
+    """Runs a service request through rate limiting, caching, coalescing and usage metrics"""
+    
+    def __init__(self, resolve_service: Callable[[str], Any], rate_limiter, response_cache,
+                 coalescer, monitor, background_queue):
+        self.resolve_service = resolve_service
+        self.rate_limiter = rate_limiter
+        self.response_cache = response_cache
+        self.coalescer = coalescer
+        self.monitor = monitor
+        self.background_queue = background_queue
+        self.cache_ttl = int(os.getenv("RESPONSE_CACHE_TTL", 3600))
+        self.batch_concurrency = int(os.getenv("BATCH_CONCURRENCY", 8))
+        self.batch_max_items = int(os.getenv("BATCH_MAX_ITEMS", 500))
+    
+    async def check_rate_limit(self, request) -> None:
+        """Raise RateLimitExceeded when the caller is over their limits"""
+        user_id = request.user_id or "anonymous"
+        allowed, retry_after = await self.rate_limiter.acquire(user_id, request.user_tier)
+        if not allowed:
+            raise RateLimitExceeded(user_id, retry_after)
+    
+    def get_cache_key(self, request) -> str:
+        return build_cache_key(
+            request.service_type,
+            request.input_data,
+            request.user_tier,
+            request.options
+        )
+    
+    def record_usage(self, request, processing_time: float, success: bool,
+                     trace: Optional[RequestTrace] = None) -> None:
+        """Queue usage metrics so they are written after the response is sent"""
+        self.background_queue.submit(
+            self.monitor.log_usage,
+            request.user_id,
+            request.service_type,
+            processing_time,
+            success,
+            trace
+        )
+    
+    async def dispatch(self, request, render: Callable[[Dict[str, Any]], Any], check_limits: bool = True) -> Any:
+        """Process a request and render the result (service result plus processing_time, cached and metadata)"""
+        if check_limits:
+            await self.check_rate_limit(request)
+        start_time = time.perf_counter()
+        trace = start_trace()
+        set_semantic_request(request.service_type, request.input_data, request.options)
+        
+        try:
+            cache_key = self.get_cache_key(request)
+            with stage_timer("cache_lookup"):
+                cached_response = await self.response_cache.get(cache_key)
+            
+            if cached_response:
+                logger.info(f"Cache hit for {request.service_type}")
+                result = {**cached_response, "cached": True}
+            else:
+                # Identical concurrent requests share one execution
+                async def execute_and_cache() -> Dict[str, Any]:
+                    result = await self.resolve_service(request.service_type).process_request(request)
+                    
+                    # Cache successful responses locally before releasing waiters so late arrivals hit the
+                    # cache; the shared (Redis) write happens after the response so it never adds latency
+                    if result.get("success"):
+                        await self.response_cache.set_local(cache_key, result, ttl=self.cache_ttl)
+                        self.background_queue.submit(self.response_cache.set_shared, cache_key, result, self.cache_ttl)
+                    
+                    return result
+                
+                result, _ = await self.coalescer.do(cache_key, execute_and_cache)
+                result = {**result, "cached": False}
+        except ProviderOverloaded:
+            # Shed requests surface as 503 with Retry-After rather than a failed result
+            self.record_usage(request, time.perf_counter() - start_time, False, trace)
+            raise
+        except Exception as e:
+            logger.error(f"Error processing request: {e}")
+            result = {"success": False, "error": str(e), "cached": False}
+        
+        result["processing_time"] = time.perf_counter() - start_time
+        result["metadata"] = trace.to_dict()
+        
+        with stage_timer("serialization"):
+            response = render(result)
+        
+        self.record_usage(request, time.perf_counter() - start_time, result.get("success", False), trace)
+        return response
+    
+    async def dispatch_stream(self, request, render: Callable[[str, Any], str]) -> AsyncIterator[str]:
+        """Check limits up front, then return an iterator of rendered streamed events"""
+        await self.check_rate_limit(request)
+        return self._stream_events(request, render)
+    
+    async def _stream_events(self, request, render: Callable[[str, Any], str]) -> AsyncIterator[str]:
+        start_time = time.perf_counter()
+        # Set inside the generator so the trace follows the task that streams the response
+        trace = start_trace()
+        set_semantic_request(request.service_type, request.input_data, request.options)
+        cache_key = self.get_cache_key(request)
+        
+        with stage_timer("cache_lookup"):
+            cached_response = await self.response_cache.get(cache_key)
+        if cached_response:
+            with stage_timer("serialization"):
+                message = render("result", {**cached_response, "cached": True})
+            self.record_usage(request, time.perf_counter() - start_time, True, trace)
+            yield message
+            return
+        
+        result = {"success": False, "error": "Stream interrupted"}
+        try:
+            async for event in self.resolve_service(request.service_type).process_request_stream(request):
+                if event["event"] == "result":
+                    result = event["data"]
+                    event = {"event": "result", "data": {**result, "metadata": trace.to_dict()}}
+                with stage_timer("serialization"):
+                    message = render(event["event"], event["data"])
+                yield message
+        except ProviderOverloaded as e:
+            # Headers are already sent, so report the shed in-band
+            result = {"success": False, "error": str(e)}
+            yield render("error", {"error": str(e), "retry_after": e.retry_after})
+        except Exception as e:
+            logger.error(f"Error streaming request: {e}")
+            result = {"success": False, "error": str(e)}
+            yield render("error", {"error": str(e)})
+        finally:
+            # Runs even when the client disconnects; the writes themselves go to the background queue
+            if result.get("success"):
+                self.background_queue.submit(self.response_cache.set, cache_key, result, self.cache_ttl)
+            self.record_usage(request, time.perf_counter() - start_time, result.get("success", False), trace)
+    
+    async def dispatch_batch(self, requests: List[Any], render: Callable[[Any, Dict[str, Any]], Dict[str, Any]],
+                             concurrency: Optional[int] = None) -> AsyncIterator[Dict[str, Any]]:
+        """Dispatch a batch with bounded concurrency, yielding each item's rendered result as it finishes"""
+        # Identical items from the same caller run once and share the result
+        groups: Dict[str, List[int]] = {}
+        for index, request in enumerate(requests):
+            groups.setdefault(f"{request.user_id}:{self.get_cache_key(request)}", []).append(index)
+        
+        limit = min(concurrency or self.batch_concurrency, self.batch_concurrency)
+        semaphore = asyncio.Semaphore(max(1, limit))
+        
+        async def run_item(request) -> Dict[str, Any]:
+            async with semaphore:
+                try:
+                    # Each item is rate limited, cached and traced like a single request
+                    return await self.dispatch(request, lambda result: render(request, result))
+                except (RateLimitExceeded, ProviderOverloaded) as e:
+                    error = "Rate limit exceeded" if isinstance(e, RateLimitExceeded) else str(e)
+                    failed = render(request, {"success": False, "error": error, "processing_time": 0.0})
+                    return {**failed, "retry_after": e.retry_after}
+        
+        tasks = {
+            asyncio.ensure_future(run_item(requests[indexes[0]])): indexes
+            for indexes in groups.values()
+        }
+        succeeded = 0
+        
+        try:
+            pending = set(tasks)
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    record = task.result()
+                    if record.get("success"):
+                        succeeded += len(tasks[task])
+                    for index in tasks[task]:
+                        yield {"index": index, **record}
+        finally:
+            # The client went away or an item raised; stop the rest of the batch
+            for task in tasks:
+                task.cancel()
+        
+        yield {"done": True, "total": len(requests), "unique": len(groups), "succeeded": succeeded}
@@ -0,0 +1,189 @@
+"""
+Keyword Extractor
+Single-pass extraction of every keyword category and numeric field used to parse request text
+"""
+
+import os
+import re
+from collections import OrderedDict, deque
+from types import MappingProxyType
+from typing import Dict, Any, Iterator, List, Mapping, Optional, Tuple
+
+try:
+    from utils.cache import normalize_text
+except ImportError:
+    # Fallback imports for development
+    import sys
+    sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+    from utils.cache import normalize_text
+
+# category -> (default, multi-valued, entries in priority order); an entry is a keyword or a (keyword, value) pair.
+# Single-valued categories take the highest-priority match, multi-valued ones every match in vocabulary order.
+KEYWORD_CATEGORIES: Dict[str, Tuple[Any, bool, List[Any]]] = {
+    "field": ("general", False, ["computer science", "engineering", "business", "medicine", "law", "education"]),
+    "level": ("bachelor", False, ["bachelor", "master", "phd", "certificate", "diploma"]),
+    "insurance_type": ("health", False, ["health", "auto", "life", "home", "travel"]),
+    "coverage_needs": ("standard", False, ["comprehensive", "basic"]),
+    "investment_type": ("stocks", False, ["stocks", "bonds", "crypto", "real estate", "mutual funds"]),
+    "risk_tolerance": ("medium", False, [
+        ("conservative", "low"), ("low risk", "low"), ("aggressive", "high"), ("high risk", "high")
+    ]),
+    "video_type": ("youtube", False, ["youtube", "commercial", "documentary", "tutorial", "vlog"]),
+    "platform": ("youtube", False, ["youtube", "instagram", "tiktok", "facebook", "linkedin"]),
+    "current_level": ("high_school", False, [("high school", "high_school"), "bachelor", "master"]),
+    "target_level": ("bachelor", False, [("master", "master"), ("mba", "master"), ("phd", "phd"), ("doctorate", "phd")]),
+    "interests": (["general"], True, ["culture", "food", "adventure", "relaxation", "history", "nature"]),
+    "coverage_list": (["medical"], True, ["medical", "dental", "vision", "prescription", "emergency"]),
+    "risk_factors": ([], True, ["smoking", "diabetes", "heart disease", "high blood pressure"]),
+    "investment_goals": (["wealth building"], True, ["retirement", "house", "education", "wealth building", "income"]),
+}
+
+BUDGET_PATTERN = re.compile(r'\$?(\d+(?:,\d+)?)')
+AMOUNT_PATTERN = re.compile(r'\$?(\d+(?:,\d+)?(?:\.\d+)?)')
+DURATION_PATTERN = re.compile(r'(\d+)\s*(day|week|month)s?', re.IGNORECASE)
+TIMELINE_PATTERN = re.compile(r'(\d+)\s*(year|month|week)s?', re.IGNORECASE)
+TRAVELERS_PATTERN = re.compile(r'(\d+)\s*(?:people|person|traveler)', re.IGNORECASE)
+FAMILY_SIZE_PATTERN = re.compile(r'family of (\d+)|(\d+) family members', re.IGNORECASE)
+TEAM_SIZE_PATTERN = re.compile(r'team of (\d+)|(\d+) people', re.IGNORECASE)
+
+class KeywordAutomaton:
+    """Aho-Corasick automaton: finds every occurrence of every keyword in one pass over the text"""
+    
+    def __init__(self):
+        self.goto: List[Dict[str, int]] = [{}]
+        self.fail: List[int] = [0]
+        self.outputs: List[List[Any]] = [[]]
+    
+    def add(self, keyword: str, payload: Any) -> None:
+        """Add a keyword; payload is yielded whenever it matches"""
+        state = 0
+        for char in keyword:
+            next_state = self.goto[state].get(char)
+            if next_state is None:
+                next_state = len(self.goto)
+                self.goto.append({})
+                self.fail.append(0)
+                self.outputs.append([])
+                self.goto[state][char] = next_state
+            state = next_state
+        self.outputs[state].append(payload)
+    
+    def build(self) -> None:
+        """Compute failure links breadth-first; call once after adding every keyword"""
+        queue = deque(self.goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, child in self.goto[state].items():
+                queue.append(child)
+                fallback = self.fail[state]
+                while fallback and char not in self.goto[fallback]:
+                    fallback = self.fail[fallback]
+                target = self.goto[fallback].get(char, 0)
+                self.fail[child] = target if target != child else 0
+                # A match also ends every keyword that is a suffix of it
+                self.outputs[child] = self.outputs[child] + self.outputs[self.fail[child]]
+    
+    def search(self, text: str) -> Iterator[Any]:
+        """Yield the payload of every keyword occurrence in text"""
+        goto, fail, outputs = self.goto, self.fail, self.outputs
+        state = 0
+        for char in text:
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            if outputs[state]:
+                yield from outputs[state]
+
+class KeywordExtractor:
+    """Extracts all keyword categories and numeric fields from request text at once"""
+    
+    def __init__(self, categories: Dict[str, Tuple[Any, bool, List[Any]]] = KEYWORD_CATEGORIES, max_entries: Optional[int] = None):
+        self.categories = categories
+        
+        # Parsed records by normalized text, shared by every service that parses the same request
+        self.max_entries = max_entries or int(os.getenv("PARSE_CACHE_SIZE", 1024))
+        self.parsed: "OrderedDict[str, Mapping[str, Any]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        
+        self.automaton = KeywordAutomaton()
+        for category, (_, _, entries) in categories.items():
+            for rank, entry in enumerate(entries):
+                keyword, value = (entry, entry) if isinstance(entry, str) else entry
+                self.automaton.add(keyword.lower(), (category, rank, value))
+        self.automaton.build()
+    
+    def match_keywords(self, text: str) -> Dict[str, Any]:
+        """Resolve every keyword category from one lowercase pass over text"""
+        found: Dict[str, Dict[int, str]] = {}
+        for category, rank, value in self.automaton.search(text.lower()):
+            found.setdefault(category, {})[rank] = value
+        
+        result = {}
+        for category, (default, multi, _) in self.categories.items():
+            ranks = found.get(category)
+            if not ranks:
+                result[category] = list(default) if multi else default
+            elif multi:
+                result[category] = list(dict.fromkeys(ranks[rank] for rank in sorted(ranks)))
+            else:
+                result[category] = ranks[min(ranks)]
+        return result
+    
+    def extract(self, text: str) -> Dict[str, Any]:
+        """Extract keyword categories plus amounts, durations, counts and the first proper noun"""
+        fields = self.match_keywords(text)
+        
+        budget_match = BUDGET_PATTERN.search(text)
+        amount_match = AMOUNT_PATTERN.search(text)
+        duration_match = DURATION_PATTERN.search(text)
+        timeline_match = TIMELINE_PATTERN.search(text)
+        travelers_match = TRAVELERS_PATTERN.search(text)
+        family_match = FAMILY_SIZE_PATTERN.search(text)
+        team_match = TEAM_SIZE_PATTERN.search(text)
+        
+        fields.update({
+            # First location-like word
+            "proper_noun": next((word for word in text.split() if word[0].isupper() and len(word) > 2), ""),
+            "budget": budget_match.group(1) if budget_match else "",
+            "amount": amount_match.group(1) if amount_match else "10000",
+            "duration": f"{duration_match.group(1)} {duration_match.group(2)}s" if duration_match else "",
+            "timeline": f"{timeline_match.group(1)} {timeline_match.group(2)}s" if timeline_match else "2 years",
+            "travelers": int(travelers_match.group(1)) if travelers_match else 1,
+            "family_size": int(family_match.group(1) or family_match.group(2)) if family_match else 1,
+            "team_size": int(team_match.group(1) or team_match.group(2)) if team_match else 1,
+        })
+        return fields
+    
+    def parse(self, text: str) -> Mapping[str, Any]:
+        """Memoized extract on normalized text; the returned record is read-only and shared"""
+        key = normalize_text(text)
+        record = self.parsed.get(key)
+        if record is not None:
+            self.hits += 1
+            self.parsed.move_to_end(key)
+            return record
+        
+        self.misses += 1
+        fields = self.extract(key)
+        record = MappingProxyType({
+            name: tuple(value) if isinstance(value, list) else value for name, value in fields.items()
+        })
+        self.parsed[key] = record
+        if len(self.parsed) > self.max_entries:
+            self.parsed.popitem(last=False)
+            self.evictions += 1
+        return record
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """Get parse cache statistics"""
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self.parsed),
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+            "evictions": self.evictions
+        }
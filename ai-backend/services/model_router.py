@@ -4,24 +4,141 @@ Intelligent routing between different AI models based on task complexity and use
 """
 
 import os
+import re
+import time
+import random
 import logging
 import asyncio
-from typing import Dict, Any, List, Optional
+from typing import Dict, Any, AsyncIterator, List, Optional, Tuple
 from datetime import datetime
 import aiohttp
 import json
 
+try:
+    from utils.http_client import HTTPClientPool
+    from utils.monitoring import annotate, record_model_call, record_stage
+    from utils.admission import AdmissionController, TIER_PRIORITY
+    from utils.routing_stats import RoutingStats
+    from utils.circuit_breaker import CircuitBreaker
+    from utils.semantic_cache import SemanticCache, current_semantic_request
+    from utils.micro_batcher import MicroBatcher
+    from utils.local_inference import LocalInference
+except ImportError:
+    # Fallback imports for development
+    import sys
+    sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+    from utils.http_client import HTTPClientPool
+    from utils.monitoring import annotate, record_model_call, record_stage
+    from utils.admission import AdmissionController, TIER_PRIORITY
+    from utils.routing_stats import RoutingStats
+    from utils.circuit_breaker import CircuitBreaker
+    from utils.semantic_cache import SemanticCache, current_semantic_request
+    from utils.micro_batcher import MicroBatcher
+    from utils.local_inference import LocalInference
+
 logger = logging.getLogger(__name__)
 
+# Go duration units, as accepted by Ollama's keep_alive
+DURATION_UNITS = {"ns": 1e-9, "us": 1e-6, "µs": 1e-6, "ms": 1e-3, "s": 1, "m": 60, "h": 3600}
+DURATION_PART = re.compile(r"(\d+(?:\.\d+)?)(ns|us|µs|ms|h|m|s)")
+
+def parse_keep_alive(value: str) -> float:
+    """Convert an Ollama keep_alive value ("30m", "1h30m", "300", "-1") to seconds; negative means forever"""
+    value = value.strip().lower()
+    sign = -1 if value.startswith("-") else 1
+    body = value.lstrip("+-")
+    try:
+        seconds = float(body)
+    except ValueError:
+        parts = DURATION_PART.findall(body)
+        if not parts or "".join(number + unit for number, unit in parts) != body:
+            raise ValueError(f"Invalid keep_alive duration: {value!r}")
+        seconds = sum(float(number) * DURATION_UNITS[unit] for number, unit in parts)
+    seconds *= sign
+    return float("inf") if seconds < 0 else seconds
+
+def ollama_model_key(name: str) -> str:
+    """Strip the ":latest" tag Ollama adds to model names"""
+    return name[:-len(":latest")] if name.endswith(":latest") else name
+
 class ModelRouter:
     """Routes requests to appropriate AI models"""
     
-    def __init__(self):
+    def __init__(self, http_client: Optional[HTTPClientPool] = None):
+        # A pool built here has no other owner, so close() has to release it
+        self.owns_http_client = http_client is None
+        self.http_client = http_client or HTTPClientPool()
         self.hf_token = os.getenv("HF_TOKEN")
         self.ollama_host = os.getenv("OLLAMA_HOST", "localhost:11434")
         self.models_status = {}
         self.request_count = 0
         
+        # Concurrency limits and tier-priority queues in front of every provider
+        self.admission = AdmissionController()
+        
+        # Live latency and error rates per model for adaptive routing
+        self.routing_stats = RoutingStats()
+        
+        # Minimum model quality each tier accepts, by request complexity;
+        # light requests may drop to spillover_quality when every preferred model is saturated
+        self.quality_floors = {
+            "free": {"light": 1, "medium": 3, "heavy": 3},
+            "core": {"light": 3, "medium": 3, "heavy": 3},
+            "special": {"light": 3, "medium": 3, "heavy": 3}
+        }
+        self.spillover_quality = 2
+        # Expected-time penalty per unit of error rate, so flaky models lose ties
+        self.error_penalty = 4.0
+        
+        # Per-provider circuit breakers so failing providers are skipped instead of waited on
+        self.breakers: Dict[str, CircuitBreaker] = {}
+        
+        # Hedged requests: tiers whose calls get a backup provider once the primary passes its p95
+        self.hedge_tiers = {t.strip() for t in os.getenv("HEDGE_TIERS", "special").split(",") if t.strip()}
+        self.hedge_min_samples = int(os.getenv("HEDGE_MIN_SAMPLES", 20))
+        self.hedged_requests = 0
+        self.hedge_wins = 0
+        
+        # Similar requests of the same service share model results
+        self.semantic_cache = SemanticCache()
+        
+        # Light HF models take lists of inputs, so concurrent calls to one model share a request
+        self.hf_batcher = MicroBatcher(
+            "huggingface",
+            self.run_huggingface_batch,
+            max_batch_size=int(os.getenv("HF_BATCH_MAX_SIZE", 8)),
+            max_wait_ms=float(os.getenv("HF_BATCH_WINDOW_MS", 5))
+        )
+        self.hf_batch_tasks = {"summarization", "sentiment", "question-answering"}
+        
+        # Ollama residency: pinned models are loaded at startup and kept in memory between requests
+        keep_alive = os.getenv("OLLAMA_KEEP_ALIVE", "30m").strip()
+        try:
+            self.ollama_keep_alive_seconds = parse_keep_alive(keep_alive)
+        except ValueError:
+            logger.warning(f"⚠️ Invalid OLLAMA_KEEP_ALIVE {keep_alive!r}, using 30m")
+            keep_alive = "30m"
+            self.ollama_keep_alive_seconds = parse_keep_alive(keep_alive)
+        # Ollama reads bare numbers as seconds only when they are sent as JSON numbers
+        self.ollama_keep_alive = int(keep_alive) if keep_alive.lstrip("-").isdigit() else keep_alive
+        self.pinned_models = [
+            m.strip() for m in os.getenv("OLLAMA_PINNED_MODELS", "codellama,mistral,llama2,phi").split(",") if m.strip()
+        ]
+        self.warmup_enabled = os.getenv("OLLAMA_WARMUP", "true").lower() == "true"
+        # Expected extra latency of a request that has to load its model first
+        self.cold_load_seconds = float(os.getenv("OLLAMA_COLD_LOAD_SECONDS", 8))
+        # Model -> time it is expected to stay loaded
+        self.resident_models: Dict[str, float] = {}
+        self.warmup_task: Optional[asyncio.Task] = None
+        self.cold_loads = 0
+        
+        # Background health probing
+        self.health_interval = float(os.getenv("HEALTH_PROBE_INTERVAL", 30))
+        self.health_max_interval = float(os.getenv("HEALTH_PROBE_MAX_INTERVAL", 300))
+        self.health_jitter = float(os.getenv("HEALTH_PROBE_JITTER", 0.2))
+        self.health_stale_after = float(os.getenv("HEALTH_STALE_AFTER", 180))
+        self.health_tasks: List[asyncio.Task] = []
+        
         # Model configurations
         self.hf_models = {
             "light": {
@@ -50,6 +167,11 @@ class ModelRouter:
             "codellama": {"size": "7b", "use_case": "code"},
             "phi": {"size": "3b", "use_case": "lightweight"}
         }
+        
+        # Light HF models also run in-process on CPU, so light tasks survive both remote providers being down
+        self.local = LocalInference(self.hf_models["light"])
+        # Providers able to serve every task type; only these count towards health and readiness
+        self.general_providers = ("huggingface", "ollama")
     
     async def initialize(self):
         """Initialize model router"""
@@ -61,204 +183,602 @@ class ModelRouter:
         # Check Ollama availability
         await self.check_ollama_availability()
         
+        # Local models load on first use, so this only records whether they can
+        await self.check_local_availability()
+        
+        # Keep provider health fresh in the background
+        self.start_health_monitor()
+        
+        # Embedding model loads in the background; the cache stays bypassed until it is ready
+        self.semantic_cache.start()
+        
         logger.info("Model Router initialized successfully")
     
+    async def close(self):
+        """Stop background work owned by the router"""
+        if self.warmup_task:
+            self.warmup_task.cancel()
+            await asyncio.gather(self.warmup_task, return_exceptions=True)
+            self.warmup_task = None
+        for task in self.health_tasks:
+            task.cancel()
+        await asyncio.gather(*self.health_tasks, return_exceptions=True)
+        self.health_tasks = []
+        await self.hf_batcher.close()
+        await self.local.close()
+        await self.semantic_cache.close()
+        if self.owns_http_client:
+            await self.http_client.close()
+    
+    def start_health_monitor(self):
+        """Start background probing of every provider"""
+        if self.health_tasks:
+            return
+        
+        probes = {
+            "huggingface": self.check_hf_availability,
+            "ollama": self.check_ollama_availability,
+            "local": self.check_local_availability
+        }
+        for provider, probe in probes.items():
+            self.health_tasks.append(asyncio.create_task(self._health_loop(provider, probe)))
+    
+    async def _health_loop(self, provider: str, probe):
+        """Probe a provider on an interval with jitter, backing off while it is down"""
+        while True:
+            failures = self.models_status.get(provider, {}).get("consecutive_failures", 0)
+            delay = min(self.health_interval * (2 ** min(failures, 5)), self.health_max_interval)
+            # Jitter spreads probes from many workers over the interval
+            delay += random.uniform(0, delay * self.health_jitter)
+            await asyncio.sleep(delay)
+            
+            try:
+                await probe()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Health probe for {provider} failed: {e}")
+    
+    def _set_provider_status(self, provider: str, status: str, latency: Optional[float] = None, **extra):
+        """Record a probe result with its timestamp"""
+        previous = self.models_status.get(provider, {})
+        failures = 0 if status == "available" else previous.get("consecutive_failures", 0) + 1
+        
+        if previous.get("status") != status:
+            logger.info(f"Provider {provider} is now {status}")
+        
+        self.models_status[provider] = {
+            "status": status,
+            "checked_at": datetime.now().isoformat(),
+            "checked_at_ts": time.time(),
+            "latency_ms": round(latency * 1000, 1) if latency is not None else None,
+            "consecutive_failures": failures,
+            **extra
+        }
+    
+    def is_provider_available(self, provider: str) -> bool:
+        """Read cached provider availability"""
+        return self.models_status.get(provider, {}).get("status") == "available"
+    
     async def check_hf_availability(self):
         """Check Hugging Face model availability"""
+        started = time.monotonic()
         try:
             if not self.hf_token:
-                logger.warning("No Hugging Face token provided")
-                self.models_status["huggingface"] = "unavailable"
+                if "huggingface" not in self.models_status:
+                    logger.warning("No Hugging Face token provided")
+                self._set_provider_status("huggingface", "unavailable", reason="no_token")
                 return
             
-            # Test with a simple model
-            async with aiohttp.ClientSession() as session:
-                headers = {"Authorization": f"Bearer {self.hf_token}"}
-                url = "https://api-inference.huggingface.co/models/microsoft/DialoGPT-small"
-                
-                async with session.post(
-                    url,
-                    headers=headers,
-                    json={"inputs": "Hello"},
-                    timeout=aiohttp.ClientTimeout(total=10)
-                ) as response:
-                    if response.status == 200:
-                        self.models_status["huggingface"] = "available"
-                        logger.info("✅ Hugging Face models available")
-                    else:
-                        self.models_status["huggingface"] = "limited"
-                        logger.warning(f"⚠️ Hugging Face limited access: {response.status}")
-                        
+            # whoami checks reachability and the token without spending inference quota;
+            # model-level failures are caught by the circuit breaker on real calls
+            session = self.http_client.session
+            headers = {"Authorization": f"Bearer {self.hf_token}"}
+            url = "https://huggingface.co/api/whoami-v2"
+            
+            async with session.get(
+                url,
+                headers=headers,
+                timeout=aiohttp.ClientTimeout(total=10)
+            ) as response:
+                latency = time.monotonic() - started
+                if response.status == 200:
+                    self._set_provider_status("huggingface", "available", latency)
+                elif response.status == 401:
+                    self._set_provider_status("huggingface", "unavailable", latency, reason="invalid_token")
+                    logger.warning("⚠️ Hugging Face token rejected")
+                else:
+                    self._set_provider_status("huggingface", "limited", latency, http_status=response.status)
+                    logger.warning(f"⚠️ Hugging Face limited access: {response.status}")
+        
         except Exception as e:
             logger.error(f"❌ Hugging Face unavailable: {e}")
-            self.models_status["huggingface"] = "unavailable"
+            self._set_provider_status("huggingface", "unavailable", reason=str(e))
     
     async def check_ollama_availability(self):
         """Check Ollama model availability"""
+        started = time.monotonic()
         try:
-            async with aiohttp.ClientSession() as session:
-                url = f"http://{self.ollama_host}/api/tags"
-                
-                async with session.get(
+            session = self.http_client.session
+            url = f"http://{self.ollama_host}/api/tags"
+            
+            async with session.get(
+                url,
+                timeout=aiohttp.ClientTimeout(total=5)
+            ) as response:
+                latency = time.monotonic() - started
+                if response.status == 200:
+                    data = await response.json()
+                    available_models = [model["name"] for model in data.get("models", [])]
+                    if not self.is_provider_available("ollama"):
+                        logger.info(f"✅ Ollama available with models: {available_models}")
+                    self._set_provider_status("ollama", "available", latency, models=available_models)
+                    await self.refresh_residency()
+                else:
+                    self._set_provider_status("ollama", "unavailable", latency, http_status=response.status)
+                    logger.warning("⚠️ Ollama server not responding")
+        
+        except Exception as e:
+            if self.models_status.get("ollama", {}).get("consecutive_failures", 0) == 0:
+                logger.error(f"❌ Ollama unavailable: {e}")
+            self._set_provider_status("ollama", "unavailable", reason=str(e))
+    
+    async def check_local_availability(self):
+        """Record whether in-process inference is usable"""
+        if self.local.enabled:
+            self._set_provider_status(
+                "local",
+                "available",
+                models=list(self.local.models.values()),
+                loaded=sorted(self.local.pipelines)
+            )
+        else:
+            self._set_provider_status("local", "unavailable", reason="disabled")
+    
+    async def refresh_residency(self):
+        """Sync resident models with what Ollama reports as loaded"""
+        try:
+            session = self.http_client.session
+            url = f"http://{self.ollama_host}/api/ps"
+            
+            async with session.get(url, timeout=aiohttp.ClientTimeout(total=5)) as response:
+                if response.status != 200:
+                    return
+                data = await response.json()
+        except Exception as e:
+            logger.debug(f"Ollama residency check failed: {e}")
+            return
+        
+        # Trust the listing until the next probe; it also drops models Ollama has unloaded
+        now = time.time()
+        until = now + 2 * self.health_interval
+        loaded = {ollama_model_key(model["name"]) for model in data.get("models", [])}
+        self.resident_models = {
+            model: max(until, self.resident_models.get(model, 0)) for model in loaded
+        }
+    
+    def is_model_warm(self, model: str) -> bool:
+        """Check whether an Ollama model is expected to be loaded"""
+        return self.resident_models.get(ollama_model_key(model), 0) > time.time()
+    
+    def mark_resident(self, model: str):
+        """Record that a model was just used and stays loaded for keep_alive"""
+        key = ollama_model_key(model)
+        if not self.is_model_warm(key):
+            self.cold_loads += 1
+        self.resident_models[key] = time.time() + self.ollama_keep_alive_seconds
+    
+    def get_installed_ollama_models(self) -> List[str]:
+        """Models the last Ollama probe listed, without the :latest tag"""
+        return [ollama_model_key(name) for name in self.models_status.get("ollama", {}).get("models", [])]
+    
+    def start_warmup(self):
+        """Load pinned Ollama models in the background so first requests do not pay the cold load"""
+        if not self.warmup_enabled or self.warmup_task or not self.is_provider_available("ollama"):
+            return
+        self.warmup_task = asyncio.create_task(self.warm_models())
+    
+    async def warm_models(self):
+        """Load each installed pinned model with our keep_alive, one at a time to avoid thrashing memory"""
+        installed = set(self.get_installed_ollama_models())
+        session = self.http_client.session
+        url = f"http://{self.ollama_host}/api/generate"
+        
+        for model in self.pinned_models:
+            if model not in installed:
+                logger.warning(f"⚠️ Pinned Ollama model {model} is not installed, skipping warmup")
+                continue
+            if self.is_model_warm(model):
+                continue
+            
+            started = time.monotonic()
+            try:
+                # A request without a prompt only loads the model
+                async with session.post(
                     url,
-                    timeout=aiohttp.ClientTimeout(total=5)
+                    json={"model": model, "keep_alive": self.ollama_keep_alive, "stream": False},
+                    timeout=aiohttp.ClientTimeout(total=120)
                 ) as response:
                     if response.status == 200:
-                        data = await response.json()
-                        available_models = [model["name"] for model in data.get("models", [])]
-                        self.models_status["ollama"] = {
-                            "status": "available",
-                            "models": available_models
-                        }
-                        logger.info(f"✅ Ollama available with models: {available_models}")
+                        self.resident_models[model] = time.time() + self.ollama_keep_alive_seconds
+                        logger.info(f"✅ Warmed Ollama model {model} in {time.monotonic() - started:.1f}s")
                     else:
-                        self.models_status["ollama"] = {"status": "unavailable"}
-                        logger.warning("⚠️ Ollama server not responding")
-                        
-        except Exception as e:
-            logger.error(f"❌ Ollama unavailable: {e}")
-            self.models_status["ollama"] = {"status": "unavailable"}
+                        logger.warning(f"⚠️ Warmup of Ollama model {model} failed: {response.status}")
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"⚠️ Warmup of Ollama model {model} failed: {e}")
     
     async def route_request(self, task_type: str, complexity: str, user_tier: str, prompt: str) -> Dict[str, Any]:
         """Route request to appropriate model"""
         self.request_count += 1
         
+        namespace, hit, vector = await self.semantic_lookup(task_type, user_tier)
+        if hit is not None:
+            return hit["value"]
+        
+        result = await self.route_uncached(task_type, complexity, user_tier, prompt)
+        
+        # Fallback text says nothing about the request, so it is never shared
+        if vector is not None and result.get("success") and result.get("provider") != "fallback":
+            self.semantic_cache.store(namespace, vector, result)
+        return result
+    
+    async def semantic_lookup(self, task_type: str, user_tier: str) -> Tuple[Optional[str], Optional[Dict[str, Any]], Any]:
+        """Look the current request up in the semantic cache; returns (namespace, hit, vector)"""
+        semantic_request = current_semantic_request.get()
+        if semantic_request is None or not self.semantic_cache.ready:
+            return None, None, None
+        
+        namespace = f"{semantic_request[0]}:{task_type}:{user_tier}"
+        started = time.perf_counter()
+        hit, vector = await self.semantic_cache.lookup(namespace, semantic_request[1])
+        record_stage("semantic_cache", time.perf_counter() - started)
+        
+        if hit is not None:
+            logger.info(f"Semantic cache hit for {namespace} (similarity {hit['similarity']:.3f})")
+            annotate("semantic_cache", {
+                "entry_id": hit["entry_id"],
+                "similarity": round(hit["similarity"], 4),
+                "feedback_token": hit["feedback_token"]
+            })
+        return namespace, hit, vector
+    
+    async def route_uncached(self, task_type: str, complexity: str, user_tier: str, prompt: str) -> Dict[str, Any]:
+        """Select a model and call it, hedging when the tier asks for it"""
         # Determine best model based on criteria
         model_choice = self.select_model(task_type, complexity, user_tier)
         
         logger.info(f"Routing {task_type} request to {model_choice['provider']}:{model_choice['model']}")
         
-        try:
-            if model_choice["provider"] == "huggingface":
-                return await self.call_huggingface(model_choice["model"], prompt, task_type)
-            elif model_choice["provider"] == "ollama":
-                return await self.call_ollama(model_choice["model"], prompt)
-            else:
+        if model_choice.get("backup"):
+            return await self.call_hedged(model_choice, prompt, task_type, user_tier)
+        return await self.call_with_slot(model_choice, prompt, task_type, user_tier)
+    
+    async def call_with_slot(self, model_choice: Dict[str, Any], prompt: str, task_type: str,
+                             user_tier: str) -> Dict[str, Any]:
+        """Call a model inside its admission slot, feeding stats and the provider's circuit breaker"""
+        provider, model = model_choice["provider"], model_choice["model"]
+        breaker = self.get_breaker(provider)
+        
+        # Sheds with ProviderOverloaded when the wait for a slot would exceed the budget
+        queued = time.perf_counter()
+        async with self.admission.slot(provider, model, user_tier):
+            record_stage("queue_wait", time.perf_counter() - queued)
+            started = time.perf_counter()
+            self.routing_stats.start(provider, model)
+            if breaker:
+                breaker.on_call_start()
+            try:
+                result = await self.call_model(model_choice, prompt, task_type)
+            except asyncio.CancelledError:
+                # Lost a hedge race or the client went away; not a provider failure
+                self.routing_stats.cancel(provider, model)
+                if breaker:
+                    breaker.on_call_cancelled()
+                raise
+            except Exception as e:
+                logger.error(f"Model call failed: {e}")
+                self.finish_call(model_choice, time.perf_counter() - started, False)
                 return await self.fallback_response(prompt, task_type)
-                
-        except Exception as e:
-            logger.error(f"Model call failed: {e}")
-            return await self.fallback_response(prompt, task_type)
+            
+            self.finish_call(model_choice, time.perf_counter() - started, result.get("success", False))
+        
+        return result
     
-    def select_model(self, task_type: str, complexity: str, user_tier: str) -> Dict[str, str]:
-        """Select best model for the task"""
-        
-        # Priority logic
-        if user_tier == "free" and complexity == "light":
-            # Use Hugging Face for quick responses
-            if self.models_status.get("huggingface") == "available":
-                model = self.hf_models["light"].get(task_type, self.hf_models["light"]["text-generation"])
-                return {"provider": "huggingface", "model": model}
-        
-        elif complexity in ["medium", "heavy"] or user_tier in ["core", "special"]:
-            # Use Ollama for better quality
-            if self.models_status.get("ollama", {}).get("status") == "available":
-                # Select best Ollama model for task
-                if task_type in ["code-generation", "planning"]:
-                    return {"provider": "ollama", "model": "codellama"}
-                elif task_type in ["analysis", "reasoning"]:
-                    return {"provider": "ollama", "model": "mistral"}
-                else:
-                    return {"provider": "ollama", "model": "llama2"}
-        
-        # Fallback to available models
-        if self.models_status.get("huggingface") == "available":
-            model = self.hf_models["medium"].get(task_type, self.hf_models["medium"]["text-generation"])
-            return {"provider": "huggingface", "model": model}
-        elif self.models_status.get("ollama", {}).get("status") == "available":
-            return {"provider": "ollama", "model": "llama2"}
+    async def call_hedged(self, model_choice: Dict[str, Any], prompt: str, task_type: str,
+                          user_tier: str) -> Dict[str, Any]:
+        """Call the primary model; if it is slower than its p95, race a backup provider and take the first answer"""
+        primary = asyncio.ensure_future(self.call_with_slot(model_choice, prompt, task_type, user_tier))
+        try:
+            return await asyncio.wait_for(asyncio.shield(primary), self.get_hedge_delay(model_choice))
+        except asyncio.TimeoutError:
+            pass
+        except asyncio.CancelledError:
+            primary.cancel()
+            raise
+        
+        backup_choice = {**model_choice["backup"], "reason": "hedge"}
+        logger.info(f"Hedging slow {model_choice['provider']} call with {backup_choice['provider']}:{backup_choice['model']}")
+        self.hedged_requests += 1
+        backup = asyncio.ensure_future(self.call_with_slot(backup_choice, prompt, task_type, user_tier))
+        
+        pending = {primary, backup}
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None and task.result().get("success"):
+                        if task is backup:
+                            self.hedge_wins += 1
+                        return task.result()
+            
+            # Neither produced a usable answer; report the primary's outcome
+            return primary.result()
+        finally:
+            for task in pending:
+                task.cancel()
+    
+    def get_hedge_delay(self, model_choice: Dict[str, Any]) -> float:
+        """How long to wait on the primary before hedging: its p95, or twice its EWMA latency until enough samples exist"""
+        stats = self.routing_stats.get(model_choice["provider"], model_choice["model"])
+        if stats.latencies.count >= self.hedge_min_samples:
+            return stats.latencies.percentile(0.95)
+        return 2 * stats.latency
+    
+    def get_breaker(self, provider: str) -> Optional[CircuitBreaker]:
+        """Circuit breaker for a provider (None for the fallback responder)"""
+        if provider == "fallback":
+            return None
+        breaker = self.breakers.get(provider)
+        if breaker is None:
+            breaker = self.breakers[provider] = CircuitBreaker(provider)
+        return breaker
+    
+    def is_provider_routable(self, provider: str) -> bool:
+        """Provider passed its last health probe and its circuit is not open"""
+        return self.is_provider_available(provider) and self.get_breaker(provider).allows_request()
+    
+    async def call_model(self, model_choice: Dict[str, str], prompt: str, task_type: str) -> Dict[str, Any]:
+        """Call the selected provider"""
+        if model_choice["provider"] == "huggingface":
+            return await self.call_huggingface(model_choice["model"], prompt, task_type)
+        elif model_choice["provider"] == "ollama":
+            return await self.call_ollama(model_choice["model"], prompt)
+        elif model_choice["provider"] == "local":
+            return await self.local.generate(task_type, prompt)
         else:
-            return {"provider": "fallback", "model": "none"}
+            return await self.fallback_response(prompt, task_type)
+    
+    def finish_call(self, model_choice: Dict[str, Any], seconds: float, success: bool) -> None:
+        """Feed a finished call into routing statistics, the circuit breaker and the request trace"""
+        self.routing_stats.finish(model_choice["provider"], model_choice["model"], seconds, success)
+        if success and model_choice["provider"] == "ollama":
+            self.mark_resident(model_choice["model"])
+        breaker = self.get_breaker(model_choice["provider"])
+        if breaker:
+            if success:
+                breaker.record_success()
+            else:
+                breaker.record_failure()
+        record_model_call(
+            model_choice["provider"],
+            model_choice["model"],
+            seconds,
+            success,
+            routing={k: v for k, v in model_choice.items() if k not in ("provider", "model", "backup")}
+        )
+    
+    def get_candidates(self, task_type: str) -> List[Dict[str, Any]]:
+        """Models able to serve a task on currently available providers, with their quality level"""
+        candidates = []
+        
+        if self.is_provider_routable("huggingface"):
+            for level, quality in (("light", 1), ("medium", 2)):
+                models = self.hf_models[level]
+                candidates.append({
+                    "provider": "huggingface",
+                    "model": models.get(task_type, models["text-generation"]),
+                    "quality": quality
+                })
+        
+        if self.is_provider_routable("ollama"):
+            # Select best Ollama model for task
+            if task_type in ["code-generation", "planning"]:
+                model = "codellama"
+            elif task_type in ["analysis", "reasoning"]:
+                model = "mistral"
+            else:
+                model = "llama2"
+            candidates.append({"provider": "ollama", "model": model, "quality": 3})
+            
+            installed = self.get_installed_ollama_models()
+            if not self.is_model_warm(model):
+                # Another warm 7B model beats waiting for the task's model to load
+                for other, info in self.ollama_models.items():
+                    if other != model and other in installed and info["size"] == "7b" and self.is_model_warm(other):
+                        candidates.append({"provider": "ollama", "model": other, "quality": 3})
+            if "phi" in installed:
+                candidates.append({"provider": "ollama", "model": "phi", "quality": 2})
+        
+        if self.local.supports(task_type) and self.is_provider_routable("local"):
+            # Same weights as the light HF model, without the network round trip
+            candidates.append({"provider": "local", "model": self.local.models[task_type], "quality": 1})
+        
+        return candidates
+    
+    def expected_completion_time(self, provider: str, model: str, user_tier: str) -> float:
+        """Queue wait plus EWMA latency, inflated by the model's recent error rate"""
+        priority = TIER_PRIORITY.get(user_tier, TIER_PRIORITY["free"])
+        queue_wait = max(
+            self.admission.get_limiter(provider, model).estimate_wait(priority),
+            self.admission.get_limiter(provider).estimate_wait(priority)
+        )
+        stats = self.routing_stats.get(provider, model)
+        expected = (queue_wait + stats.latency) * (1 + self.error_penalty * stats.error_rate)
+        if provider == "ollama" and not self.is_model_warm(model):
+            expected += self.cold_load_seconds
+        elif provider == "local" and not self.local.is_model_loaded(model):
+            expected += self.local.load_seconds
+        return expected
+    
+    def select_model(self, task_type: str, complexity: str, user_tier: str) -> Dict[str, Any]:
+        """Select the model with the lowest expected completion time that meets the tier's quality floor"""
+        candidates = self.get_candidates(task_type)
+        if not candidates:
+            return {"provider": "fallback", "model": "none", "reason": "no_provider_available"}
+        
+        for candidate in candidates:
+            candidate["expected_seconds"] = self.expected_completion_time(
+                candidate["provider"], candidate["model"], user_tier
+            )
+        
+        floors = self.quality_floors.get(user_tier, self.quality_floors["free"])
+        floor = floors.get(complexity, floors["medium"])
+        eligible = [c for c in candidates if c["quality"] >= floor]
+        reason = "fastest_eligible"
+        
+        # Light work spills to a lower-quality model rather than queueing behind saturated ones
+        if (
+            complexity == "light"
+            and eligible
+            and all(self.admission.is_saturated(c["provider"], c["model"]) for c in eligible)
+        ):
+            eligible = [c for c in candidates if c["quality"] >= min(floor, self.spillover_quality)]
+            reason = "spillover"
+        
+        if not eligible:
+            # Nothing meets the floor on available providers, so use the best model we have
+            best_quality = max(c["quality"] for c in candidates)
+            eligible = [c for c in candidates if c["quality"] == best_quality]
+            reason = "below_quality_floor"
+        
+        choice = min(eligible, key=lambda c: c["expected_seconds"])
+        decision = {
+            "provider": choice["provider"],
+            "model": choice["model"],
+            "reason": reason,
+            "quality": choice["quality"],
+            "expected_seconds": round(choice["expected_seconds"], 3),
+            "alternatives": {
+                f"{c['provider']}:{c['model']}": round(c["expected_seconds"], 3)
+                for c in candidates if c is not choice
+            }
+        }
+        
+        if user_tier in self.hedge_tiers:
+            # Hedge on a different provider, preferring models that meet the floor
+            others = [c for c in candidates if c["provider"] != choice["provider"]]
+            if others:
+                backup = min(others, key=lambda c: (c["quality"] < floor, c["expected_seconds"]))
+                decision["backup"] = {"provider": backup["provider"], "model": backup["model"]}
+        
+        return decision
     
     async def call_huggingface(self, model: str, prompt: str, task_type: str) -> Dict[str, Any]:
-        """Call Hugging Face model"""
+        """Call Hugging Face model, batching light-model calls with concurrent ones"""
+        if task_type in self.hf_batch_tasks and model in self.hf_models["light"].values():
+            return await self.hf_batcher.submit((model, task_type), prompt)
+        return (await self.call_huggingface_batch(model, [prompt], task_type))[0]
+    
+    async def run_huggingface_batch(self, key: Tuple[str, str], prompts: List[str]) -> List[Dict[str, Any]]:
+        """Micro-batcher handler for a (model, task_type) batch"""
+        model, task_type = key
+        return await self.call_huggingface_batch(model, prompts, task_type)
+    
+    async def call_huggingface_batch(self, model: str, prompts: List[str], task_type: str) -> List[Dict[str, Any]]:
+        """Call Hugging Face model with one or more inputs, returning one result per prompt"""
         try:
-            async with aiohttp.ClientSession() as session:
-                headers = {"Authorization": f"Bearer {self.hf_token}"}
-                url = f"https://api-inference.huggingface.co/models/{model}"
-                
-                # Prepare payload based on task type
-                if task_type == "text-generation":
-                    payload = {
-                        "inputs": prompt,
-                        "parameters": {
-                            "max_new_tokens": 500,
-                            "temperature": 0.7,
-                            "do_sample": True
-                        }
+            session = self.http_client.session
+            headers = {"Authorization": f"Bearer {self.hf_token}"}
+            url = f"https://api-inference.huggingface.co/models/{model}"
+            inputs = prompts[0] if len(prompts) == 1 else prompts
+            
+            # Prepare payload based on task type
+            if task_type == "text-generation":
+                payload = {
+                    "inputs": inputs,
+                    "parameters": {
+                        "max_new_tokens": 500,
+                        "temperature": 0.7,
+                        "do_sample": True
                     }
-                else:
-                    payload = {"inputs": prompt}
+                }
+            else:
+                payload = {"inputs": inputs}
+            
+            async with session.post(
+                url,
+                headers=headers,
+                json=payload,
+                timeout=aiohttp.ClientTimeout(total=30)
+            ) as response:
                 
-                async with session.post(
-                    url,
-                    headers=headers,
-                    json=payload,
-                    timeout=aiohttp.ClientTimeout(total=30)
-                ) as response:
+                if response.status == 200:
+                    result = await response.json()
+                    if len(prompts) == 1:
+                        return [{"success": True, "text": self._extract_hf_text(result, prompts[0]), "provider": "huggingface"}]
                     
-                    if response.status == 200:
-                        result = await response.json()
-                        
-                        # Extract text based on model response format
-                        if isinstance(result, list) and len(result) > 0:
-                            if "generated_text" in result[0]:
-                                text = result[0]["generated_text"]
-                                # Remove input prompt from response
-                                if text.startswith(prompt):
-                                    text = text[len(prompt):].strip()
-                                return {"success": True, "text": text, "provider": "huggingface"}
-                            elif "summary_text" in result[0]:
-                                return {"success": True, "text": result[0]["summary_text"], "provider": "huggingface"}
-                            else:
-                                return {"success": True, "text": str(result[0]), "provider": "huggingface"}
-                        else:
-                            return {"success": True, "text": str(result), "provider": "huggingface"}
-                    else:
-                        error_text = await response.text()
-                        logger.error(f"HF API error {response.status}: {error_text}")
-                        return {"success": False, "error": f"API error: {response.status}"}
-                        
+                    # Batched responses carry one output per input, in order
+                    if not isinstance(result, list) or len(result) != len(prompts):
+                        error = {"success": False, "error": "Unexpected batch response shape"}
+                        return [error] * len(prompts)
+                    return [
+                        {
+                            "success": True,
+                            "text": self._extract_hf_text(item if isinstance(item, list) else [item], prompt),
+                            "provider": "huggingface"
+                        }
+                        for item, prompt in zip(result, prompts)
+                    ]
+                else:
+                    error_text = await response.text()
+                    logger.error(f"HF API error {response.status}: {error_text}")
+                    error = {"success": False, "error": f"API error: {response.status}"}
+        
         except asyncio.TimeoutError:
             logger.error("Hugging Face request timeout")
-            return {"success": False, "error": "Request timeout"}
+            error = {"success": False, "error": "Request timeout"}
         except Exception as e:
             logger.error(f"Hugging Face call failed: {e}")
-            return {"success": False, "error": str(e)}
+            error = {"success": False, "error": str(e)}
+        
+        return [error] * len(prompts)
     
     async def call_ollama(self, model: str, prompt: str) -> Dict[str, Any]:
         """Call Ollama model"""
         try:
-            async with aiohttp.ClientSession() as session:
-                url = f"http://{self.ollama_host}/api/generate"
-                payload = {
-                    "model": model,
-                    "prompt": prompt,
-                    "stream": False,
-                    "options": {
-                        "temperature": 0.7,
-                        "top_p": 0.9
-                    }
+            session = self.http_client.session
+            url = f"http://{self.ollama_host}/api/generate"
+            payload = {
+                "model": model,
+                "prompt": prompt,
+                "stream": False,
+                "keep_alive": self.ollama_keep_alive,
+                "options": {
+                    "temperature": 0.7,
+                    "top_p": 0.9
                 }
+            }
+            
+            async with session.post(
+                url,
+                json=payload,
+                timeout=aiohttp.ClientTimeout(total=60)
+            ) as response:
                 
-                async with session.post(
-                    url,
-                    json=payload,
-                    timeout=aiohttp.ClientTimeout(total=60)
-                ) as response:
-                    
-                    if response.status == 200:
-                        result = await response.json()
-                        return {
-                            "success": True,
-                            "text": result.get("response", ""),
-                            "provider": "ollama"
-                        }
-                    else:
-                        error_text = await response.text()
-                        logger.error(f"Ollama error {response.status}: {error_text}")
-                        return {"success": False, "error": f"Ollama error: {response.status}"}
-                        
+                if response.status == 200:
+                    result = await response.json()
+                    return {
+                        "success": True,
+                        "text": result.get("response", ""),
+                        "provider": "ollama"
+                    }
+                else:
+                    error_text = await response.text()
+                    logger.error(f"Ollama error {response.status}: {error_text}")
+                    return {"success": False, "error": f"Ollama error: {response.status}"}
+        
         except asyncio.TimeoutError:
             logger.error("Ollama request timeout")
             return {"success": False, "error": "Request timeout"}
@@ -266,6 +786,193 @@ class ModelRouter:
             logger.error(f"Ollama call failed: {e}")
             return {"success": False, "error": str(e)}
     
+    def _extract_hf_text(self, result: Any, prompt: str) -> str:
+        """Extract text based on model response format"""
+        if isinstance(result, list) and len(result) > 0:
+            if "generated_text" in result[0]:
+                text = result[0]["generated_text"]
+                # Remove input prompt from response
+                if text.startswith(prompt):
+                    text = text[len(prompt):].strip()
+                return text
+            elif "summary_text" in result[0]:
+                return result[0]["summary_text"]
+            else:
+                return str(result[0])
+        else:
+            return str(result)
+    
+    async def route_request_stream(self, task_type: str, complexity: str, user_tier: str, prompt: str) -> AsyncIterator[str]:
+        """Route request to appropriate model, yielding text chunks as they are generated"""
+        self.request_count += 1
+        
+        namespace, hit, vector = await self.semantic_lookup(task_type, user_tier)
+        if hit is not None:
+            yield hit["value"].get("text", "")
+            return
+        
+        model_choice = self.select_model(task_type, complexity, user_tier)
+        
+        logger.info(f"Streaming {task_type} request from {model_choice['provider']}:{model_choice['model']}")
+        
+        if model_choice["provider"] == "huggingface":
+            stream = self.call_huggingface_stream(model_choice["model"], prompt, task_type)
+        elif model_choice["provider"] == "ollama":
+            stream = self.call_ollama_stream(model_choice["model"], prompt)
+        elif model_choice["provider"] == "local":
+            stream = self.call_local_stream(prompt, task_type)
+        else:
+            stream = None
+        
+        produced = False
+        if stream is not None:
+            queued = time.perf_counter()
+            async with self.admission.slot(model_choice["provider"], model_choice["model"], user_tier):
+                record_stage("queue_wait", time.perf_counter() - queued)
+                started = time.perf_counter()
+                self.routing_stats.start(model_choice["provider"], model_choice["model"])
+                breaker = self.get_breaker(model_choice["provider"])
+                if breaker:
+                    breaker.on_call_start()
+                chunks = []
+                error = None
+                try:
+                    async for chunk in stream:
+                        produced = True
+                        chunks.append(chunk)
+                        yield chunk
+                except (asyncio.CancelledError, GeneratorExit):
+                    # The consumer went away; not a provider failure
+                    self.routing_stats.cancel(model_choice["provider"], model_choice["model"])
+                    if breaker:
+                        breaker.on_call_cancelled()
+                    raise
+                except Exception as e:
+                    logger.error(f"Model stream failed: {e}")
+                    error = e
+                    self.finish_call(model_choice, time.perf_counter() - started, False)
+                else:
+                    self.finish_call(model_choice, time.perf_counter() - started, produced)
+                    if produced and vector is not None:
+                        self.semantic_cache.store(
+                            namespace,
+                            vector,
+                            {"success": True, "text": "".join(chunks), "provider": model_choice["provider"]}
+                        )
+                
+                if error is not None and produced:
+                    # Part of the answer is already out, so the caller has to learn it is incomplete
+                    raise error
+        
+        # Nothing usable came back, stream the fallback text in one piece
+        if not produced:
+            fallback = await self.fallback_response(prompt, task_type)
+            yield fallback["text"]
+    
+    async def call_huggingface_stream(self, model: str, prompt: str, task_type: str) -> AsyncIterator[str]:
+        """Call Hugging Face model, streaming tokens when the endpoint supports it"""
+        session = self.http_client.session
+        headers = {"Authorization": f"Bearer {self.hf_token}"}
+        url = f"https://api-inference.huggingface.co/models/{model}"
+        
+        payload = {"inputs": prompt}
+        if task_type == "text-generation":
+            payload["parameters"] = {
+                "max_new_tokens": 500,
+                "temperature": 0.7,
+                "do_sample": True
+            }
+            payload["stream"] = True
+        
+        async with session.post(
+            url,
+            headers=headers,
+            json=payload,
+            timeout=aiohttp.ClientTimeout(total=30, sock_read=15)
+        ) as response:
+            if response.status != 200:
+                error_text = await response.text()
+                logger.error(f"HF API error {response.status}: {error_text}")
+                return
+            
+            if response.content_type != "text/event-stream":
+                # Model does not stream, emit the whole completion at once
+                result = await response.json()
+                yield self._extract_hf_text(result, prompt)
+                return
+            
+            finished = False
+            async for raw_line in response.content:
+                line = raw_line.decode("utf-8").strip()
+                if not line.startswith("data:"):
+                    continue
+                
+                data = line[len("data:"):].strip()
+                if data == "[DONE]":
+                    finished = True
+                    break
+                event = json.loads(data)
+                token = event.get("token", {})
+                if not token.get("special") and token.get("text"):
+                    yield token["text"]
+                # The last event of a completed generation carries the full text
+                if event.get("generated_text") is not None:
+                    finished = True
+                    break
+            
+            if not finished:
+                raise RuntimeError("Hugging Face stream ended before the generation finished")
+    
+    async def call_ollama_stream(self, model: str, prompt: str) -> AsyncIterator[str]:
+        """Call Ollama model with streaming enabled"""
+        session = self.http_client.session
+        url = f"http://{self.ollama_host}/api/generate"
+        payload = {
+            "model": model,
+            "prompt": prompt,
+            "stream": True,
+            "keep_alive": self.ollama_keep_alive,
+            "options": {
+                "temperature": 0.7,
+                "top_p": 0.9
+            }
+        }
+        
+        # Bound the gap between chunks rather than the whole generation
+        async with session.post(
+            url,
+            json=payload,
+            timeout=aiohttp.ClientTimeout(total=None, sock_connect=5, sock_read=30)
+        ) as response:
+            if response.status != 200:
+                error_text = await response.text()
+                logger.error(f"Ollama error {response.status}: {error_text}")
+                return
+            
+            # Ollama streams newline-delimited JSON objects
+            finished = False
+            async for raw_line in response.content:
+                line = raw_line.strip()
+                if not line:
+                    continue
+                
+                chunk = json.loads(line)
+                if chunk.get("response"):
+                    yield chunk["response"]
+                if chunk.get("done"):
+                    finished = True
+                    break
+            
+            # A connection closed without the done chunk means a truncated completion
+            if not finished:
+                raise RuntimeError("Ollama stream ended before the generation finished")
+    
+    async def call_local_stream(self, prompt: str, task_type: str) -> AsyncIterator[str]:
+        """Run a local model; local tasks produce short outputs, so the text comes in one piece"""
+        result = await self.local.generate(task_type, prompt)
+        if result.get("success") and result.get("text"):
+            yield result["text"]
+    
     async def fallback_response(self, prompt: str, task_type: str) -> Dict[str, Any]:
         """Generate fallback response when models are unavailable"""
         logger.warning("Using fallback response - no models available")
@@ -285,23 +992,59 @@ class ModelRouter:
         }
     
     async def health_check(self) -> bool:
-        """Check if any models are available"""
-        await self.check_hf_availability()
-        await self.check_ollama_availability()
+        """Check if a provider that serves every task type is available, using cached probe results"""
+        return any(self.is_provider_available(provider) for provider in self.general_providers)
+    
+    def get_health_snapshot(self) -> Dict[str, Any]:
+        """Get cached provider health with staleness; task-limited providers are reported but never gate readiness"""
+        now = time.time()
+        providers = {}
+        supplementary = {}
+        for provider, status in self.models_status.items():
+            age = now - status.get("checked_at_ts", 0)
+            entry = {
+                "status": status.get("status"),
+                "checked_at": status.get("checked_at"),
+                "age_seconds": round(age, 1),
+                "stale": age > self.health_stale_after,
+                "consecutive_failures": status.get("consecutive_failures", 0)
+            }
+            if provider in self.general_providers:
+                providers[provider] = entry
+            else:
+                supplementary[provider] = entry
         
-        return (
-            self.models_status.get("huggingface") == "available" or
-            self.models_status.get("ollama", {}).get("status") == "available"
-        )
+        # The local provider only covers a few light task types, not the analysis and planning calls every service makes
+        if "local" in supplementary:
+            supplementary["local"]["task_types"] = sorted(self.local.models) if self.local.enabled else []
+        
+        return {
+            "available": any(p["status"] == "available" and not p["stale"] for p in providers.values()),
+            "providers": providers,
+            "supplementary_providers": supplementary
+        }
     
     async def get_status(self) -> Dict[str, Any]:
         """Get detailed status"""
         return {
             "models_status": self.models_status,
             "request_count": self.request_count,
+            "admission": self.admission.get_stats(),
+            "routing": self.routing_stats.get_stats(),
+            "circuit_breakers": {provider: breaker.get_stats() for provider, breaker in self.breakers.items()},
+            "hedging": {"hedged_requests": self.hedged_requests, "backup_wins": self.hedge_wins},
+            "semantic_cache": self.semantic_cache.get_stats(),
+            "hf_batching": self.hf_batcher.get_stats(),
+            "local_inference": self.local.get_stats(),
+            "ollama_residency": {
+                "keep_alive": self.ollama_keep_alive,
+                "pinned_models": self.pinned_models,
+                "warm_models": sorted(m for m in self.resident_models if self.is_model_warm(m)),
+                "cold_loads": self.cold_loads
+            },
             "available_providers": [
-                provider for provider, status in self.models_status.items()
-                if (status == "available" or (isinstance(status, dict) and status.get("status") == "available"))
+                provider for provider in self.models_status
+                if self.is_provider_available(provider)
             ]
         }
     
@@ -309,11 +1052,14 @@ class ModelRouter:
         """Get list of available models"""
         models = []
         
-        if self.models_status.get("huggingface") == "available":
+        if self.is_provider_available("huggingface"):
             for category in self.hf_models.values():
                 models.extend(category.values())
         
-        if self.models_status.get("ollama", {}).get("status") == "available":
+        if self.is_provider_available("ollama"):
             models.extend(self.models_status["ollama"].get("models", []))
         
+        if self.is_provider_available("local"):
+            models.extend(self.local.models.values())
+        
         return list(set(models))
@@ -0,0 +1,165 @@
+"""
+Prompt Builder
+Compact, token-budgeted model prompts with stable static prefixes
+"""
+
+import os
+import re
+import json
+import math
+import time
+import logging
+from typing import Dict, Any, List, Optional, Tuple
+
+try:
+    from utils.monitoring import annotate, record_stage
+except ImportError:
+    # Fallback imports for development
+    import sys
+    sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+    from utils.monitoring import annotate, record_stage
+
+logger = logging.getLogger(__name__)
+
+# Rough average for English text and compact JSON across the models we route to
+CHARS_PER_TOKEN = 4
+TRUNCATION_MARKER = "…"
+
+def estimate_tokens(text: str) -> int:
+    """Approximate the token count of a prompt fragment"""
+    return math.ceil(len(text) / CHARS_PER_TOKEN) if text else 0
+
+def normalize_whitespace(text: str) -> str:
+    """Strip template indentation, collapse runs of spaces and drop blank lines"""
+    lines = (re.sub(r"[ \t]+", " ", line).strip() for line in text.strip().splitlines())
+    return "\n".join(line for line in lines if line)
+
+def _prune(data: Any) -> Any:
+    """Drop empty values that cost tokens without telling the model anything"""
+    if isinstance(data, dict):
+        pruned = {key: _prune(value) for key, value in data.items()}
+        return {key: value for key, value in pruned.items() if value not in (None, "", [], {})}
+    if isinstance(data, (list, tuple)):
+        return [_prune(item) for item in data]
+    if isinstance(data, str):
+        return normalize_whitespace(data)
+    return data
+
+def _shrink(data: Any, max_items: int, max_chars: int) -> Any:
+    """Cap list lengths and string lengths throughout a structure"""
+    if isinstance(data, dict):
+        return {key: _shrink(value, max_items, max_chars) for key, value in data.items()}
+    if isinstance(data, list):
+        kept = [_shrink(item, max_items, max_chars) for item in data[:max_items]]
+        if len(data) > max_items:
+            kept.append(f"+{len(data) - max_items} more")
+        return kept
+    if isinstance(data, str) and len(data) > max_chars:
+        return data[:max_chars] + TRUNCATION_MARKER
+    return data
+
+def compact_json(data: Any) -> str:
+    """Serialize data for a prompt without indentation or empty values"""
+    return json.dumps(_prune(data), separators=(",", ":"), ensure_ascii=False, default=str)
+
+class PromptBuilder:
+    """Builds prompts as static instructions, then request fields, then budgeted data sections"""
+    
+    def __init__(self, max_tokens: Optional[int] = None, section_tokens: Optional[int] = None):
+        self.max_tokens = max_tokens or int(os.getenv("PROMPT_MAX_TOKENS", 2048))
+        self.section_tokens = section_tokens or int(os.getenv("PROMPT_SECTION_TOKENS", 384))
+        self.min_section_tokens = 32
+        
+        # Normalized instruction prefixes by template name; keeping them byte-identical and
+        # first lets Ollama reuse its prompt/KV cache across requests for the same template
+        self.prefixes: Dict[str, str] = {}
+        
+        self.prompts_built = 0
+        self.tokens_built = 0
+        self.sections_truncated = 0
+    
+    def get_prefix(self, name: str, instructions: str) -> str:
+        """Static instruction prefix for a template, normalized once"""
+        prefix = self.prefixes.get(name)
+        if prefix is None:
+            prefix = self.prefixes[name] = normalize_whitespace(instructions)
+        return prefix
+    
+    def render_value(self, value: Any, budget: int) -> Tuple[str, bool]:
+        """Render a value within a token budget; returns (text, truncated)"""
+        text = normalize_whitespace(value) if isinstance(value, str) else compact_json(value)
+        if estimate_tokens(text) <= budget:
+            return text, False
+        
+        # Keep the structure valid JSON by trimming lists and long strings first
+        if not isinstance(value, str):
+            max_chars = max(budget * CHARS_PER_TOKEN // 4, 40)
+            for max_items in (8, 4, 2, 1):
+                text = compact_json(_shrink(value, max_items, max_chars))
+                if estimate_tokens(text) <= budget:
+                    return text, True
+        
+        return text[:budget * CHARS_PER_TOKEN - len(TRUNCATION_MARKER)] + TRUNCATION_MARKER, True
+    
+    def build(
+        self,
+        name: str,
+        instructions: str,
+        fields: Optional[Dict[str, Any]] = None,
+        sections: Optional[Dict[str, Any]] = None,
+        budgets: Optional[Dict[str, int]] = None
+    ) -> str:
+        """Build a prompt and report its token counts on the current trace"""
+        started = time.perf_counter()
+        budgets = budgets or {}
+        prefix = self.get_prefix(name, instructions)
+        
+        lines: List[str] = []
+        for label, value in (fields or {}).items():
+            text, _ = self.render_value(value, self.section_tokens)
+            lines.append(f"{label}: {text}")
+        header = "\n".join(lines)
+        
+        # Sections share what the prefix and fields leave of the overall budget
+        present = {label: data for label, data in (sections or {}).items() if data not in (None, "", [], {})}
+        remaining = self.max_tokens - estimate_tokens(prefix) - estimate_tokens(header)
+        share = max(remaining // max(len(present), 1), self.min_section_tokens)
+        
+        section_tokens: Dict[str, int] = {}
+        truncated: List[str] = []
+        for label, data in present.items():
+            text, was_truncated = self.render_value(data, min(budgets.get(label, self.section_tokens), share))
+            lines.append(f"{label}: {text}")
+            section_tokens[label] = estimate_tokens(text)
+            if was_truncated:
+                truncated.append(label)
+        
+        prompt = prefix + "\n\n" + "\n".join(lines)
+        tokens = estimate_tokens(prompt)
+        
+        self.prompts_built += 1
+        self.tokens_built += tokens
+        self.sections_truncated += len(truncated)
+        if truncated:
+            logger.debug(f"Truncated prompt sections for {name}: {truncated}")
+        
+        record_stage("prompt_build", time.perf_counter() - started)
+        annotate("prompt", {
+            "template": name,
+            "tokens": tokens,
+            "prefix_tokens": estimate_tokens(prefix),
+            "sections": section_tokens,
+            "truncated": truncated
+        })
+        return prompt
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """Get prompt size statistics"""
+        return {
+            "templates": len(self.prefixes),
+            "prompts_built": self.prompts_built,
+            "avg_tokens": round(self.tokens_built / self.prompts_built, 1) if self.prompts_built else 0.0,
+            "max_tokens": self.max_tokens,
+            "section_tokens": self.section_tokens,
+            "sections_truncated": self.sections_truncated
+        }
@@ -0,0 +1,145 @@
+"""
+Step Graph
+Runs dependent async steps concurrently with per-step timeouts and partial-failure tolerance
+"""
+
+import time
+import asyncio
+import inspect
+import logging
+from typing import Dict, Any, Awaitable, Callable, Iterable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+class Step:
+    """A named unit of work that receives the results of the steps it depends on"""
+    
+    def __init__(
+        self,
+        name: str,
+        func: Callable[[Dict[str, Any]], Awaitable[Any]],
+        deps: Iterable[str] = (),
+        timeout: Optional[float] = None,
+        default: Any = None,
+        required: bool = False,
+        emit: bool = True
+    ):
+        self.name = name
+        self.func = func
+        self.deps = tuple(deps)
+        self.timeout = timeout  # None uses the graph default, 0 disables the timeout
+        self.default = default
+        self.required = required
+        self.emit = emit
+
+class StepGraphResult:
+    """Outputs, timings and errors of a step graph run"""
+    
+    def __init__(self):
+        self.results: Dict[str, Any] = {}
+        self.timings: Dict[str, float] = {}
+        self.errors: Dict[str, str] = {}
+    
+    def get_report(self) -> Dict[str, Any]:
+        """Get per-step timings and failures for response metadata"""
+        report = {"step_timings": {name: round(seconds, 4) for name, seconds in self.timings.items()}}
+        if self.errors:
+            report["step_errors"] = dict(self.errors)
+        return report
+
+class StepGraph:
+    """Dependency graph of steps; every step starts as soon as its dependencies finish"""
+    
+    def __init__(self, steps: List[Step], default_timeout: Optional[float] = None):
+        self.steps = {step.name: step for step in steps}
+        self.default_timeout = default_timeout
+        self._validate()
+    
+    def _validate(self) -> None:
+        """Reject unknown dependencies and cycles"""
+        for step in self.steps.values():
+            for dep in step.deps:
+                if dep not in self.steps:
+                    raise ValueError(f"Step {step.name} depends on unknown step {dep}")
+        
+        visited, visiting = set(), set()
+        
+        def visit(name: str) -> None:
+            if name in visited:
+                return
+            if name in visiting:
+                raise ValueError(f"Cycle detected at step {name}")
+            visiting.add(name)
+            for dep in self.steps[name].deps:
+                visit(dep)
+            visiting.discard(name)
+            visited.add(name)
+        
+        for name in self.steps:
+            visit(name)
+    
+    async def run(
+        self,
+        completed: Optional[Dict[str, Any]] = None,
+        on_step_complete: Optional[Callable[[Step, Any], Any]] = None
+    ) -> StepGraphResult:
+        """Run all steps, skipping any already present in completed"""
+        outcome = StepGraphResult()
+        outcome.results.update(completed or {})
+        
+        pending = {name: step for name, step in self.steps.items() if name not in outcome.results}
+        running: Dict[asyncio.Task, Step] = {}
+        
+        try:
+            while pending or running:
+                ready = [
+                    step for step in pending.values()
+                    if all(dep in outcome.results for dep in step.deps)
+                ]
+                for step in ready:
+                    del pending[step.name]
+                    running[asyncio.ensure_future(self._run_step(step, outcome))] = step
+                
+                if not running:
+                    raise RuntimeError(f"Steps cannot be scheduled: {sorted(pending)}")
+                
+                done, _ = await asyncio.wait(running.keys(), return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    step = running.pop(task)
+                    # Re-raises failures of required steps
+                    outcome.results[step.name] = task.result()
+                    
+                    if on_step_complete is not None:
+                        callback_result = on_step_complete(step, outcome.results[step.name])
+                        if inspect.isawaitable(callback_result):
+                            await callback_result
+        finally:
+            for task in running:
+                task.cancel()
+        
+        return outcome
+    
+    async def _run_step(self, step: Step, outcome: StepGraphResult) -> Any:
+        """Run one step, substituting its default on failure unless it is required"""
+        timeout = step.timeout if step.timeout is not None else self.default_timeout
+        started = time.perf_counter()
+        
+        try:
+            if timeout:
+                return await asyncio.wait_for(step.func(outcome.results), timeout)
+            return await step.func(outcome.results)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            if isinstance(e, asyncio.TimeoutError):
+                error = f"timed out after {timeout}s"
+            else:
+                error = str(e) or e.__class__.__name__
+            outcome.errors[step.name] = error
+            
+            if step.required:
+                raise
+            logger.warning(f"Step {step.name} failed, continuing with default: {error}")
+            return step.default
+        finally:
+            outcome.timings[step.name] = time.perf_counter() - started
@@ -0,0 +1,74 @@
+"""
+Streaming Support
+Per-request event sink used to stream sections and tokens while a service runs
+"""
+
+import asyncio
+import logging
+from contextvars import ContextVar
+from typing import Dict, Any, AsyncIterator, Optional
+
+logger = logging.getLogger(__name__)
+
+class StreamSink:
+    """Collects events produced while a request is being processed"""
+
+    def __init__(self):
+        self.queue: asyncio.Queue = asyncio.Queue()
+        # Set when streamed model output was cut short; the final result is then reported as failed
+        self.error: Optional[str] = None
+
+    def emit(self, event: str, data: Any) -> None:
+        """Queue an event for the streaming consumer"""
+        self.queue.put_nowait({"event": event, "data": data})
+
+    async def drain(self, task: asyncio.Future) -> AsyncIterator[Dict[str, Any]]:
+        """Yield queued events until the task finishes, then yield its result"""
+        try:
+            while True:
+                getter = asyncio.ensure_future(self.queue.get())
+                done, _ = await asyncio.wait({getter, task}, return_when=asyncio.FIRST_COMPLETED)
+
+                if getter in done:
+                    yield getter.result()
+                    continue
+
+                getter.cancel()
+                break
+
+            # Flush anything emitted right before the task completed
+            while not self.queue.empty():
+                yield self.queue.get_nowait()
+
+            result = task.result()
+            if self.error and isinstance(result, dict) and result.get("success"):
+                result = {**result, "success": False, "error": self.error}
+            yield {"event": "result", "data": result}
+        finally:
+            if not task.done():
+                task.cancel()
+
+# Sink for the request currently being streamed, if any
+current_stream: ContextVar[Optional[StreamSink]] = ContextVar("current_stream", default=None)
+
+def emit_section(name: str, data: Any) -> None:
+    """Stream a structured result section as soon as it is ready (no-op when not streaming)"""
+    sink = current_stream.get()
+    if sink is not None:
+        sink.emit("section", {"name": name, "data": data})
+
+def emit_token(task_type: str, text: str) -> None:
+    """Stream a chunk of generated model text (no-op when not streaming)"""
+    sink = current_stream.get()
+    if sink is not None and text:
+        sink.emit("token", {"task": task_type, "text": text})
+
+def mark_stream_failed(error: str) -> None:
+    """Report the current streamed request as failed even if its service returns normally"""
+    sink = current_stream.get()
+    if sink is not None and sink.error is None:
+        sink.error = error
+
+def is_streaming() -> bool:
+    """Check whether the current request is being streamed"""
+    return current_stream.get() is not None
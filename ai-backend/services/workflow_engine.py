@@ -3,30 +3,167 @@ Workflow Engine
 Handles complex multi-step AI workflows
 """
 
+import os
+import re
+import json
+import time
+import asyncio
+import hashlib
 import logging
-from typing import Dict, Any
+import tempfile
+from datetime import datetime
+from typing import Dict, Any, List, Optional
+
 from .base_service import BaseAIService
+from .step_graph import Step, StepGraph
+from .streaming import emit_section
+from utils.admission import ProviderOverloaded
+from utils.monitoring import annotate
 
 logger = logging.getLogger(__name__)
 
+# Run ids are 12-byte blake2b digests; anything else is never used as a file name
+RUN_ID_PATTERN = re.compile(r"^[0-9a-f]{24}$")
+
+def is_valid_run_id(run_id: Any) -> bool:
+    """Whether a value has the form of a generated run id"""
+    return isinstance(run_id, str) and RUN_ID_PATTERN.match(run_id) is not None
+
+class WorkflowCheckpointStore:
+    """Persists completed workflow steps so a failed run can resume"""
+    
+    def __init__(self, directory: Optional[str] = None, ttl: Optional[float] = None):
+        self.directory = directory or os.getenv(
+            "WORKFLOW_CHECKPOINT_DIR",
+            os.path.join(tempfile.gettempdir(), "automaatte-workflows")
+        )
+        os.makedirs(self.directory, exist_ok=True)
+        # Checkpoints of runs nobody retried within the TTL are abandoned
+        self.ttl = ttl or float(os.getenv("WORKFLOW_CHECKPOINT_TTL", 86400))
+        self.purge_interval = min(self.ttl, 3600)
+        self.last_purge = 0.0
+        self.expired = 0
+    
+    def _path(self, user_id: Optional[str], run_id: str) -> str:
+        """Checkpoint file for a run, inside its owner's directory"""
+        if not is_valid_run_id(run_id):
+            raise ValueError(f"Invalid workflow run id: {run_id!r}")
+        owner = hashlib.blake2b((user_id or "anonymous").encode("utf-8"), digest_size=8).hexdigest()
+        return os.path.join(self.directory, owner, f"{run_id}.json")
+    
+    def _is_expired(self, path: str) -> bool:
+        """Whether a checkpoint has not been written within the TTL"""
+        return time.time() - os.path.getmtime(path) > self.ttl
+    
+    async def load(self, user_id: Optional[str], run_id: str) -> Dict[str, Any]:
+        """Load completed step results for a user's run"""
+        return await asyncio.to_thread(self._load_sync, user_id, run_id)
+    
+    def _load_sync(self, user_id: Optional[str], run_id: str) -> Dict[str, Any]:
+        path = self._path(user_id, run_id)
+        try:
+            if self._is_expired(path):
+                os.remove(path)
+                self.expired += 1
+                return {}
+            with open(path) as f:
+                return json.load(f).get("completed", {})
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError) as e:
+            logger.warning(f"Ignoring unreadable checkpoint {run_id}: {e}")
+            return {}
+    
+    async def save(self, user_id: Optional[str], run_id: str, completed: Dict[str, Any]) -> None:
+        """Save completed step results for a user's run"""
+        await asyncio.to_thread(self._save_sync, user_id, run_id, completed)
+        if time.time() - self.last_purge >= self.purge_interval:
+            self.last_purge = time.time()
+            await asyncio.to_thread(self.purge_expired)
+    
+    def _save_sync(self, user_id: Optional[str], run_id: str, completed: Dict[str, Any]) -> None:
+        # Write then rename so a crash never leaves a half-written checkpoint
+        path = self._path(user_id, run_id)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({"updated_at": datetime.now().isoformat(), "completed": completed}, f, default=str)
+        os.replace(tmp_path, path)
+    
+    async def delete(self, user_id: Optional[str], run_id: str) -> None:
+        """Remove a finished run's checkpoint"""
+        try:
+            await asyncio.to_thread(os.remove, self._path(user_id, run_id))
+        except FileNotFoundError:
+            pass
+    
+    def purge_expired(self) -> int:
+        """Delete checkpoints of abandoned runs; returns how many were removed"""
+        removed = 0
+        for root, _, files in os.walk(self.directory):
+            for name in files:
+                path = os.path.join(root, name)
+                try:
+                    if self._is_expired(path):
+                        os.remove(path)
+                        removed += 1
+                except OSError:
+                    continue
+        if removed:
+            self.expired += removed
+            logger.info(f"Purged {removed} abandoned workflow checkpoints")
+        return removed
+
 class WorkflowEngine(BaseAIService):
     """Workflow engine for complex AI tasks"""
     
-    def __init__(self):
-        super().__init__(None)
+    def __init__(self, ai_researcher=None, ai_planner=None, model_router=None,
+                 checkpoint_store: Optional[WorkflowCheckpointStore] = None):
+        super().__init__(model_router)
+        self.ai_researcher = ai_researcher
+        self.ai_planner = ai_planner
+        self.checkpoints = checkpoint_store or WorkflowCheckpointStore()
+        self.active_workflows = 0
+        
+        # Research -> plan -> summarize workflows per domain
+        self.workflows = {
+            f"{domain}-workflow": domain
+            for domain in ["vacation", "education", "insurance", "investment", "video-shoot", "general"]
+        }
     
     async def process_request(self, request) -> Dict[str, Any]:
         """Process workflow request"""
         try:
-            # For now, return a simple workflow response
+            domain = self.workflows.get(request.service_type)
+            if domain is None:
+                return {
+                    "success": False,
+                    "error": f"Unknown workflow: {request.service_type}"
+                }
+            
+            # Client ids are only honoured in the generated form; checkpoints are scoped to the user either way
+            run_id = request.options.get("workflow_id")
+            if not is_valid_run_id(run_id):
+                run_id = self.get_run_id(request)
+            steps = self.build_workflow(domain, request.input_data, request.user_tier, request.options)
+            
+            self.active_workflows += 1
+            try:
+                result = await self.run_workflow(run_id, steps, request.user_id)
+            finally:
+                self.active_workflows -= 1
+            
             return {
                 "success": True,
                 "data": {
-                    "workflow_result": f"Processed {request.service_type} workflow",
-                    "steps_completed": 3,
-                    "total_steps": 3
-                }
+                    "workflow": request.service_type,
+                    "workflow_id": run_id,
+                    **result
+                },
+                "service_type": request.service_type
             }
+        except ProviderOverloaded:
+            raise
         except Exception as e:
             logger.error(f"Workflow processing failed: {e}")
             return {
@@ -34,10 +171,83 @@ class WorkflowEngine(BaseAIService):
                 "error": str(e)
             }
     
+    def get_run_id(self, request) -> str:
+        """Derive a stable run id so retries of the same request resume its checkpoint"""
+        options = {k: v for k, v in request.options.items() if k != "workflow_id"}
+        payload = json.dumps(
+            [request.user_id, request.service_type, request.input_data, request.user_tier, options],
+            sort_keys=True, default=str
+        )
+        return hashlib.blake2b(payload.encode("utf-8"), digest_size=12).hexdigest()
+    
+    def build_workflow(self, domain: str, input_data: str, user_tier: str, options: Dict) -> List[Step]:
+        """Build the step graph for a domain workflow"""
+        research_func = self.ai_researcher.research_services[f"{domain}-research"]
+        planning_func = self.ai_planner.planning_services[f"{domain}-planning"]
+        
+        async def research(results: Dict[str, Any]) -> Dict[str, Any]:
+            return await research_func(input_data, user_tier, options)
+        
+        async def plan(results: Dict[str, Any]) -> Dict[str, Any]:
+            # Hand the fetched research data to the planner in memory instead of refetching it
+            plan_options = {**options, "research_data": results["research"].get("raw_data", {})}
+            return await planning_func(input_data, user_tier, plan_options)
+        
+        async def summarize(results: Dict[str, Any]) -> str:
+            return await self.summarize(domain, results["research"], results["plan"], user_tier)
+        
+        return [
+            Step("research", research, required=True),
+            Step("plan", plan, deps=("research",), required=True),
+            Step("summary", summarize, deps=("research", "plan"), default=""),
+        ]
+    
+    async def run_workflow(self, run_id: str, steps: List[Step], user_id: Optional[str] = None) -> Dict[str, Any]:
+        """Run workflow steps, resuming from and recording the user's checkpoints"""
+        completed = await self.checkpoints.load(user_id, run_id)
+        resumed = sorted(completed)
+        if resumed:
+            logger.info(f"Resuming workflow {run_id} after steps: {resumed}")
+        
+        async def checkpoint(step: Step, value: Any) -> None:
+            completed[step.name] = value
+            emit_section(step.name, value)
+            await self.checkpoints.save(user_id, run_id, completed)
+        
+        outcome = await StepGraph(steps).run(completed=completed, on_step_complete=checkpoint)
+        annotate("steps", outcome.get_report())
+        
+        # Finished runs are served by the response cache from here on
+        await self.checkpoints.delete(user_id, run_id)
+        
+        return {
+            **{step.name: outcome.results.get(step.name) for step in steps},
+            "steps_completed": len(outcome.results),
+            "total_steps": len(steps),
+            "resumed_steps": resumed
+        }
+    
+    async def summarize(self, domain: str, research: Dict[str, Any], plan: Dict[str, Any], user_tier: str) -> str:
+        """Summarize research and plan outputs into a short brief"""
+        analysis = next((v for k, v in research.items() if k.endswith("_analysis") and isinstance(v, str)), "")
+        plan_text = next(
+            (v for k, v in plan.items() if k.endswith("_plan") and isinstance(v, str)),
+            ""
+        )
+        
+        result = await self.model_router.route_request(
+            task_type="summarization",
+            complexity="light",
+            user_tier=user_tier,
+            prompt=f"{domain.replace('-', ' ').title()} research:\n{analysis}\n\nPlan:\n{plan_text}"
+        )
+        return result.get("text", "") if result.get("success") else ""
+    
     async def get_status(self) -> Dict[str, Any]:
         """Get workflow engine status"""
         return {
             "status": "online",
-            "workflows_available": 5,
-            "active_workflows": 0
+            "workflows_available": len(self.workflows),
+            "active_workflows": self.active_workflows,
+            "expired_checkpoints": self.checkpoints.expired
         }
@@ -0,0 +1,188 @@
+"""
+Admission control utilities
+"""
+
+import os
+import time
+import heapq
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+from typing import Dict, Any, AsyncIterator, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Lower runs first when a provider is saturated
+TIER_PRIORITY = {"special": 0, "core": 1, "free": 2}
+
+class ProviderOverloaded(Exception):
+    """Raised when a request would wait longer than its budget for a model slot"""
+    
+    def __init__(self, target: str, retry_after: float):
+        super().__init__(f"{target} is overloaded, retry in {retry_after:.0f}s")
+        self.target = target
+        self.retry_after = retry_after
+
+class PriorityLimiter:
+    """Concurrency limit with a bounded wait queue served in tier-priority order"""
+    
+    def __init__(self, name: str, capacity: int, max_queue: int, service_time: float):
+        self.name = name
+        self.capacity = capacity
+        self.max_queue = max_queue
+        self.avg_service_time = service_time  # EWMA of slot hold time, seeds the wait estimate
+        
+        self.in_use = 0
+        self.queued = 0
+        # (priority, seq, future); abandoned futures are skipped lazily
+        self.waiters: List[Tuple[int, int, asyncio.Future]] = []
+        self._seq = 0
+        
+        self.admitted = 0
+        self.shed = 0
+        self.timeouts = 0
+    
+    def estimate_wait(self, priority: int) -> float:
+        """Expected seconds until a request of this priority gets a slot"""
+        if self.in_use < self.capacity and not self.queued:
+            return 0.0
+        ahead = sum(1 for p, _, future in self.waiters if p <= priority and not future.done())
+        return (ahead + 1) / self.capacity * self.avg_service_time
+    
+    async def acquire(self, priority: int, budget: float) -> None:
+        """Take a slot, queueing behind higher-priority waiters; sheds when the wait would exceed budget"""
+        if self.in_use < self.capacity and not self.queued:
+            self.in_use += 1
+            self.admitted += 1
+            return
+        
+        wait = self.estimate_wait(priority)
+        if self.queued >= self.max_queue or wait > budget:
+            self.shed += 1
+            raise ProviderOverloaded(self.name, wait)
+        
+        future = asyncio.get_running_loop().create_future()
+        self._seq += 1
+        heapq.heappush(self.waiters, (priority, self._seq, future))
+        self.queued += 1
+        try:
+            await asyncio.wait_for(future, budget)
+            self.admitted += 1
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            raise ProviderOverloaded(self.name, self.estimate_wait(priority))
+        except asyncio.CancelledError:
+            # A slot handed over just as the caller went away must be passed on
+            if future.done() and not future.cancelled():
+                self.release()
+            raise
+        finally:
+            self.queued -= 1
+    
+    def release(self, held: Optional[float] = None) -> None:
+        """Return a slot, handing it straight to the highest-priority live waiter"""
+        if held is not None:
+            self.avg_service_time += 0.2 * (held - self.avg_service_time)
+        
+        while self.waiters:
+            _, _, future = heapq.heappop(self.waiters)
+            if not future.done():
+                future.set_result(None)
+                return
+        self.in_use -= 1
+    
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "in_use": self.in_use,
+            "capacity": self.capacity,
+            "queued": self.queued,
+            "avg_service_time": round(self.avg_service_time, 3),
+            "admitted": self.admitted,
+            "shed": self.shed,
+            "timeouts": self.timeouts
+        }
+
+class AdmissionController:
+    """Per-provider and per-model concurrency limits for model calls"""
+    
+    def __init__(self):
+        self.wait_budget = float(os.getenv("MODEL_QUEUE_BUDGET", 15))
+        self.max_queue = int(os.getenv("MODEL_QUEUE_SIZE", 32))
+        
+        # Providers without an entry use the default; fallback responses are never limited
+        self.provider_limits = {
+            "ollama": {
+                "capacity": int(os.getenv("OLLAMA_MAX_CONCURRENCY", 4)),
+                "model_capacity": int(os.getenv("OLLAMA_MODEL_CONCURRENCY", 2)),
+                "service_time": 10.0
+            },
+            "huggingface": {
+                "capacity": int(os.getenv("HF_MAX_CONCURRENCY", 16)),
+                "model_capacity": int(os.getenv("HF_MODEL_CONCURRENCY", 8)),
+                "service_time": 3.0
+            },
+            # Calls queue into the local micro-batcher, so admit enough of them to fill a batch
+            "local": {
+                "capacity": int(os.getenv("LOCAL_MAX_CONCURRENCY", 16)),
+                "model_capacity": int(os.getenv("LOCAL_MODEL_CONCURRENCY", 16)),
+                "service_time": 1.0
+            },
+            "default": {"capacity": 4, "model_capacity": 2, "service_time": 5.0}
+        }
+        self.unlimited = {"fallback"}
+        self.limiters: Dict[str, PriorityLimiter] = {}
+    
+    def get_limiter(self, provider: str, model: Optional[str] = None) -> PriorityLimiter:
+        """Limiter for a provider, or for one of its models"""
+        name = f"{provider}:{model}" if model else provider
+        limiter = self.limiters.get(name)
+        if limiter is None:
+            limits = self.provider_limits.get(provider, self.provider_limits["default"])
+            limiter = self.limiters[name] = PriorityLimiter(
+                name,
+                limits["model_capacity"] if model else limits["capacity"],
+                self.max_queue,
+                limits["service_time"]
+            )
+        return limiter
+    
+    def is_saturated(self, provider: str, model: Optional[str] = None) -> bool:
+        """Whether a new request would have to queue"""
+        limiter = self.limiters.get(f"{provider}:{model}" if model else provider)
+        return limiter is not None and (limiter.in_use >= limiter.capacity or limiter.queued > 0)
+    
+    @asynccontextmanager
+    async def slot(self, provider: str, model: str, user_tier: str,
+                   budget: Optional[float] = None) -> AsyncIterator[None]:
+        """Hold a model slot and a provider slot for the duration of a call"""
+        if provider in self.unlimited:
+            yield
+            return
+        
+        priority = TIER_PRIORITY.get(user_tier, TIER_PRIORITY["free"])
+        budget = self.wait_budget if budget is None else budget
+        started = time.monotonic()
+        
+        # Always model then provider, so waiting never holds a provider slot idle
+        model_limiter = self.get_limiter(provider, model)
+        provider_limiter = self.get_limiter(provider)
+        
+        await model_limiter.acquire(priority, budget)
+        model_acquired = time.monotonic()
+        try:
+            await provider_limiter.acquire(priority, max(0.0, budget - (model_acquired - started)))
+        except BaseException:
+            model_limiter.release()
+            raise
+        
+        provider_acquired = time.monotonic()
+        try:
+            yield
+        finally:
+            finished = time.monotonic()
+            provider_limiter.release(finished - provider_acquired)
+            model_limiter.release(finished - model_acquired)
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """Get limiter statistics"""
+        return {name: limiter.get_stats() for name, limiter in self.limiters.items()}
@@ -2,71 +2,305 @@
 Response caching utilities
 """
 
+import os
+import re
 import time
 import json
+import zlib
+import heapq
+import hashlib
 import logging
-from typing import Dict, Any, Optional
+from collections import OrderedDict
+from typing import Dict, Any, List, Optional, Tuple, Union
+
+try:
+    import redis.asyncio as aioredis
+except ImportError:
+    aioredis = None
 
 logger = logging.getLogger(__name__)
 
+# Bump when the cached payload shape changes so old entries are ignored
+CACHE_KEY_VERSION = "v1"
+
+def normalize_text(text: str) -> str:
+    """Collapse whitespace so trivially different inputs share a key"""
+    return re.sub(r"\s+", " ", text or "").strip()
+
+def build_cache_key(
+    service_type: str,
+    input_data: str,
+    user_tier: str = "free",
+    options: Optional[Dict[str, Any]] = None
+) -> str:
+    """Build a deterministic cache key that is stable across workers and restarts"""
+    normalized = {
+        "service_type": service_type.strip().lower(),
+        "input": normalize_text(input_data),
+        "tier": (user_tier or "free").strip().lower(),
+        "options": options or {}
+    }
+    payload = json.dumps(normalized, sort_keys=True, separators=(",", ":"), default=str)
+    digest = hashlib.blake2b(payload.encode("utf-8"), digest_size=16).hexdigest()
+    return f"{CACHE_KEY_VERSION}:{normalized['service_type']}:{digest}"
+
+def serialize_entry(data: Dict[str, Any]) -> bytes:
+    """Serialize a cached response as compressed compact JSON"""
+    raw = json.dumps(data, separators=(",", ":"), default=str).encode("utf-8")
+    return zlib.compress(raw, 6)
+
+def deserialize_entry(blob: bytes) -> Dict[str, Any]:
+    """Inverse of serialize_entry"""
+    return json.loads(zlib.decompress(blob).decode("utf-8"))
+
 class ResponseCache:
-    """Simple in-memory response cache"""
+    """In-memory LRU response cache bounded by entry count and bytes, with heap-based TTL expiry"""
     
-    def __init__(self):
-        self.cache = {}
+    def __init__(self, max_entries: Optional[int] = None, max_bytes: Optional[int] = None):
+        self.cache: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
         self.default_ttl = 3600  # 1 hour
+        self.max_entries = max_entries or int(os.getenv("CACHE_MAX_ENTRIES", 10000))
+        self.max_bytes = max_bytes or int(os.getenv("CACHE_MAX_BYTES", 256 * 1024 * 1024))
+        
+        # (expires_at, seq, key); entries are invalidated lazily via seq
+        self._expiry_heap: List[Tuple[float, int, str]] = []
+        self._seq = 0
+        
+        self.bytes_used = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
     
     async def get(self, key: str) -> Optional[Dict[str, Any]]:
         """Get cached response"""
-        if key in self.cache:
-            entry = self.cache[key]
+        entry = self.cache.get(key)
+        if entry is not None:
             if time.time() < entry["expires_at"]:
-                logger.info(f"Cache hit for key: {key[:50]}...")
+                self.cache.move_to_end(key)
+                self.hits += 1
+                logger.debug(f"Cache hit for key: {key[:50]}...")
                 return entry["data"]
             else:
                 # Expired, remove from cache
-                del self.cache[key]
-                logger.info(f"Cache expired for key: {key[:50]}...")
+                self._remove(key)
+                self.expirations += 1
+                logger.debug(f"Cache expired for key: {key[:50]}...")
         
+        self.misses += 1
         return None
     
     async def set(self, key: str, data: Dict[str, Any], ttl: Optional[int] = None) -> None:
         """Set cached response"""
         ttl = ttl or self.default_ttl
-        expires_at = time.time() + ttl
+        now = time.time()
+        expires_at = now + ttl
+        size = self._estimate_size(data)
+        
+        if size > self.max_bytes:
+            logger.warning(f"Skipping cache for key {key[:50]}...: entry of {size} bytes exceeds cache size")
+            return
+        
+        if key in self.cache:
+            self._remove(key)
         
+        self._seq += 1
         self.cache[key] = {
             "data": data,
             "expires_at": expires_at,
-            "created_at": time.time()
+            "created_at": now,
+            "size": size,
+            "seq": self._seq
         }
+        self.bytes_used += size
+        heapq.heappush(self._expiry_heap, (expires_at, self._seq, key))
         
-        logger.info(f"Cached response for key: {key[:50]}... (TTL: {ttl}s)")
+        logger.debug(f"Cached response for key: {key[:50]}... (TTL: {ttl}s)")
         
-        # Clean up expired entries periodically
+        # Expire due entries, then evict least recently used until within bounds
         await self.cleanup_expired()
+        self._enforce_bounds()
+    
+    async def set_local(self, key: str, data: Dict[str, Any], ttl: Optional[int] = None) -> None:
+        """Cache a response in this process; for the in-memory cache that is the whole cache"""
+        await self.set(key, data, ttl)
+    
+    async def set_shared(self, key: str, data: Dict[str, Any], ttl: Optional[int] = None) -> None:
+        """Cache a response in the tier shared across workers; the in-memory cache has none"""
+        return None
     
     async def cleanup_expired(self) -> None:
-        """Remove expired cache entries"""
+        """Remove expired cache entries in O(k log n) for k expired entries"""
         current_time = time.time()
-        expired_keys = [
-            key for key, entry in self.cache.items()
-            if current_time >= entry["expires_at"]
-        ]
+        heap = self._expiry_heap
+        expired = 0
         
-        for key in expired_keys:
-            del self.cache[key]
+        while heap and heap[0][0] <= current_time:
+            _, seq, key = heapq.heappop(heap)
+            entry = self.cache.get(key)
+            if entry is not None and entry["seq"] == seq:
+                self._remove(key)
+                expired += 1
         
-        if expired_keys:
-            logger.info(f"Cleaned up {len(expired_keys)} expired cache entries")
+        self.expirations += expired
+        
+        # Overwrites and LRU evictions leave stale heap records behind
+        if len(heap) > 2 * len(self.cache) + 1024:
+            self._expiry_heap = [
+                (entry["expires_at"], entry["seq"], key) for key, entry in self.cache.items()
+            ]
+            heapq.heapify(self._expiry_heap)
+        
+        if expired:
+            logger.debug(f"Cleaned up {expired} expired cache entries")
+    
+    def _enforce_bounds(self) -> None:
+        """Evict least recently used entries until within entry and byte limits"""
+        while self.cache and (len(self.cache) > self.max_entries or self.bytes_used > self.max_bytes):
+            key = next(iter(self.cache))
+            self._remove(key)
+            self.evictions += 1
+    
+    def _remove(self, key: str) -> None:
+        """Remove an entry and release its bytes"""
+        entry = self.cache.pop(key, None)
+        if entry is not None:
+            self.bytes_used -= entry["size"]
+    
+    @staticmethod
+    def _estimate_size(data: Dict[str, Any]) -> int:
+        """Approximate entry footprint by its compact JSON length"""
+        try:
+            return len(json.dumps(data, separators=(",", ":"), default=str))
+        except (TypeError, ValueError):
+            return len(str(data))
+    
+    async def close(self) -> None:
+        """Release cache resources"""
+        self.cache.clear()
+        self._expiry_heap.clear()
+        self.bytes_used = 0
     
     def get_stats(self) -> Dict[str, Any]:
         """Get cache statistics"""
-        current_time = time.time()
-        active_entries = sum(1 for entry in self.cache.values() if current_time < entry["expires_at"])
+        lookups = self.hits + self.misses
         
         return {
+            "backend": "memory",
             "total_entries": len(self.cache),
-            "active_entries": active_entries,
-            "expired_entries": len(self.cache) - active_entries
+            "max_entries": self.max_entries,
+            "bytes_used": self.bytes_used,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": (self.hits / lookups) if lookups else 0.0,
+            "evictions": self.evictions,
+            "expirations": self.expirations
         }
+
+class RedisResponseCache:
+    """Redis-backed response cache shared by all workers, fronted by an in-memory ResponseCache as the local tier"""
+    
+    def __init__(self, redis_url: str, key_prefix: str = "automaatte:cache:"):
+        if aioredis is None:
+            raise RuntimeError("redis package is not installed")
+        
+        self.default_ttl = 3600  # 1 hour
+        self.redis_url = redis_url
+        self.key_prefix = key_prefix
+        self.client = aioredis.from_url(redis_url)
+        self.local = ResponseCache(max_entries=int(os.getenv("CACHE_LOCAL_MAX_ENTRIES", 1000)))
+        self.local.default_ttl = int(os.getenv("CACHE_LOCAL_TTL", 60))
+        self.hits = 0
+        self.misses = 0
+        self.errors = 0
+        self.corrupt_entries = 0
+        self.bytes_written = 0
+    
+    async def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """Get cached response, checking the local tier before Redis"""
+        local_hit = await self.local.get(key)
+        if local_hit is not None:
+            self.hits += 1
+            return local_hit
+        
+        try:
+            blob = await self.client.get(self.key_prefix + key)
+        except Exception as e:
+            self.errors += 1
+            logger.error(f"Redis cache get failed: {e}")
+            return None
+        
+        if blob is None:
+            self.misses += 1
+            return None
+        
+        try:
+            data = deserialize_entry(blob)
+        except (zlib.error, ValueError) as e:
+            # Corrupt or written in an older format; drop it so the next response replaces it
+            self.corrupt_entries += 1
+            self.misses += 1
+            logger.warning(f"Discarding unreadable cache entry {key}: {e}")
+            try:
+                await self.client.delete(self.key_prefix + key)
+            except Exception as delete_error:
+                self.errors += 1
+                logger.error(f"Redis cache delete failed: {delete_error}")
+            return None
+        
+        self.hits += 1
+        await self.local.set(key, data)
+        return data
+    
+    async def set(self, key: str, data: Dict[str, Any], ttl: Optional[int] = None) -> None:
+        """Set cached response in Redis and the local tier"""
+        await self.set_shared(key, data, ttl)
+        await self.set_local(key, data, ttl)
+    
+    async def set_local(self, key: str, data: Dict[str, Any], ttl: Optional[int] = None) -> None:
+        """Cache a response in the local tier only"""
+        await self.local.set(key, data, ttl=min(ttl or self.default_ttl, self.local.default_ttl))
+    
+    async def set_shared(self, key: str, data: Dict[str, Any], ttl: Optional[int] = None) -> None:
+        """Write a response to Redis"""
+        ttl = ttl or self.default_ttl
+        blob = serialize_entry(data)
+        
+        try:
+            await self.client.set(self.key_prefix + key, blob, ex=ttl)
+            self.bytes_written += len(blob)
+        except Exception as e:
+            self.errors += 1
+            logger.error(f"Redis cache set failed: {e}")
+    
+    async def close(self) -> None:
+        """Close the Redis connection pool"""
+        await self.local.close()
+        await self.client.close()
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """Get cache statistics"""
+        return {
+            "backend": "redis",
+            "hits": self.hits,
+            "misses": self.misses,
+            "errors": self.errors,
+            "corrupt_entries": self.corrupt_entries,
+            "bytes_written": self.bytes_written,
+            "local": self.local.get_stats()
+        }
+
+def create_response_cache() -> Union[ResponseCache, RedisResponseCache]:
+    """Create the configured response cache backend"""
+    backend = os.getenv("CACHE_BACKEND", "memory").lower()
+    redis_url = os.getenv("REDIS_URL")
+    
+    if backend == "redis" or (backend == "auto" and redis_url):
+        if aioredis is None:
+            logger.warning("⚠️ redis package not installed, falling back to in-memory cache")
+        else:
+            logger.info("Using Redis response cache")
+            return RedisResponseCache(redis_url or "redis://localhost:6379/0")
+    
+    return ResponseCache()
@@ -0,0 +1,74 @@
+"""
+Circuit breaker utilities
+"""
+
+import os
+import time
+import logging
+from typing import Dict, Any
+
+logger = logging.getLogger(__name__)
+
+class CircuitBreaker:
+    """Stops routing to a provider after consecutive failures, then probes it with a single trial call"""
+    
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+    
+    def __init__(self, name: str):
+        self.name = name
+        self.failure_threshold = int(os.getenv("CIRCUIT_FAILURE_THRESHOLD", 5))
+        self.reset_timeout = float(os.getenv("CIRCUIT_RESET_TIMEOUT", 30))
+        
+        self.state = self.CLOSED
+        self.consecutive_failures = 0
+        self.opened_at = 0.0
+        self.trial_in_flight = False
+        self.times_opened = 0
+    
+    def allows_request(self) -> bool:
+        """Whether a call may be routed to this provider right now"""
+        if self.state == self.OPEN and time.monotonic() - self.opened_at >= self.reset_timeout:
+            self.state = self.HALF_OPEN
+            self.trial_in_flight = False
+            logger.info(f"Circuit for {self.name} half-open, allowing a trial call")
+        
+        if self.state == self.HALF_OPEN:
+            return not self.trial_in_flight
+        return self.state == self.CLOSED
+    
+    def on_call_start(self) -> None:
+        """Claim the single trial call while half-open"""
+        if self.state == self.HALF_OPEN:
+            self.trial_in_flight = True
+    
+    def on_call_cancelled(self) -> None:
+        """Give back an unfinished trial so another call can probe"""
+        if self.state == self.HALF_OPEN:
+            self.trial_in_flight = False
+    
+    def record_success(self) -> None:
+        if self.state != self.CLOSED:
+            logger.info(f"Circuit for {self.name} closed")
+        self.state = self.CLOSED
+        self.consecutive_failures = 0
+        self.trial_in_flight = False
+    
+    def record_failure(self) -> None:
+        self.consecutive_failures += 1
+        if self.state == self.HALF_OPEN or (
+            self.state == self.CLOSED and self.consecutive_failures >= self.failure_threshold
+        ):
+            self.state = self.OPEN
+            self.opened_at = time.monotonic()
+            self.trial_in_flight = False
+            self.times_opened += 1
+            logger.warning(f"⚠️ Circuit for {self.name} opened after {self.consecutive_failures} consecutive failures")
+    
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "state": self.state,
+            "consecutive_failures": self.consecutive_failures,
+            "times_opened": self.times_opened
+        }
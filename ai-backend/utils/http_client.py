@@ -0,0 +1,102 @@
+"""
+Shared HTTP client utilities
+"""
+
+import os
+import logging
+from typing import Dict, Any, Optional
+
+import aiohttp
+
+logger = logging.getLogger(__name__)
+
+class HTTPClientPool:
+    """Process-wide pooled aiohttp session shared by all outbound callers"""
+
+    def __init__(
+        self,
+        limit: Optional[int] = None,
+        limit_per_host: Optional[int] = None,
+        keepalive_timeout: Optional[float] = None,
+        dns_cache_ttl: Optional[int] = None,
+        connect_timeout: Optional[float] = None,
+        total_timeout: Optional[float] = None
+    ):
+        self.limit = limit or int(os.getenv("HTTP_POOL_LIMIT", 100))
+        self.limit_per_host = limit_per_host or int(os.getenv("HTTP_POOL_LIMIT_PER_HOST", 20))
+        self.keepalive_timeout = keepalive_timeout or float(os.getenv("HTTP_KEEPALIVE_TIMEOUT", 30))
+        self.dns_cache_ttl = dns_cache_ttl or int(os.getenv("HTTP_DNS_CACHE_TTL", 300))
+        self.connect_timeout = connect_timeout or float(os.getenv("HTTP_CONNECT_TIMEOUT", 5))
+        self.total_timeout = total_timeout or float(os.getenv("HTTP_TOTAL_TIMEOUT", 60))
+
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._connector: Optional[aiohttp.TCPConnector] = None
+
+    def _create_session(self) -> None:
+        """Create the connector and session backing the pool"""
+        self._connector = aiohttp.TCPConnector(
+            limit=self.limit,
+            limit_per_host=self.limit_per_host,
+            keepalive_timeout=self.keepalive_timeout,
+            ttl_dns_cache=self.dns_cache_ttl,
+            use_dns_cache=True
+        )
+        self._session = aiohttp.ClientSession(
+            connector=self._connector,
+            timeout=aiohttp.ClientTimeout(
+                total=self.total_timeout,
+                sock_connect=self.connect_timeout
+            )
+        )
+
+    async def start(self) -> None:
+        """Create the pooled session"""
+        if self._session is not None and not self._session.closed:
+            return
+
+        self._create_session()
+        logger.info(
+            f"HTTP client pool started (limit={self.limit}, per_host={self.limit_per_host})"
+        )
+
+    async def close(self) -> None:
+        """Close the pooled session and release all connections"""
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+            logger.info("HTTP client pool closed")
+        self._session = None
+        self._connector = None
+
+    @property
+    def session(self) -> aiohttp.ClientSession:
+        """Get the shared session, creating it lazily if the pool was not started"""
+        if self._session is None or self._session.closed:
+            # Must be called from a running event loop, same as aiohttp itself
+            self._create_session()
+        return self._session
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get connection pool statistics"""
+        connector = self._connector
+        if connector is None or connector.closed:
+            return {"status": "closed", "open": 0, "idle": 0, "in_use": 0, "queued": 0}
+
+        # aiohttp does not expose pool counters publicly, read them defensively
+        idle_conns = getattr(connector, "_conns", {}) or {}
+        acquired = getattr(connector, "_acquired", set()) or set()
+        waiters = getattr(connector, "_waiters", {}) or {}
+
+        idle = sum(len(conns) for conns in idle_conns.values())
+        in_use = len(acquired)
+        queued = sum(len(queue) for queue in waiters.values())
+
+        return {
+            "status": "open",
+            "open": idle + in_use,
+            "idle": idle,
+            "in_use": in_use,
+            "queued": queued,
+            "hosts": len(idle_conns),
+            "limit": self.limit,
+            "limit_per_host": self.limit_per_host
+        }
@@ -0,0 +1,533 @@
+"""
+Async job queue utilities
+"""
+
+import os
+import json
+import time
+import uuid
+import sqlite3
+import asyncio
+import logging
+import tempfile
+import threading
+from typing import Dict, Any, Awaitable, Callable, Iterator, List, Optional
+
+try:
+    import redis.asyncio as aioredis
+except ImportError:
+    aioredis = None
+
+try:
+    from prometheus_client.core import GaugeMetricFamily, HistogramMetricFamily
+except ImportError:
+    GaugeMetricFamily = None
+
+try:
+    from utils.monitoring import LatencyHistogram
+except ImportError:
+    # Fallback imports for development
+    import sys
+    sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+    from utils.monitoring import LatencyHistogram
+
+logger = logging.getLogger(__name__)
+
+# queued -> running -> succeeded | failed
+FINISHED_STATES = ("succeeded", "failed")
+
+class JobQueueFull(Exception):
+    """Raised when the job queue has no room for another job"""
+    
+    def __init__(self, retry_after: Optional[float] = None):
+        self.retry_after = retry_after
+        super().__init__("Job queue is full")
+
+def new_job(request: Dict[str, Any]) -> Dict[str, Any]:
+    """Create a queued job record for a request payload"""
+    now = time.time()
+    return {
+        "job_id": uuid.uuid4().hex,
+        "status": "queued",
+        "request": request,
+        "created_at": now,
+        "updated_at": now,
+        "started_at": None,
+        "finished_at": None,
+        "attempts": 0,
+        "version": 0,
+        "result": None,
+        "error": None
+    }
+
+class JobStore:
+    """In-memory job store; jobs do not outlive the process"""
+    
+    def __init__(self, result_ttl: Optional[int] = None):
+        self.jobs: Dict[str, Dict[str, Any]] = {}
+        self.result_ttl = result_ttl or int(os.getenv("JOB_RESULT_TTL", 3600))
+    
+    async def save(self, job: Dict[str, Any]) -> None:
+        """Insert or overwrite a job"""
+        self.jobs[job["job_id"]] = dict(job)
+    
+    async def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """Get a job by id"""
+        job = self.jobs.get(job_id)
+        return dict(job) if job is not None else None
+    
+    async def touch(self, job: Dict[str, Any]) -> bool:
+        """Refresh an unfinished job's lease if nobody changed it since it was read (compare-and-set on version)"""
+        stored = self.jobs.get(job["job_id"])
+        if stored is None or stored["version"] != job["version"] or stored["status"] in FINISHED_STATES:
+            return False
+        job["version"] = stored["version"] = stored["version"] + 1
+        job["updated_at"] = stored["updated_at"] = time.time()
+        return True
+    
+    async def list_stale(self, before: float) -> List[Dict[str, Any]]:
+        """Unfinished jobs whose lease was last refreshed before a timestamp"""
+        return [
+            dict(job) for job in self.jobs.values()
+            if job["status"] not in FINISHED_STATES and job["updated_at"] < before
+        ]
+    
+    async def purge(self, before: float) -> int:
+        """Drop finished jobs last updated before a timestamp"""
+        expired = [
+            job_id for job_id, job in self.jobs.items()
+            if job["status"] in FINISHED_STATES and job["updated_at"] < before
+        ]
+        for job_id in expired:
+            del self.jobs[job_id]
+        return len(expired)
+    
+    async def close(self) -> None:
+        """Release store resources"""
+        self.jobs.clear()
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """Get store statistics"""
+        return {"backend": "memory", "jobs": len(self.jobs)}
+
+class SQLiteJobStore(JobStore):
+    """SQLite-backed job store; jobs survive restarts of a single-host deployment"""
+    
+    def __init__(self, path: Optional[str] = None):
+        super().__init__()
+        self.path = path or os.getenv("JOB_SQLITE_PATH", os.path.join(tempfile.gettempdir(), "automaatte-jobs.db"))
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            "job_id TEXT PRIMARY KEY, status TEXT NOT NULL, version INTEGER NOT NULL, "
+            "updated_at REAL NOT NULL, data TEXT NOT NULL)"
+        )
+        self.conn.execute("CREATE INDEX IF NOT EXISTS jobs_status_updated ON jobs (status, updated_at)")
+    
+    def _execute(self, sql: str, params: tuple = ()) -> int:
+        with self.lock:
+            return self.conn.execute(sql, params).rowcount
+    
+    def _query(self, sql: str, params: tuple = ()) -> List[tuple]:
+        with self.lock:
+            return self.conn.execute(sql, params).fetchall()
+    
+    async def save(self, job: Dict[str, Any]) -> None:
+        await asyncio.to_thread(
+            self._execute,
+            "INSERT OR REPLACE INTO jobs (job_id, status, version, updated_at, data) VALUES (?, ?, ?, ?, ?)",
+            (job["job_id"], job["status"], job["version"], job["updated_at"], json.dumps(job, default=str))
+        )
+    
+    async def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        rows = await asyncio.to_thread(
+            self._query, "SELECT data, version, updated_at FROM jobs WHERE job_id = ?", (job_id,)
+        )
+        if not rows:
+            return None
+        data, version, updated_at = rows[0]
+        return {**json.loads(data), "version": version, "updated_at": updated_at}
+    
+    async def touch(self, job: Dict[str, Any]) -> bool:
+        now = time.time()
+        updated = await asyncio.to_thread(
+            self._execute,
+            "UPDATE jobs SET version = version + 1, updated_at = ? "
+            "WHERE job_id = ? AND version = ? AND status NOT IN ('succeeded', 'failed')",
+            (now, job["job_id"], job["version"])
+        )
+        if updated != 1:
+            return False
+        job["version"] += 1
+        job["updated_at"] = now
+        return True
+    
+    async def list_stale(self, before: float) -> List[Dict[str, Any]]:
+        rows = await asyncio.to_thread(
+            self._query,
+            "SELECT data, version, updated_at FROM jobs "
+            "WHERE status NOT IN ('succeeded', 'failed') AND updated_at < ?",
+            (before,)
+        )
+        return [{**json.loads(data), "version": version, "updated_at": updated_at} for data, version, updated_at in rows]
+    
+    async def purge(self, before: float) -> int:
+        return await asyncio.to_thread(
+            self._execute,
+            "DELETE FROM jobs WHERE status IN ('succeeded', 'failed') AND updated_at < ?",
+            (before,)
+        )
+    
+    def _close(self) -> None:
+        # Waits for any statement still running in a worker thread
+        with self.lock:
+            self.conn.close()
+    
+    async def close(self) -> None:
+        await asyncio.to_thread(self._close)
+    
+    def get_stats(self) -> Dict[str, Any]:
+        return {"backend": "sqlite", "path": self.path}
+
+# Refreshes a job's lease only if its version is unchanged and it is still unfinished.
+# KEYS: job hash, active set; ARGV: expected version, now, job id.
+TOUCH_JOB_SCRIPT = """
+local version = redis.call('HGET', KEYS[1], 'version')
+if version ~= ARGV[1] or redis.call('ZSCORE', KEYS[2], ARGV[3]) == false then
+    return 0
+end
+redis.call('HINCRBY', KEYS[1], 'version', 1)
+redis.call('ZADD', KEYS[2], ARGV[2], ARGV[3])
+return 1
+"""
+
+class RedisJobStore(JobStore):
+    """Redis-backed job store shared by all workers; unfinished jobs are indexed by lease time"""
+    
+    def __init__(self, redis_url: str, key_prefix: str = "automaatte:jobs:"):
+        if aioredis is None:
+            raise RuntimeError("redis package is not installed")
+        
+        super().__init__()
+        self.redis_url = redis_url
+        self.key_prefix = key_prefix
+        self.active_key = f"{key_prefix}active"
+        self.client = aioredis.from_url(redis_url)
+        self.touch_script = self.client.register_script(TOUCH_JOB_SCRIPT)
+    
+    def _key(self, job_id: str) -> str:
+        return f"{self.key_prefix}{job_id}"
+    
+    async def save(self, job: Dict[str, Any]) -> None:
+        key = self._key(job["job_id"])
+        async with self.client.pipeline(transaction=True) as pipe:
+            pipe.hset(key, mapping={"data": json.dumps(job, default=str), "version": job["version"]})
+            if job["status"] in FINISHED_STATES:
+                # Finished jobs expire on their own once the result has been available long enough
+                pipe.expire(key, self.result_ttl)
+                pipe.zrem(self.active_key, job["job_id"])
+            else:
+                pipe.persist(key)
+                pipe.zadd(self.active_key, {job["job_id"]: job["updated_at"]})
+            await pipe.execute()
+    
+    async def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        data, version = await self.client.hmget(self._key(job_id), ["data", "version"])
+        if data is None:
+            return None
+        return {**json.loads(data), "version": int(version)}
+    
+    async def touch(self, job: Dict[str, Any]) -> bool:
+        now = time.time()
+        touched = await self.touch_script(
+            keys=[self._key(job["job_id"]), self.active_key],
+            args=[job["version"], now, job["job_id"]]
+        )
+        if not int(touched):
+            return False
+        job["version"] += 1
+        job["updated_at"] = now
+        return True
+    
+    async def list_stale(self, before: float) -> List[Dict[str, Any]]:
+        jobs = []
+        for job_id, score in await self.client.zrangebyscore(self.active_key, "-inf", f"({before}", withscores=True):
+            job = await self.get(job_id.decode() if isinstance(job_id, bytes) else job_id)
+            if job is None:
+                await self.client.zrem(self.active_key, job_id)
+                continue
+            job["updated_at"] = score
+            jobs.append(job)
+        return jobs
+    
+    async def purge(self, before: float) -> int:
+        # Finished jobs carry a TTL, so Redis expires them itself
+        return 0
+    
+    async def close(self) -> None:
+        await self.client.close()
+    
+    def get_stats(self) -> Dict[str, Any]:
+        return {"backend": "redis"}
+
+def create_job_store() -> JobStore:
+    """Create the configured job store backend"""
+    backend = os.getenv("JOB_STORE_BACKEND", "memory").lower()
+    redis_url = os.getenv("REDIS_URL")
+    
+    if backend == "redis" or (backend == "auto" and redis_url):
+        if aioredis is None:
+            logger.warning("⚠️ redis package not installed, falling back to in-memory job store")
+        else:
+            logger.info("Using Redis job store")
+            return RedisJobStore(redis_url or "redis://localhost:6379/0")
+    
+    if backend == "sqlite":
+        logger.info("Using SQLite job store")
+        return SQLiteJobStore()
+    
+    return JobStore()
+
+class JobQueue:
+    """Bounded queue of jobs drained by a worker pool, with leases so jobs orphaned by a restart are picked up again"""
+    
+    def __init__(
+        self,
+        store: JobStore,
+        handler: Callable[[Dict[str, Any]], Awaitable[Dict[str, Any]]],
+        max_size: Optional[int] = None,
+        workers: Optional[int] = None
+    ):
+        self.store = store
+        # handler(request payload) returns the job result; result["success"] decides the final state
+        self.handler = handler
+        self.max_size = max_size or int(os.getenv("JOB_QUEUE_SIZE", 100))
+        self.worker_count = workers or int(os.getenv("JOB_WORKERS", 4))
+        self.lease_seconds = float(os.getenv("JOB_LEASE_SECONDS", 120))
+        self.max_attempts = int(os.getenv("JOB_MAX_ATTEMPTS", 3))
+        self.max_wait = float(os.getenv("JOB_MAX_WAIT", 30))
+        self.poll_interval = 1.0
+        
+        self.queue: "asyncio.Queue[str]" = asyncio.Queue(self.max_size)
+        self.workers: List[asyncio.Task] = []
+        self.sweeper: Optional[asyncio.Task] = None
+        
+        # Jobs queued or running in this process, and waiters for their completion
+        self.local_jobs: Dict[str, Dict[str, Any]] = {}
+        self.enqueued_at: Dict[str, float] = {}
+        self.done_events: Dict[str, asyncio.Event] = {}
+        
+        self.wait_time = LatencyHistogram()
+        self.run_time = LatencyHistogram()
+        self.busy = 0
+        self.submitted = 0
+        self.succeeded = 0
+        self.failed = 0
+        self.rejected = 0
+        self.recovered = 0
+    
+    async def start(self) -> None:
+        """Start the worker pool and the lease sweeper"""
+        if not self.workers:
+            self.workers = [
+                asyncio.create_task(self._worker(i), name=f"job-worker-{i}")
+                for i in range(self.worker_count)
+            ]
+            self.sweeper = asyncio.create_task(self._sweep_loop(), name="job-sweeper")
+            logger.info(f"Job queue started with {self.worker_count} workers")
+    
+    def estimate_wait(self) -> float:
+        """Rough seconds until a newly queued job would start"""
+        per_job = self.run_time.sum / self.run_time.count if self.run_time.count else 10.0
+        return per_job * (self.queue.qsize() + 1) / self.worker_count
+    
+    async def submit(self, request: Dict[str, Any]) -> Dict[str, Any]:
+        """Persist and queue a job; raises JobQueueFull when there is no room"""
+        if self.queue.full():
+            self.rejected += 1
+            raise JobQueueFull(self.estimate_wait())
+        
+        job = new_job(request)
+        await self.store.save(job)
+        if not self._enqueue(job):
+            # Filled up while the job was being saved
+            self.rejected += 1
+            await self._finish(job, None, "Job queue is full")
+            raise JobQueueFull(self.estimate_wait())
+        
+        self.submitted += 1
+        return job
+    
+    def _enqueue(self, job: Dict[str, Any]) -> bool:
+        try:
+            self.queue.put_nowait(job["job_id"])
+        except asyncio.QueueFull:
+            return False
+        self.local_jobs[job["job_id"]] = job
+        self.enqueued_at[job["job_id"]] = time.monotonic()
+        self.done_events.setdefault(job["job_id"], asyncio.Event())
+        return True
+    
+    async def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """Get a job's current state"""
+        return await self.store.get(job_id)
+    
+    async def wait(self, job_id: str, timeout: float) -> Optional[Dict[str, Any]]:
+        """Long-poll: return once the job finishes or the timeout (capped at JOB_MAX_WAIT) passes"""
+        deadline = time.monotonic() + min(max(timeout, 0.0), self.max_wait)
+        while True:
+            job = await self.store.get(job_id)
+            remaining = deadline - time.monotonic()
+            if job is None or job["status"] in FINISHED_STATES or remaining <= 0:
+                return job
+            
+            # Local jobs signal completion; jobs owned by another worker are polled
+            event = self.done_events.get(job_id)
+            try:
+                if event is not None:
+                    await asyncio.wait_for(event.wait(), remaining)
+                else:
+                    await asyncio.sleep(min(remaining, self.poll_interval))
+            except asyncio.TimeoutError:
+                pass
+    
+    async def _worker(self, index: int) -> None:
+        while True:
+            job_id = await self.queue.get()
+            try:
+                await self._run(job_id)
+            except Exception as e:
+                logger.error(f"Job {job_id} crashed its worker: {e}")
+            finally:
+                self.queue.task_done()
+    
+    async def _run(self, job_id: str) -> None:
+        job = self.local_jobs.get(job_id) or await self.store.get(job_id)
+        enqueued_at = self.enqueued_at.pop(job_id, None)
+        if job is None or job["status"] in FINISHED_STATES:
+            self._forget(job_id)
+            return
+        if enqueued_at is not None:
+            self.wait_time.observe(time.monotonic() - enqueued_at)
+        
+        if job["attempts"] >= self.max_attempts:
+            await self._finish(job, None, f"Abandoned after {job['attempts']} attempts")
+            return
+        
+        job.update(status="running", started_at=time.time(), attempts=job["attempts"] + 1)
+        await self._save(job)
+        
+        started = time.monotonic()
+        self.busy += 1
+        try:
+            result = await self.handler(job["request"])
+            error = None if result.get("success") else result.get("error") or "Request failed"
+        except Exception as e:
+            result, error = None, str(e)
+        finally:
+            self.busy -= 1
+        self.run_time.observe(time.monotonic() - started)
+        
+        await self._finish(job, result, error)
+    
+    async def _save(self, job: Dict[str, Any]) -> None:
+        job["version"] += 1
+        job["updated_at"] = time.time()
+        await self.store.save(job)
+    
+    async def _finish(self, job: Dict[str, Any], result: Optional[Dict[str, Any]], error: Optional[str]) -> None:
+        job.update(
+            status="failed" if error else "succeeded",
+            result=result,
+            error=error,
+            finished_at=time.time()
+        )
+        if error:
+            self.failed += 1
+        else:
+            self.succeeded += 1
+        
+        try:
+            await self._save(job)
+        finally:
+            event = self.done_events.get(job["job_id"])
+            if event is not None:
+                event.set()
+            self._forget(job["job_id"])
+    
+    def _forget(self, job_id: str) -> None:
+        self.local_jobs.pop(job_id, None)
+        self.enqueued_at.pop(job_id, None)
+        self.done_events.pop(job_id, None)
+    
+    async def _sweep_loop(self) -> None:
+        """Renew leases on local jobs, take over jobs whose owner stopped renewing, and purge old results"""
+        while True:
+            try:
+                for job in list(self.local_jobs.values()):
+                    await self.store.touch(job)
+                await self.recover_stale()
+                purged = await self.store.purge(time.time() - self.store.result_ttl)
+                if purged:
+                    logger.debug(f"Purged {purged} finished jobs")
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Job sweep failed: {e}")
+            
+            await asyncio.sleep(self.lease_seconds / 3)
+    
+    async def recover_stale(self) -> int:
+        """Queue unfinished jobs whose lease expired, e.g. after their worker restarted"""
+        recovered = 0
+        for job in await self.store.list_stale(time.time() - self.lease_seconds):
+            if self.queue.full():
+                break
+            if job["job_id"] in self.local_jobs:
+                continue
+            # Only one worker wins the lease on an orphaned job
+            if await self.store.touch(job) and self._enqueue(job):
+                recovered += 1
+        
+        if recovered:
+            self.recovered += recovered
+            logger.info(f"Recovered {recovered} orphaned jobs")
+        return recovered
+    
+    async def close(self) -> None:
+        """Stop workers; unfinished jobs are picked up again once their lease expires"""
+        tasks = self.workers + ([self.sweeper] if self.sweeper else [])
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self.workers = []
+        self.sweeper = None
+        await self.store.close()
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """Get queue depth, worker usage and wait-time statistics"""
+        return {
+            "depth": self.queue.qsize(),
+            "max_size": self.max_size,
+            "workers": self.worker_count,
+            "busy_workers": self.busy,
+            "submitted": self.submitted,
+            "succeeded": self.succeeded,
+            "failed": self.failed,
+            "rejected": self.rejected,
+            "recovered": self.recovered,
+            "wait_time": self.wait_time.summary(),
+            "run_time": self.run_time.summary(),
+            "store": self.store.get_stats()
+        }
+    
+    def collect(self) -> Iterator[Any]:
+        """Prometheus collector hook exporting queue depth and job wait times"""
+        yield GaugeMetricFamily("automaatte_job_queue_depth", "Jobs waiting for a worker", value=self.queue.qsize())
+        yield GaugeMetricFamily("automaatte_job_workers_busy", "Job workers running a job", value=self.busy)
+        
+        wait_time = HistogramMetricFamily("automaatte_job_wait_seconds", "Time jobs spend queued before a worker picks them up")
+        wait_time.add_metric([], self.wait_time.cumulative_buckets(), self.wait_time.sum)
+        yield wait_time
@@ -0,0 +1,154 @@
+"""
+Local inference utilities
+"""
+
+import os
+import time
+import asyncio
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, List
+
+try:
+    import torch
+    from transformers import pipeline
+except ImportError:
+    torch = None
+    pipeline = None
+
+try:
+    from utils.micro_batcher import MicroBatcher
+except ImportError:
+    # Fallback imports for development
+    import sys
+    sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+    from utils.micro_batcher import MicroBatcher
+
+logger = logging.getLogger(__name__)
+
+# Router task type -> transformers pipeline task, for the tasks small enough to run on CPU
+PIPELINE_TASKS = {
+    "summarization": "summarization",
+    "sentiment": "sentiment-analysis",
+    "question-answering": "question-answering"
+}
+
+def split_question(prompt: str) -> Dict[str, str]:
+    """Question-answering prompts carry the question on the first line and the context after it"""
+    question, _, context = prompt.strip().partition("\n")
+    return {"question": question.strip(), "context": context.strip() or question.strip()}
+
+def format_output(task_type: str, output: Any) -> str:
+    """Text of one pipeline output"""
+    if isinstance(output, list):
+        output = output[0] if output else {}
+    if task_type == "summarization":
+        return output.get("summary_text", "")
+    if task_type == "sentiment":
+        return output.get("label", "")
+    if task_type == "question-answering":
+        return output.get("answer", "")
+    return str(output)
+
+class LocalInference:
+    """Light transformers models run in-process on CPU, loaded on first use, with concurrent calls batched into one forward pass"""
+    
+    def __init__(self, models: Dict[str, str]):
+        # task type -> model name
+        self.models = {task: model for task, model in models.items() if task in PIPELINE_TASKS}
+        self.enabled = os.getenv("LOCAL_INFERENCE_ENABLED", "true").lower() == "true" and pipeline is not None
+        self.threads = int(os.getenv("LOCAL_INFERENCE_THREADS", 2))
+        # Expected extra latency of a request that has to load its model first
+        self.load_seconds = float(os.getenv("LOCAL_INFERENCE_LOAD_SECONDS", 20))
+        
+        # One forward pass at a time; torch spreads each pass over self.threads cores
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="local-inference")
+        self.pipelines: Dict[str, Any] = {}
+        self.load_locks: Dict[str, asyncio.Lock] = {}
+        self.load_times: Dict[str, float] = {}
+        self.load_errors: Dict[str, str] = {}
+        
+        self.batcher = MicroBatcher(
+            "local",
+            self.run_batch,
+            max_batch_size=int(os.getenv("LOCAL_BATCH_MAX_SIZE", 16)),
+            max_wait_ms=float(os.getenv("LOCAL_BATCH_WINDOW_MS", 10))
+        )
+        
+        if pipeline is None:
+            logger.warning("⚠️ transformers/torch not installed, local inference disabled")
+    
+    def supports(self, task_type: str) -> bool:
+        """Whether a task can run locally"""
+        return self.enabled and task_type in self.models
+    
+    def is_model_loaded(self, model: str) -> bool:
+        """Whether a model is already in memory"""
+        return any(self.models[task] == model for task in self.pipelines)
+    
+    async def get_pipeline(self, task_type: str) -> Any:
+        """Pipeline for a task, loading it on first use"""
+        pipe = self.pipelines.get(task_type)
+        if pipe is not None:
+            return pipe
+        
+        lock = self.load_locks.setdefault(task_type, asyncio.Lock())
+        async with lock:
+            if task_type not in self.pipelines:
+                started = time.perf_counter()
+                try:
+                    self.pipelines[task_type] = await asyncio.get_running_loop().run_in_executor(
+                        self.executor, self._load, task_type
+                    )
+                except Exception as e:
+                    self.load_errors[task_type] = str(e)
+                    raise
+                self.load_times[task_type] = round(time.perf_counter() - started, 2)
+                self.load_errors.pop(task_type, None)
+                logger.info(f"✅ Loaded local {task_type} model {self.models[task_type]} in {self.load_times[task_type]}s")
+        return self.pipelines[task_type]
+    
+    def _load(self, task_type: str) -> Any:
+        torch.set_num_threads(self.threads)
+        return pipeline(PIPELINE_TASKS[task_type], model=self.models[task_type], device=-1)
+    
+    async def generate(self, task_type: str, prompt: str) -> Dict[str, Any]:
+        """Run one prompt, sharing a forward pass with concurrent prompts for the same task"""
+        return await self.batcher.submit(task_type, prompt)
+    
+    async def run_batch(self, task_type: str, prompts: List[str]) -> List[Dict[str, Any]]:
+        """Micro-batcher handler: one forward pass over every prompt in the batch"""
+        pipe = await self.get_pipeline(task_type)
+        outputs = await asyncio.get_running_loop().run_in_executor(
+            self.executor, self._forward, pipe, task_type, prompts
+        )
+        return [
+            {"success": True, "text": format_output(task_type, output), "provider": "local"}
+            for output in outputs
+        ]
+    
+    def _forward(self, pipe: Any, task_type: str, prompts: List[str]) -> List[Any]:
+        with torch.inference_mode():
+            if task_type == "question-answering":
+                outputs = pipe([split_question(prompt) for prompt in prompts], batch_size=len(prompts))
+            else:
+                outputs = pipe(prompts, batch_size=len(prompts), truncation=True)
+        # Pipelines unwrap single-item batches for some tasks
+        return [outputs] if isinstance(outputs, dict) else list(outputs)
+    
+    async def close(self) -> None:
+        """Finish open batches and release the inference thread"""
+        await self.batcher.close()
+        self.executor.shutdown(wait=False)
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """Get local inference statistics"""
+        return {
+            "enabled": self.enabled,
+            "threads": self.threads,
+            "models": self.models,
+            "loaded": sorted(self.pipelines),
+            "load_seconds": self.load_times,
+            "load_errors": self.load_errors,
+            "batching": self.batcher.get_stats()
+        }
@@ -0,0 +1,104 @@
+"""
+Micro-batching utilities
+"""
+
+import asyncio
+import logging
+from typing import Dict, Any, Awaitable, Callable, Hashable, List, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+class MicroBatcher:
+    """Collect concurrent calls with the same key for a few milliseconds and run them as one batch"""
+    
+    def __init__(
+        self,
+        name: str,
+        handler: Callable[[Hashable, List[Any]], Awaitable[List[Any]]],
+        max_batch_size: int = 8,
+        max_wait_ms: float = 5
+    ):
+        self.name = name
+        # handler(key, items) returns one result per item, in order
+        self.handler = handler
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max_wait_ms / 1000
+        
+        self.pending: Dict[Hashable, List[Tuple[Any, asyncio.Future]]] = {}
+        self.timers: Dict[Hashable, asyncio.TimerHandle] = {}
+        self.running: Set[asyncio.Task] = set()
+        
+        self.batches = 0
+        self.items = 0
+        self.full_batches = 0
+        self.failed_batches = 0
+    
+    async def submit(self, key: Hashable, item: Any) -> Any:
+        """Add an item to the open batch for key and wait for its result"""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        
+        batch = self.pending.setdefault(key, [])
+        batch.append((item, future))
+        if len(batch) >= self.max_batch_size:
+            self.full_batches += 1
+            self._flush(key)
+        elif len(batch) == 1:
+            self.timers[key] = loop.call_later(self.max_wait, self._flush, key)
+        
+        return await future
+    
+    def _flush(self, key: Hashable) -> None:
+        """Close the open batch for key and run it in the background"""
+        timer = self.timers.pop(key, None)
+        if timer is not None:
+            timer.cancel()
+        
+        # Callers that went away while the batch was open are left out
+        batch = [(item, future) for item, future in self.pending.pop(key, []) if not future.done()]
+        if not batch:
+            return
+        
+        task = asyncio.ensure_future(self._run(key, batch))
+        self.running.add(task)
+        task.add_done_callback(self.running.discard)
+    
+    async def _run(self, key: Hashable, batch: List[Tuple[Any, asyncio.Future]]) -> None:
+        self.batches += 1
+        self.items += len(batch)
+        
+        try:
+            results = await self.handler(key, [item for item, _ in batch])
+            if len(results) != len(batch):
+                raise RuntimeError(f"{self.name} batch returned {len(results)} results for {len(batch)} items")
+        except Exception as e:
+            self.failed_batches += 1
+            logger.error(f"{self.name} batch of {len(batch)} failed: {e}")
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        
+        for (_, future), result in zip(batch, results):
+            if not future.done():
+                future.set_result(result)
+    
+    async def close(self) -> None:
+        """Run every open batch and wait for in-flight batches to finish"""
+        for key in list(self.pending):
+            self._flush(key)
+        if self.running:
+            await asyncio.gather(*self.running, return_exceptions=True)
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """Get batching statistics"""
+        return {
+            "max_batch_size": self.max_batch_size,
+            "window_ms": round(self.max_wait * 1000, 3),
+            "batches": self.batches,
+            "items": self.items,
+            "avg_batch_size": round(self.items / self.batches, 2) if self.batches else 0.0,
+            "full_batches": self.full_batches,
+            "failed_batches": self.failed_batches,
+            "open_batches": len(self.pending)
+        }
@@ -3,31 +3,195 @@ Service monitoring utilities
 """
 
 import time
+import bisect
 import logging
-from typing import Dict, Any, List
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Any, Iterator, List, Optional, Tuple
 from datetime import datetime
-from collections import defaultdict
+from collections import defaultdict, deque
+
+try:
+    from prometheus_client.core import CollectorRegistry, CounterMetricFamily, GaugeMetricFamily, HistogramMetricFamily
+except ImportError:
+    CollectorRegistry = None
 
 logger = logging.getLogger(__name__)
 
+# Upper bounds in seconds, doubling every two buckets from 1ms to ~2 minutes
+DEFAULT_BUCKETS = tuple(round(0.001 * 2 ** (i / 2), 6) for i in range(35))
+
+# Request stages timed separately in each trace
+STAGES = ("cache_lookup", "data_fetch", "prompt_build", "queue_wait", "model_call", "serialization")
+
+class LatencyHistogram:
+    """Fixed-bucket latency histogram; O(log buckets) to record and O(buckets) per percentile"""
+    
+    def __init__(self, buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # last slot counts values above the top bucket
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+    
+    def observe(self, value: float) -> None:
+        """Record one latency in seconds"""
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+        self.max = max(self.max, value)
+    
+    def percentile(self, q: float) -> float:
+        """Estimate the q-th quantile (0-1), interpolating within the matching bucket"""
+        if not self.count:
+            return 0.0
+        
+        rank = q * self.count
+        seen = 0
+        for index, bucket_count in enumerate(self.counts):
+            if bucket_count and seen + bucket_count >= rank:
+                if index == len(self.buckets):
+                    return self.max
+                lower = self.buckets[index - 1] if index else 0.0
+                upper = min(self.buckets[index], self.max)
+                return lower + (upper - lower) * max(0.0, rank - seen) / bucket_count
+            seen += bucket_count
+        return self.max
+    
+    def cumulative_buckets(self) -> List[Tuple[str, int]]:
+        """Cumulative (upper bound, count) pairs in Prometheus form"""
+        result, total = [], 0
+        for bound, bucket_count in zip(self.buckets, self.counts):
+            total += bucket_count
+            result.append((repr(bound), total))
+        result.append(("+Inf", self.count))
+        return result
+    
+    def summary(self) -> Dict[str, Any]:
+        """Count, mean and p50/p90/p99 in seconds"""
+        return {
+            "count": self.count,
+            "mean": (self.sum / self.count) if self.count else 0.0,
+            "p50": self.percentile(0.5),
+            "p90": self.percentile(0.9),
+            "p99": self.percentile(0.99),
+            "max": self.max
+        }
+
+class RequestTrace:
+    """Stage timings and model calls collected while one request is processed"""
+    
+    def __init__(self):
+        self.stages: Dict[str, float] = defaultdict(float)
+        self.model_calls: List[Dict[str, Any]] = []
+        self.annotations: Dict[str, List[Any]] = defaultdict(list)
+    
+    def add_stage(self, stage: str, seconds: float) -> None:
+        self.stages[stage] += seconds
+    
+    def to_dict(self) -> Dict[str, Any]:
+        """Trace summary for response metadata"""
+        return {
+            "stages": {stage: round(seconds, 4) for stage, seconds in self.stages.items()},
+            "model_calls": list(self.model_calls),
+            **{name: list(values) for name, values in self.annotations.items()}
+        }
+
+# Trace of the request currently being processed, if any
+current_trace: ContextVar[Optional[RequestTrace]] = ContextVar("current_trace", default=None)
+
+def start_trace() -> RequestTrace:
+    """Begin collecting stage timings for the current request"""
+    trace = RequestTrace()
+    current_trace.set(trace)
+    return trace
+
+def record_stage(stage: str, seconds: float) -> None:
+    """Add time spent in a stage to the current trace (no-op outside a request)"""
+    trace = current_trace.get()
+    if trace is not None:
+        trace.add_stage(stage, seconds)
+
+@contextmanager
+def stage_timer(stage: str) -> Iterator[None]:
+    """Time the enclosed block as a request stage"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_stage(stage, time.perf_counter() - started)
+
+def annotate(name: str, value: Any) -> None:
+    """Attach extra detail to the current trace's metadata (no-op outside a request)"""
+    trace = current_trace.get()
+    if trace is not None:
+        trace.annotations[name].append(value)
+
+def record_model_call(provider: str, model: str, seconds: float, success: bool,
+                      routing: Optional[Dict[str, Any]] = None) -> None:
+    """Record a model call's latency, and the routing decision behind it, against the current trace"""
+    trace = current_trace.get()
+    if trace is not None:
+        trace.add_stage("model_call", seconds)
+        call = {
+            "provider": provider,
+            "model": model,
+            "seconds": round(seconds, 4),
+            "success": success
+        }
+        if routing:
+            call["routing"] = routing
+        trace.model_calls.append(call)
+
 class ServiceMonitor:
     """Monitor service usage and performance"""
     
-    def __init__(self):
+    def __init__(self, max_series: int = 200):
         self.start_time = time.time()
         self.request_count = 0
         self.error_count = 0
-        self.response_times = []
         self.user_usage = defaultdict(int)
         self.service_usage = defaultdict(int)
-        self.error_log = []
+        self.error_log = deque(maxlen=100)
+        
+        # Latency histograms by dimension ("service_type", "provider", "model", "stage") and label
+        self.response_time = LatencyHistogram()
+        self.histograms: Dict[str, Dict[str, LatencyHistogram]] = defaultdict(dict)
+        self.max_series = max_series
     
-    async def log_usage(self, user_id: str, service_type: str, response_time: float, success: bool) -> None:
+    def observe(self, dimension: str, label: str, seconds: float) -> None:
+        """Record a latency under a dimension, folding labels past max_series into 'other'"""
+        series = self.histograms[dimension]
+        histogram = series.get(label)
+        if histogram is None:
+            if len(series) >= self.max_series:
+                label = "other"
+                histogram = series.get(label)
+            if histogram is None:
+                histogram = series[label] = LatencyHistogram()
+        histogram.observe(seconds)
+    
+    async def log_usage(
+        self,
+        user_id: str,
+        service_type: str,
+        response_time: float,
+        success: bool,
+        trace: Optional[RequestTrace] = None
+    ) -> None:
         """Log service usage"""
         self.request_count += 1
-        self.response_times.append(response_time)
         self.user_usage[user_id] += 1
         self.service_usage[service_type] += 1
+        self.response_time.observe(response_time)
+        self.observe("service_type", service_type, response_time)
+        
+        if trace is not None:
+            for stage, seconds in trace.stages.items():
+                self.observe("stage", stage, seconds)
+            for call in trace.model_calls:
+                self.observe("provider", call["provider"], call["seconds"])
+                self.observe("model", f"{call['provider']}:{call['model']}", call["seconds"])
         
         if not success:
             self.error_count += 1
@@ -37,14 +201,6 @@ class ServiceMonitor:
                 "service_type": service_type,
                 "response_time": response_time
             })
-        
-        # Keep only last 1000 response times
-        if len(self.response_times) > 1000:
-            self.response_times = self.response_times[-1000:]
-        
-        # Keep only last 100 errors
-        if len(self.error_log) > 100:
-            self.error_log = self.error_log[-100:]
     
     def get_uptime(self) -> float:
         """Get service uptime in seconds"""
@@ -62,9 +218,19 @@ class ServiceMonitor:
     
     def get_average_response_time(self) -> float:
         """Get average response time"""
-        if not self.response_times:
+        if not self.response_time.count:
             return 0.0
-        return sum(self.response_times) / len(self.response_times)
+        return self.response_time.sum / self.response_time.count
+    
+    def get_latency_stats(self) -> Dict[str, Any]:
+        """Get percentile summaries for every histogram"""
+        return {
+            "overall": self.response_time.summary(),
+            **{
+                dimension: {label: histogram.summary() for label, histogram in series.items()}
+                for dimension, series in self.histograms.items()
+            }
+        }
     
     def get_stats(self) -> Dict[str, Any]:
         """Get comprehensive statistics"""
@@ -74,7 +240,43 @@ class ServiceMonitor:
             "error_count": self.error_count,
             "error_rate_percent": self.get_error_rate(),
             "average_response_time": self.get_average_response_time(),
+            "latency": self.get_latency_stats(),
             "top_users": dict(sorted(self.user_usage.items(), key=lambda x: x[1], reverse=True)[:10]),
             "service_usage": dict(self.service_usage),
-            "recent_errors": self.error_log[-10:] if self.error_log else []
+            "recent_errors": list(self.error_log)[-10:]
         }
+    
+    def collect(self) -> Iterator[Any]:
+        """Prometheus collector hook exporting the monitor's histograms and counters"""
+        requests = CounterMetricFamily(
+            "automaatte_requests", "Requests served by service type", labels=["service_type"]
+        )
+        for service_type, count in self.service_usage.items():
+            requests.add_metric([service_type], count)
+        yield requests
+        
+        yield CounterMetricFamily("automaatte_request_errors", "Failed requests", value=self.error_count)
+        yield GaugeMetricFamily("automaatte_uptime_seconds", "Process uptime", value=self.get_uptime())
+        
+        overall = HistogramMetricFamily("automaatte_response_seconds", "End-to-end response time")
+        overall.add_metric([], self.response_time.cumulative_buckets(), self.response_time.sum)
+        yield overall
+        
+        for dimension, series in self.histograms.items():
+            family = HistogramMetricFamily(
+                f"automaatte_{dimension}_seconds",
+                f"Latency by {dimension.replace('_', ' ')}",
+                labels=[dimension]
+            )
+            for label, histogram in series.items():
+                family.add_metric([label], histogram.cumulative_buckets(), histogram.sum)
+            yield family
+    
+    def create_registry(self) -> Optional[Any]:
+        """Build a Prometheus registry backed by this monitor, if prometheus_client is installed"""
+        if CollectorRegistry is None:
+            logger.warning("⚠️ prometheus_client not installed, /metrics is disabled")
+            return None
+        registry = CollectorRegistry(auto_describe=False)
+        registry.register(self)
+        return registry
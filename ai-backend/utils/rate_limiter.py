@@ -2,58 +2,271 @@
 Rate limiting utilities
 """
 
+import os
 import time
 import logging
-from typing import Dict, Optional
-from collections import defaultdict, deque
+from typing import Dict, Optional, Tuple
+from collections import OrderedDict
+
+try:
+    import redis.asyncio as aioredis
+except ImportError:
+    aioredis = None
 
 logger = logging.getLogger(__name__)
 
+# Window length in seconds for each limit
+LIMIT_WINDOWS = {
+    "requests_per_minute": 60,
+    "requests_per_hour": 3600
+}
+
+class RateLimitExceeded(Exception):
+    """Raised when a user is over their request limits"""
+    
+    def __init__(self, user_id: str, retry_after: Optional[float] = None):
+        super().__init__(f"Rate limit exceeded for user {user_id}")
+        self.user_id = user_id
+        self.retry_after = retry_after
+
+def window_retry_after(elapsed: float, window: float, limit: int, current: float, previous: float) -> float:
+    """Seconds until a sliding-window counter admits one more request"""
+    if current >= limit:
+        return window - elapsed
+    # Wait for the previous window's weight to decay enough to make room
+    return max(0.0, (1 - (limit - current) / previous) * window - elapsed)
+
+class SlidingWindowCounter:
+    """Sliding-window approximation from the current and previous fixed-window counts"""
+    
+    __slots__ = ("window", "index", "current", "previous")
+    
+    def __init__(self, window: float):
+        self.window = window
+        self.index = 0
+        self.current = 0
+        self.previous = 0
+    
+    def _roll(self, now: float) -> None:
+        index = int(now // self.window)
+        if index != self.index:
+            self.previous = self.current if index == self.index + 1 else 0
+            self.current = 0
+            self.index = index
+    
+    def estimate(self, now: float) -> float:
+        """Weighted request count over the trailing window"""
+        self._roll(now)
+        elapsed = now - self.index * self.window
+        return self.previous * (1 - elapsed / self.window) + self.current
+    
+    def retry_after(self, now: float, limit: int) -> float:
+        """Seconds until one more request fits under limit"""
+        self._roll(now)
+        elapsed = now - self.index * self.window
+        return window_retry_after(elapsed, self.window, limit, self.current, self.previous)
+
 class RateLimiter:
-    """Simple in-memory rate limiter"""
+    """In-memory sliding-window rate limiter with per-tier limits"""
     
     def __init__(self):
-        self.requests = defaultdict(deque)
-        self.limits = {
-            "requests_per_minute": 60,
-            "requests_per_hour": 1000
+        self.tier_limits = {
+            "free": {"requests_per_minute": 60, "requests_per_hour": 1000},
+            "core": {"requests_per_minute": 120, "requests_per_hour": 3000},
+            "special": {"requests_per_minute": 300, "requests_per_hour": 10000}
         }
+        self.limits = self.tier_limits["free"]
+        
+        # user_id -> (last_seen, counters); ordered by last activity for cheap idle eviction
+        self.users: "OrderedDict[str, Tuple[float, Dict[str, SlidingWindowCounter]]]" = OrderedDict()
+        self.idle_ttl = float(os.getenv("RATE_LIMIT_IDLE_TTL", 2 * LIMIT_WINDOWS["requests_per_hour"]))
+        self.sweep_interval = float(os.getenv("RATE_LIMIT_SWEEP_INTERVAL", 60))
+        self.last_sweep = time.time()
+        self.evicted_users = 0
+    
+    def get_limits(self, user_tier: Optional[str]) -> Dict[str, int]:
+        """Limits for a tier, falling back to free"""
+        return self.tier_limits.get((user_tier or "free").lower(), self.limits)
     
-    async def check_rate_limit(self, user_id: str) -> bool:
+    async def check_rate_limit(self, user_id: str, user_tier: str = "free") -> bool:
         """Check if user is within rate limits"""
+        allowed, _ = await self.acquire(user_id, user_tier)
+        return allowed
+    
+    async def acquire(self, user_id: str, user_tier: str = "free") -> Tuple[bool, float]:
+        """Count a request if it fits; returns (allowed, retry_after_seconds)"""
         current_time = time.time()
-        user_requests = self.requests[user_id]
+        limits = self.get_limits(user_tier)
+        
+        entry = self.users.pop(user_id, None)
+        counters = entry[1] if entry else {name: SlidingWindowCounter(window) for name, window in LIMIT_WINDOWS.items()}
+        self.users[user_id] = (current_time, counters)
         
-        # Clean old requests (older than 1 hour)
-        while user_requests and current_time - user_requests[0] > 3600:
-            user_requests.popleft()
+        over_limit = False
+        retry_after = 0.0
+        for name, limit in limits.items():
+            counter = counters[name]
+            if counter.estimate(current_time) + 1 > limit:
+                logger.warning(f"Rate limit {name} exceeded for user {user_id}")
+                over_limit = True
+                retry_after = max(retry_after, counter.retry_after(current_time, limit))
         
-        # Check hourly limit
-        if len(user_requests) >= self.limits["requests_per_hour"]:
-            logger.warning(f"Hourly rate limit exceeded for user {user_id}")
-            return False
+        if current_time - self.last_sweep > self.sweep_interval:
+            self.evict_idle_users(current_time)
         
-        # Check minute limit
-        recent_requests = sum(1 for req_time in user_requests if current_time - req_time < 60)
-        if recent_requests >= self.limits["requests_per_minute"]:
-            logger.warning(f"Minute rate limit exceeded for user {user_id}")
-            return False
+        if over_limit:
+            # The estimated wait can round down to zero; never tell a rejected client to retry immediately
+            return False, max(retry_after, 1.0)
         
-        # Add current request
-        user_requests.append(current_time)
-        return True
+        for counter in counters.values():
+            counter.current += 1
+        return True, 0.0
     
-    def get_user_stats(self, user_id: str) -> Dict:
+    def evict_idle_users(self, current_time: Optional[float] = None) -> int:
+        """Drop users whose windows have fully expired; O(evicted) since users are ordered by activity"""
+        current_time = current_time or time.time()
+        self.last_sweep = current_time
+        evicted = 0
+        
+        while self.users:
+            user_id, (last_seen, _) = next(iter(self.users.items()))
+            if current_time - last_seen < self.idle_ttl:
+                break
+            del self.users[user_id]
+            evicted += 1
+        
+        self.evicted_users += evicted
+        if evicted:
+            logger.debug(f"Evicted {evicted} idle rate limit entries")
+        return evicted
+    
+    def get_user_stats(self, user_id: str, user_tier: str = "free") -> Dict:
         """Get rate limit stats for user"""
         current_time = time.time()
-        user_requests = self.requests[user_id]
+        limits = self.get_limits(user_tier)
+        entry = self.users.get(user_id)
+        counters = entry[1] if entry else {}
         
-        recent_requests = sum(1 for req_time in user_requests if current_time - req_time < 60)
-        hourly_requests = len(user_requests)
+        def estimate(name: str) -> int:
+            return round(counters[name].estimate(current_time)) if name in counters else 0
         
         return {
-            "requests_last_minute": recent_requests,
-            "requests_last_hour": hourly_requests,
-            "minute_limit": self.limits["requests_per_minute"],
-            "hour_limit": self.limits["requests_per_hour"]
+            "requests_last_minute": estimate("requests_per_minute"),
+            "requests_last_hour": estimate("requests_per_hour"),
+            "minute_limit": limits["requests_per_minute"],
+            "hour_limit": limits["requests_per_hour"]
         }
+    
+    async def close(self) -> None:
+        """Release limiter resources"""
+        self.users.clear()
+    
+    def get_stats(self) -> Dict:
+        """Get limiter statistics"""
+        return {
+            "backend": "memory",
+            "tracked_users": len(self.users),
+            "evicted_users": self.evicted_users,
+            "tier_limits": self.tier_limits
+        }
+
+# Atomically checks every limit and only counts the request when all of them pass.
+# KEYS: (current, previous) window key pairs; ARGV: now, then (window, limit) pairs.
+SLIDING_WINDOW_SCRIPT = """
+local now = tonumber(ARGV[1])
+local over = false
+local retry = 0
+for i = 1, #KEYS / 2 do
+    local window = tonumber(ARGV[2 * i])
+    local limit = tonumber(ARGV[2 * i + 1])
+    local current = tonumber(redis.call('GET', KEYS[2 * i - 1]) or '0')
+    local previous = tonumber(redis.call('GET', KEYS[2 * i]) or '0')
+    local elapsed = now % window
+    if previous * (1 - elapsed / window) + current + 1 > limit then
+        over = true
+        local wait
+        if current >= limit then
+            wait = window - elapsed
+        else
+            wait = (1 - (limit - current) / previous) * window - elapsed
+        end
+        if wait > retry then
+            retry = wait
+        end
+    end
+end
+if over then
+    return {0, tostring(retry)}
+end
+for i = 1, #KEYS / 2 do
+    redis.call('INCR', KEYS[2 * i - 1])
+    redis.call('EXPIRE', KEYS[2 * i - 1], 2 * tonumber(ARGV[2 * i]))
+end
+return {1, '0'}
+"""
+
+class RedisRateLimiter(RateLimiter):
+    """Sliding-window rate limiter shared by all workers through a Redis Lua script"""
+    
+    def __init__(self, redis_url: str, key_prefix: str = "automaatte:ratelimit:"):
+        if aioredis is None:
+            raise RuntimeError("redis package is not installed")
+        
+        super().__init__()
+        self.redis_url = redis_url
+        self.key_prefix = key_prefix
+        self.client = aioredis.from_url(redis_url)
+        self.script = self.client.register_script(SLIDING_WINDOW_SCRIPT)
+        self.errors = 0
+    
+    async def acquire(self, user_id: str, user_tier: str = "free") -> Tuple[bool, float]:
+        """Count a request if it fits; returns (allowed, retry_after_seconds)"""
+        current_time = time.time()
+        keys, args = [], [current_time]
+        
+        for name, limit in self.get_limits(user_tier).items():
+            window = LIMIT_WINDOWS[name]
+            index = int(current_time // window)
+            # Hash tag keeps one user's keys in the same cluster slot
+            base = f"{self.key_prefix}{{{user_id}}}:{name}"
+            keys += [f"{base}:{index}", f"{base}:{index - 1}"]
+            args += [window, limit]
+        
+        try:
+            allowed, retry_after = await self.script(keys=keys, args=args)
+        except Exception as e:
+            # Fail open: an unavailable limiter should not take the API down with it
+            self.errors += 1
+            logger.error(f"Redis rate limit check failed: {e}")
+            return True, 0.0
+        
+        if not int(allowed):
+            logger.warning(f"Rate limit exceeded for user {user_id}")
+            return False, max(float(retry_after), 1.0)
+        return True, 0.0
+    
+    async def close(self) -> None:
+        """Close the Redis connection pool"""
+        await self.client.close()
+    
+    def get_stats(self) -> Dict:
+        """Get limiter statistics"""
+        return {
+            "backend": "redis",
+            "errors": self.errors,
+            "tier_limits": self.tier_limits
+        }
+
+def create_rate_limiter() -> RateLimiter:
+    """Create the configured rate limiter backend"""
+    backend = os.getenv("RATE_LIMIT_BACKEND", "memory").lower()
+    redis_url = os.getenv("REDIS_URL")
+    
+    if backend == "redis" or (backend == "auto" and redis_url):
+        if aioredis is None:
+            logger.warning("⚠️ redis package not installed, falling back to in-memory rate limiter")
+        else:
+            logger.info("Using Redis rate limiter")
+            return RedisRateLimiter(redis_url or "redis://localhost:6379/0")
+    
+    return RateLimiter()
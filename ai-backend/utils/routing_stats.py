@@ -0,0 +1,84 @@
+"""
+Model routing statistics utilities
+"""
+
+import os
+from typing import Dict, Any
+
+try:
+    from utils.monitoring import LatencyHistogram
+except ImportError:
+    # Fallback imports for development
+    import sys
+    sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+    from utils.monitoring import LatencyHistogram
+
+class ModelStats:
+    """EWMA latency, EWMA error rate and in-flight count for one provider:model"""
+    
+    __slots__ = ("latency", "error_rate", "in_flight", "calls", "latencies")
+    
+    def __init__(self, latency_prior: float):
+        self.latency = latency_prior
+        self.error_rate = 0.0
+        self.in_flight = 0
+        self.calls = 0
+        self.latencies = LatencyHistogram()
+    
+    def start(self) -> None:
+        self.in_flight += 1
+    
+    def finish(self, seconds: float, success: bool, alpha: float) -> None:
+        self.in_flight -= 1
+        self.calls += 1
+        self.error_rate += alpha * ((0.0 if success else 1.0) - self.error_rate)
+        # Failures are often fast rejections or slow timeouts; neither says how long an answer takes
+        if success:
+            self.latency += alpha * (seconds - self.latency)
+            self.latencies.observe(seconds)
+    
+    def cancel(self) -> None:
+        """Drop an abandoned call without counting it as an outcome"""
+        self.in_flight -= 1
+    
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "latency": round(self.latency, 3),
+            "error_rate": round(self.error_rate, 3),
+            "in_flight": self.in_flight,
+            "calls": self.calls,
+            "p95": round(self.latencies.percentile(0.95), 3)
+        }
+
+class RoutingStats:
+    """Live per-model performance used for adaptive routing"""
+    
+    def __init__(self):
+        self.alpha = float(os.getenv("ROUTING_EWMA_ALPHA", 0.2))
+        # Starting latency estimates until real calls have been observed
+        self.latency_priors = {"ollama": 10.0, "huggingface": 3.0, "local": 1.0, "default": 5.0}
+        self.models: Dict[str, ModelStats] = {}
+    
+    def get(self, provider: str, model: str) -> ModelStats:
+        key = f"{provider}:{model}"
+        stats = self.models.get(key)
+        if stats is None:
+            prior = self.latency_priors.get(provider, self.latency_priors["default"])
+            stats = self.models[key] = ModelStats(prior)
+        return stats
+    
+    def start(self, provider: str, model: str) -> None:
+        """Mark a call as in flight"""
+        self.get(provider, model).start()
+    
+    def finish(self, provider: str, model: str, seconds: float, success: bool) -> None:
+        """Record a finished call"""
+        self.get(provider, model).finish(seconds, success, self.alpha)
+    
+    def cancel(self, provider: str, model: str) -> None:
+        """Record a call abandoned before it finished"""
+        self.get(provider, model).cancel()
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """Get per-model routing statistics"""
+        return {key: stats.to_dict() for key, stats in self.models.items()}
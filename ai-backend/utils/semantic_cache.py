@@ -0,0 +1,230 @@
+"""
+Semantic caching utilities
+"""
+
+import os
+import re
+import json
+import time
+import asyncio
+import hashlib
+import logging
+import secrets
+from collections import OrderedDict
+from contextvars import ContextVar
+from typing import Dict, Any, List, Optional, Tuple
+
+try:
+    import numpy as np
+    import faiss
+    from sentence_transformers import SentenceTransformer
+except ImportError:
+    faiss = None
+
+logger = logging.getLogger(__name__)
+
+# (service namespace, normalized request text) of the request being processed, if any
+current_semantic_request: ContextVar[Optional[Tuple[str, str]]] = ContextVar("current_semantic_request", default=None)
+
+def set_semantic_request(service_type: str, input_data: str, options: Optional[Dict[str, Any]] = None) -> None:
+    """Mark the user request that model calls in this context are answering"""
+    namespace = service_type.strip().lower()
+    if options:
+        # Requests with different options never share answers
+        payload = json.dumps(options, sort_keys=True, separators=(",", ":"), default=str)
+        namespace += ":" + hashlib.blake2b(payload.encode("utf-8"), digest_size=6).hexdigest()
+    text = re.sub(r"\s+", " ", (input_data or "").lower()).strip()
+    current_semantic_request.set((namespace, text))
+
+class SemanticCache:
+    """Embedding-similarity cache of model results, one bounded FAISS index per namespace"""
+    
+    def __init__(self):
+        # Off by default until SEMANTIC_CACHE_THRESHOLD has been tuned against the false-hit metrics
+        requested = os.getenv("SEMANTIC_CACHE_ENABLED", "false").lower() == "true"
+        self.enabled = requested and faiss is not None
+        self.model_name = os.getenv("SEMANTIC_CACHE_MODEL", "sentence-transformers/all-MiniLM-L6-v2")
+        self.threshold = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", 0.92))
+        self.max_entries = int(os.getenv("SEMANTIC_CACHE_MAX_ENTRIES", 5000))
+        self.ttl = float(os.getenv("SEMANTIC_CACHE_TTL", 3600))
+        self.search_k = int(os.getenv("SEMANTIC_CACHE_SEARCH_K", 4))
+        
+        self.model = None
+        self.load_task: Optional[asyncio.Task] = None
+        self.indexes: Dict[str, Any] = {}
+        # namespace -> entry_id -> entry, oldest first
+        self.entries: Dict[str, "OrderedDict[int, Dict[str, Any]]"] = {}
+        self.entry_namespaces: Dict[int, str] = {}
+        # One-time token per served hit -> entry id; only the caller who got the hit can report it
+        self.feedback_tokens: "OrderedDict[str, int]" = OrderedDict()
+        self.max_feedback_tokens = int(os.getenv("SEMANTIC_CACHE_FEEDBACK_TOKENS", 10000))
+        self._next_id = 0
+        
+        self.lookups = 0
+        self.hits = 0
+        self.near_misses = 0  # best match within 0.05 below the threshold
+        self.false_hits = 0
+        self.evictions = 0
+        self.hit_similarities: List[float] = []
+        self.false_hit_similarities: List[float] = []
+        
+        if requested and faiss is None:
+            logger.warning("⚠️ sentence-transformers/faiss not installed, semantic cache disabled")
+    
+    def start(self) -> None:
+        """Load the embedding model in the background; lookups are skipped until it is ready"""
+        if self.enabled and self.load_task is None:
+            self.load_task = asyncio.create_task(self._load_model())
+    
+    async def _load_model(self) -> None:
+        try:
+            self.model = await asyncio.to_thread(SentenceTransformer, self.model_name, device="cpu")
+            logger.info(f"✅ Semantic cache ready with {self.model_name}")
+        except Exception as e:
+            self.enabled = False
+            logger.error(f"Semantic cache disabled, embedding model failed to load: {e}")
+    
+    @property
+    def ready(self) -> bool:
+        return self.enabled and self.model is not None
+    
+    async def embed(self, text: str) -> Any:
+        """Embed text on CPU as a unit-length float32 row vector"""
+        vector = await asyncio.to_thread(
+            self.model.encode, [text], normalize_embeddings=True, convert_to_numpy=True
+        )
+        return vector.astype("float32")
+    
+    async def lookup(self, namespace: str, text: str) -> Tuple[Optional[Dict[str, Any]], Any]:
+        """Find a cached result for similar text; returns (hit, vector), hit holding entry_id, value and similarity"""
+        vector = await self.embed(text)
+        self.lookups += 1
+        
+        index = self.indexes.get(namespace)
+        if index is None or index.ntotal == 0:
+            return None, vector
+        
+        # Look past the nearest few so an expired best match does not hide a fresh one behind it
+        similarities, ids = index.search(vector, min(self.search_k, index.ntotal))
+        now = time.time()
+        expired = []
+        best = None
+        for similarity, entry_id in zip(similarities[0], ids[0]):
+            entry = self.entries[namespace].get(int(entry_id))
+            if entry is None:
+                continue
+            if now - entry["created_at"] > self.ttl:
+                expired.append(int(entry_id))
+                continue
+            best = (float(similarity), int(entry_id), entry)
+            break
+        
+        if expired:
+            self._remove(namespace, expired)
+        if best is None:
+            return None, vector
+        
+        similarity, entry_id, entry = best
+        if similarity < self.threshold:
+            if similarity >= self.threshold - 0.05:
+                self.near_misses += 1
+            return None, vector
+        
+        self.hits += 1
+        self._record(self.hit_similarities, similarity)
+        entry["last_similarity"] = similarity
+        self.entries[namespace].move_to_end(entry_id)
+        return {
+            "entry_id": entry_id,
+            "value": entry["value"],
+            "similarity": similarity,
+            "feedback_token": self.issue_feedback_token(entry_id)
+        }, vector
+    
+    def issue_feedback_token(self, entry_id: int) -> str:
+        """Token that lets the caller served an entry report it as a false hit"""
+        token = secrets.token_urlsafe(16)
+        self.feedback_tokens[token] = entry_id
+        while len(self.feedback_tokens) > self.max_feedback_tokens:
+            self.feedback_tokens.popitem(last=False)
+        return token
+    
+    def store(self, namespace: str, vector: Any, value: Dict[str, Any]) -> int:
+        """Cache a result under an embedding, evicting the least recently used entries past max_entries"""
+        index = self.indexes.get(namespace)
+        if index is None:
+            index = self.indexes[namespace] = faiss.IndexIDMap(faiss.IndexFlatIP(vector.shape[1]))
+            self.entries[namespace] = OrderedDict()
+        
+        self._next_id += 1
+        entry_id = self._next_id
+        index.add_with_ids(vector, np.array([entry_id], dtype="int64"))
+        self.entries[namespace][entry_id] = {"value": value, "created_at": time.time()}
+        self.entry_namespaces[entry_id] = namespace
+        
+        overflow = len(self.entries[namespace]) - self.max_entries
+        if overflow > 0:
+            # Evict in batches; removing from a flat index is linear in its size
+            batch = max(overflow, self.max_entries // 20)
+            self._remove(namespace, list(self.entries[namespace])[:batch])
+            self.evictions += batch
+        
+        return entry_id
+    
+    def report_false_hit(self, entry_id: int, feedback_token: str) -> bool:
+        """Record that a served entry did not answer the request and drop it; the token must come from serving it"""
+        if self.feedback_tokens.get(feedback_token) != entry_id:
+            return False
+        del self.feedback_tokens[feedback_token]
+        
+        namespace = self.entry_namespaces.get(entry_id)
+        if namespace is None:
+            return False
+        
+        self.false_hits += 1
+        similarity = self.entries[namespace][entry_id].get("last_similarity")
+        if similarity is not None:
+            self._record(self.false_hit_similarities, similarity)
+        self._remove(namespace, [entry_id])
+        return True
+    
+    def _remove(self, namespace: str, entry_ids: List[int]) -> None:
+        self.indexes[namespace].remove_ids(np.array(entry_ids, dtype="int64"))
+        for entry_id in entry_ids:
+            self.entries[namespace].pop(entry_id, None)
+            self.entry_namespaces.pop(entry_id, None)
+    
+    @staticmethod
+    def _record(samples: List[float], similarity: float) -> None:
+        samples.append(similarity)
+        if len(samples) > 1000:
+            del samples[:500]
+    
+    async def close(self) -> None:
+        if self.load_task is not None and not self.load_task.done():
+            self.load_task.cancel()
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """Get hit-rate and false-hit statistics for threshold tuning"""
+        def summarize(samples: List[float]) -> Dict[str, float]:
+            if not samples:
+                return {}
+            ordered = sorted(samples)
+            return {"min": ordered[0], "median": ordered[len(ordered) // 2], "max": ordered[-1]}
+        
+        return {
+            "enabled": self.enabled,
+            "ready": self.ready,
+            "model": self.model_name,
+            "threshold": self.threshold,
+            "entries": {namespace: len(entries) for namespace, entries in self.entries.items()},
+            "lookups": self.lookups,
+            "hits": self.hits,
+            "hit_rate": (self.hits / self.lookups) if self.lookups else 0.0,
+            "near_misses": self.near_misses,
+            "false_hits": self.false_hits,
+            "false_hit_rate": (self.false_hits / self.hits) if self.hits else 0.0,
+            "evictions": self.evictions,
+            "hit_similarity": summarize(self.hit_similarities),
+            "false_hit_similarity": summarize(self.false_hit_similarities)
+        }
@@ -0,0 +1,48 @@
+"""
+Request coalescing utilities
+"""
+
+import asyncio
+import logging
+from typing import Dict, Any, Awaitable, Callable, Tuple
+
+logger = logging.getLogger(__name__)
+
+class SingleFlight:
+    """Collapse concurrent calls with the same key into one shared execution"""
+
+    def __init__(self):
+        self.inflight: Dict[str, asyncio.Future] = {}
+        self.executions = 0
+        self.coalesced = 0
+
+    async def do(self, key: str, func: Callable[[], Awaitable[Any]]) -> Tuple[Any, bool]:
+        """Run func once per key; returns (result, shared) where shared is True for waiters"""
+        existing = self.inflight.get(key)
+        if existing is not None:
+            self.coalesced += 1
+            logger.info(f"Coalescing request onto in-flight call: {key[:50]}...")
+            # Shield so a disconnecting waiter does not cancel the shared call
+            return await asyncio.shield(existing), True
+
+        task = asyncio.ensure_future(func())
+        self.inflight[key] = task
+        self.executions += 1
+        task.add_done_callback(lambda done: self._forget(key, done))
+
+        return await asyncio.shield(task), False
+
+    def _forget(self, key: str, task: asyncio.Future) -> None:
+        """Drop a finished call so later requests start fresh"""
+        if self.inflight.get(key) is task:
+            del self.inflight[key]
+        if not task.cancelled() and task.exception() is not None:
+            logger.debug(f"Shared call failed for {key[:50]}...: {task.exception()}")
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get coalescing statistics"""
+        return {
+            "in_flight": len(self.inflight),
+            "executions": self.executions,
+            "coalesced_waits": self.coalesced
+        }
@@ -0,0 +1,99 @@
+"""
+Background task queue utilities
+"""
+
+import os
+import asyncio
+import logging
+from typing import Dict, Any, Awaitable, Callable, List, Optional, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+class BackgroundTaskQueue:
+    """Bounded queue of post-response writes drained by a fixed pool of workers"""
+    
+    def __init__(self, max_size: Optional[int] = None, workers: Optional[int] = None):
+        self.max_size = max_size or int(os.getenv("BACKGROUND_QUEUE_SIZE", 1000))
+        self.worker_count = workers or int(os.getenv("BACKGROUND_WORKERS", 2))
+        self.drain_timeout = float(os.getenv("BACKGROUND_DRAIN_TIMEOUT", 10))
+        # Writes run outside the queue when it is full, up to this many at once; beyond that they are dropped
+        self.max_overflow = int(os.getenv("BACKGROUND_MAX_OVERFLOW", 100))
+        
+        self.queue: "asyncio.Queue[Tuple[Callable[..., Awaitable[Any]], tuple]]" = asyncio.Queue(self.max_size)
+        self.workers: List[asyncio.Task] = []
+        self.overflow_tasks: Set[asyncio.Task] = set()
+        
+        self.submitted = 0
+        self.completed = 0
+        self.failed = 0
+        self.overflowed = 0
+        self.dropped = 0
+    
+    async def start(self) -> None:
+        """Start the worker pool"""
+        if not self.workers:
+            self.workers = [
+                asyncio.create_task(self._worker(i), name=f"background-writer-{i}")
+                for i in range(self.worker_count)
+            ]
+            logger.info(f"Background task queue started with {self.worker_count} workers")
+    
+    def submit(self, func: Callable[..., Awaitable[Any]], *args) -> None:
+        """Queue a coroutine function call without waiting for it"""
+        self.submitted += 1
+        try:
+            self.queue.put_nowait((func, args))
+        except asyncio.QueueFull:
+            # Queued work is usage logging and cache writes, which are safe to lose under sustained overload
+            if len(self.overflow_tasks) >= self.max_overflow:
+                self.dropped += 1
+                logger.debug(f"Background queue full, dropping {getattr(func, '__name__', func)}")
+                return
+            self.overflowed += 1
+            task = asyncio.ensure_future(self._run(func, args))
+            self.overflow_tasks.add(task)
+            task.add_done_callback(self.overflow_tasks.discard)
+    
+    async def _worker(self, index: int) -> None:
+        while True:
+            func, args = await self.queue.get()
+            try:
+                await self._run(func, args)
+            finally:
+                self.queue.task_done()
+    
+    async def _run(self, func: Callable[..., Awaitable[Any]], args: tuple) -> None:
+        try:
+            await func(*args)
+            self.completed += 1
+        except Exception as e:
+            self.failed += 1
+            logger.error(f"Background task {getattr(func, '__name__', func)} failed: {e}")
+    
+    async def close(self) -> None:
+        """Drain queued writes, then stop the workers"""
+        try:
+            await asyncio.wait_for(self.queue.join(), self.drain_timeout)
+            if self.overflow_tasks:
+                await asyncio.wait(set(self.overflow_tasks), timeout=self.drain_timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f"Dropping {self.queue.qsize()} background tasks still queued at shutdown")
+        
+        for worker in self.workers:
+            worker.cancel()
+        await asyncio.gather(*self.workers, return_exceptions=True)
+        self.workers = []
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """Get queue statistics"""
+        return {
+            "queued": self.queue.qsize(),
+            "max_size": self.max_size,
+            "workers": len(self.workers),
+            "submitted": self.submitted,
+            "completed": self.completed,
+            "failed": self.failed,
+            "overflowed": self.overflowed,
+            "overflow_running": len(self.overflow_tasks),
+            "dropped": self.dropped
+        }